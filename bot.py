@@ -2,6 +2,7 @@ __version__ = "11.0.0b1"
 __author__ = "Varun J"
 
 import aiohttp
+import asyncio
 import datetime
 import os
 import random
@@ -14,9 +15,11 @@ import sys
 from collections import Counter, deque, defaultdict
 from cogs.utils.config import Config
 from cogs.utils import context, time, db
+from cogs.utils.ipc import IPC
 from cogs.utils.api import pokeapi
 import logging
 import traceback
+from time import perf_counter
 import pyowm
 import tweepy
 from mystbin import Client as MystbinClient
@@ -91,34 +94,214 @@ class GuildPrefixes(db.Table, table_name='guild_prefixes'):
     name = db.Column(db.String)
 
 
-def _prefix_callable(bot, msg):
-    user_id = bot.user.id
-    base = [f'<@!{user_id}> ', f'<@{user_id}> ']
+class PrefixMatcher:
+    """An immutable, precompiled set of prefixes.
+
+    Prefixes are bucketed by their first character, so matching a message
+    is a single dict lookup followed by (usually) one ``startswith`` call
+    instead of trying every prefix in turn.
+    """
+
+    __slots__ = ('prefixes', '_buckets', '_empty')
+
+    def __init__(self, prefixes):
+        self.prefixes = tuple(prefixes)
+        buckets = {}
+        # longest first, so that e.g. '??' wins over '?'
+        for prefix in sorted(set(self.prefixes), key=len, reverse=True):
+            if prefix:
+                buckets.setdefault(prefix[0], []).append(prefix)
+        self._buckets = {char: tuple(group) for char, group in buckets.items()}
+        self._empty = '' in self.prefixes
+
+    def match(self, content):
+        for prefix in self._buckets.get(content[:1], ()):
+            if content.startswith(prefix):
+                return prefix
+        return '' if self._empty else None
+
+
+class PrefixStore:
+    """Custom prefixes for the guilds this process actually owns.
+
+    Rows are loaded in bulk per shard once it's ready, dropped when the
+    guild is removed, and fetched on a miss, with one fetch per guild
+    however many messages are waiting on it. Guilds without a row (or
+    with a NULL one) use the default prefixes.
+    """
+
+    DEFAULT = ('?', '!')
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._prefixes = {}
+        self._matchers = {}
+        self._resolved = set()
+        # guild_id -> Task of the fetch in progress
+        self._fetching = {}
+        self._default = None
+        self._mentions = None
+        self.skipped = 0
+
+    @property
+    def loaded(self):
+        return len(self._prefixes)
+
+    def __contains__(self, guild_id):
+        return guild_id in self._prefixes
+
+    def get(self, guild_id):
+        return list(self._prefixes.get(guild_id, self.DEFAULT))
+
+    def compile(self, prefixes):
+        user_id = self.bot.user.id
+        return PrefixMatcher((f'<@!{user_id}> ', f'<@{user_id}> ', *prefixes))
+
+    def matcher(self, guild_id):
+        """The matcher for a guild, or one for just the mentions if it isn't resolved yet.
+
+        The defaults could be prefixes the guild removed on purpose, so
+        they're not guessed. See :meth:`resolve` to wait for the real one.
+        """
+        try:
+            return self._matchers[guild_id]
+        except KeyError:
+            pass
+
+        if guild_id not in self._resolved:
+            self._start_fetch(guild_id)
+            if self._mentions is None:
+                self._mentions = self.compile(())
+            return self._mentions
+
+        if guild_id in self._prefixes:
+            matcher = self.compile(self._prefixes[guild_id])
+        else:
+            if self._default is None:
+                self._default = self.compile(self.DEFAULT)
+            matcher = self._default
+
+        self._matchers[guild_id] = matcher
+        return matcher
+
+    async def resolve(self, guild_id):
+        """The matcher for a guild, waiting for its prefixes to be fetched if need be."""
+        try:
+            return self._matchers[guild_id]
+        except KeyError:
+            pass
+
+        if guild_id not in self._resolved:
+            try:
+                # shielded, one waiter being cancelled mustn't cancel it for the rest
+                await asyncio.shield(self._start_fetch(guild_id))
+            except Exception:
+                log.exception('Could not fetch the prefixes of guild ID %s.', guild_id)
+        return self.matcher(guild_id)
+
+    def _start_fetch(self, guild_id):
+        task = self._fetching.get(guild_id)
+        if task is None:
+            task = self._fetching[guild_id] = self.bot.loop.create_task(self.fetch(guild_id))
+            # nobody might be waiting on it, don't let a failure go unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    def set(self, guild_id, prefixes):
+        self._prefixes[guild_id] = prefixes
+        self._matchers[guild_id] = self.compile(prefixes)
+        self._resolved.add(guild_id)
+
+    def update(self, guild_id, prefixes):
+        """Like :meth:`set`, but only for guilds that are already loaded."""
+        if guild_id in self._resolved:
+            self.set(guild_id, prefixes)
+
+    def discard(self, guild_id):
+        self._prefixes.pop(guild_id, None)
+        self._matchers.pop(guild_id, None)
+        self._resolved.discard(guild_id)
+
+    def _resolve(self, records, guild_ids):
+        for record in records:
+            if record['prefixes'] is not None:
+                self._prefixes[record['id']] = record['prefixes']
+        for guild_id in guild_ids:
+            self._matchers.pop(guild_id, None)
+        self._resolved.update(guild_ids)
+
+    async def fetch(self, guild_id):
+        """Fetches a single guild's prefixes, returning ``None`` if it has none set."""
+        query = "SELECT id, prefixes FROM guild_prefixes WHERE id = $1;"
+        try:
+            record = await self.bot.pool.fetchrow(query, guild_id)
+        finally:
+            self._fetching.pop(guild_id, None)
+
+        # a set() that raced us is newer than what we just read
+        if guild_id not in self._resolved:
+            self._resolve([record] if record is not None else [], [guild_id])
+        return self._prefixes.get(guild_id)
+
+    async def load_shard(self, shard_id):
+        guild_ids = [guild.id for guild in self.bot.guilds if guild.shard_id == shard_id]
+        async with self.bot.pool.acquire() as con:
+            query = "SELECT id, prefixes FROM guild_prefixes WHERE id = ANY($1::bigint[]);"
+            records = await con.fetch(query, guild_ids)
+            total = await con.fetchval("SELECT COUNT(*) FROM guild_prefixes;")
+
+        self._resolve(records, guild_ids)
+        self.skipped = max(total - self.loaded, 0)
+        log.info('Shard ID %s: loaded %d prefix rows for %d guilds, %d rows loaded in total, %d skipped.',
+                 shard_id, len(records), len(guild_ids), self.loaded, self.skipped)
+
+
+async def _prefix_callable(bot, msg):
     if msg.guild is None:
-        base.append('!')
-        base.append('?')
+        matcher = bot.get_prefix_matcher(None)
     else:
-        base.extend(bot.prefixes.get(msg.guild.id, ['?', '!']))
-    return base
+        # only waits for guilds whose prefixes haven't been resolved yet
+        matcher = await bot.prefixes.resolve(msg.guild.id)
+    prefix = matcher.match(msg.content)
+    if prefix is None:
+        # hand back a single prefix we know doesn't match, so discord.py
+        # bails out without copying and re-scanning the whole list
+        return matcher.prefixes[0]
+    return prefix
 
 
 class RoboVJ(commands.AutoShardedBot):
-    def __init__(self):
+    def __init__(self, *, cluster_id=None, ipc_path=None, **kwargs):
         allowed_mentions = discord.AllowedMentions.all()
         allowed_mentions.replied_user = False
         super().__init__(command_prefix=_prefix_callable, status=discord.Status.online, activity=discord.Activity(
             name=f"you | mention for help", type=discord.ActivityType.watching), owner_id=411166117084528640,
                          help_command=commands.DefaultHelpCommand(width=150, no_category='General', dm_help=None),
-                         case_insensitive=True, intents=discord.Intents.all(), allowed_mentions=allowed_mentions)
+                         case_insensitive=True, intents=discord.Intents.all(), allowed_mentions=allowed_mentions,
+                         **kwargs)
 
         self.version = __version__
+        # when clustered, each process runs a slice of the shards, see launcher.py
+        self.cluster_id = cluster_id or 0
+        self.ipc = IPC(self.cluster_id, ipc_path)
+        self.ipc.add_handler('guild_count', self._ipc_guild_count)
+        self.ipc.add_handler('config_update', self._ipc_config_update)
+        self.ipc.add_handler('prefixes', self._ipc_prefixes)
         self.client_id = config.client_id
         self.bots_key = config.bots_key
-        self.prefixes = {}
-        self.blocklist = Config('blocklist.json')
+        self.prefixes = PrefixStore(self)
+        # start-up report, see setup_hook and add_warmup_task
+        self.startup_time = None
+        self.extension_timings = {}
+        self.failed_extensions = set()
+        self.warmup_timings = {}
+        self.warmup_tasks = {}
+        self._dm_matcher = None
+        # these are hit on every message and spam waves write to them in bursts
+        self.blocklist = Config('blocklist.json', int_keys=True, save_delay=2.0)
         self.spam_control = commands.CooldownMapping.from_cooldown(10, 12.0, commands.BucketType.user)
         self._auto_spam_count = Counter()
-        self.guild_allowlist = Config('guild_allowlist.json')
+        self.guild_allowlist = Config('guild_allowlist.json', int_keys=True, save_delay=2.0)
 
         self.session = aiohttp.ClientSession()
 
@@ -187,23 +370,56 @@ class RoboVJ(commands.AutoShardedBot):
             print("Ignoring exception in command {}:".format(ctx.command), file=sys.stderr)
             traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
 
+    @property
+    def is_primary_cluster(self):
+        """Whether this process should run the once-per-bot work, e.g. timers."""
+        return self.cluster_id == 0
+
+    def owns_guild(self, guild_id):
+        """Whether the guild belongs to one of this cluster's shards."""
+        if self.shard_ids is None:
+            return True
+        return (guild_id >> 22) % self.shard_count in self.shard_ids
+
+    async def _ipc_guild_count(self, data):
+        return len(self.guilds)
+
+    async def _ipc_config_update(self, data):
+        # the cluster that made the change is the one writing it to disk
+        if data['name'] not in ('blocklist', 'guild_allowlist'):
+            return
+        config = getattr(self, data['name'])
+        if data['value'] is None:
+            config.cache_remove(data['key'])
+        else:
+            config.cache_put(data['key'], data['value'])
+
+    async def _ipc_prefixes(self, data):
+        self.prefixes.update(data['guild_id'], data['prefixes'])
+
     async def add_to_blocklist(self, object_id):
         await self.blocklist.put(object_id, True)
+        await self.ipc.broadcast('config_update', {'name': 'blocklist', 'key': object_id, 'value': True})
 
     async def remove_from_blocklist(self, object_id):
         try:
             await self.blocklist.remove(object_id)
         except KeyError:
             pass
+        else:
+            await self.ipc.broadcast('config_update', {'name': 'blocklist', 'key': object_id, 'value': None})
 
     async def add_to_guild_allowlist(self, guild_id):
         await self.guild_allowlist.put(guild_id, True)
+        await self.ipc.broadcast('config_update', {'name': 'guild_allowlist', 'key': guild_id, 'value': True})
 
     async def remove_from_guild_allowlist(self, guild_id):
         try:
             await self.guild_allowlist.remove(guild_id)
         except KeyError:
             pass
+        else:
+            await self.ipc.broadcast('config_update', {'name': 'guild_allowlist', 'key': guild_id, 'value': None})
 
     async def query_member_named(self, guild, argument, *, cache=False):
         """Queries a member by their name, name + discrim, or nickname.
@@ -339,24 +555,30 @@ class RoboVJ(commands.AutoShardedBot):
         embed.timestamp = discord.utils.utcnow()
         return wh.send(embed=embed)
 
-    def get_guild_prefixes(self, guild, *, local_inject=_prefix_callable):
-        proxy_msg = discord.Object(id=0)
-        proxy_msg.guild = guild
-        return local_inject(self, proxy_msg)
+    def get_prefix_matcher(self, guild):
+        if guild is None:
+            if self._dm_matcher is None:
+                self._dm_matcher = self.prefixes.compile(['!', '?'])
+            return self._dm_matcher
+        return self.prefixes.matcher(guild.id)
+
+    def get_guild_prefixes(self, guild):
+        return list(self.get_prefix_matcher(guild).prefixes)
 
     def get_raw_guild_prefixes(self, guild_id):
-        return self.prefixes.get(guild_id, ['?', '!'])
+        return self.prefixes.get(guild_id)
 
     async def set_guild_prefixes(self, guild, prefixes):
         if len(prefixes) == 0:
-            self.prefixes[guild.id] = []
-            await self.pool.execute("UPDATE guild_prefixes SET prefixes = $1 WHERE id = $2", [], guild.id)
+            prefixes = []
         elif len(prefixes) > 10:
             raise RuntimeError('Cannot have more than 10 custom prefixes.')
         else:
-            self.prefixes[guild.id] = sorted(set(prefixes), reverse=True)
-            await self.pool.execute("UPDATE guild_prefixes SET prefixes = $1 WHERE id = $2",
-                                    sorted(set(prefixes), reverse=True), guild.id)
+            prefixes = sorted(set(prefixes), reverse=True)
+
+        await self.pool.execute("UPDATE guild_prefixes SET prefixes = $1 WHERE id = $2", prefixes, guild.id)
+        self.prefixes.set(guild.id, prefixes)
+        await self.ipc.broadcast('prefixes', {'guild_id': guild.id, 'prefixes': prefixes})
 
     async def on_ready(self):
         if not hasattr(self, 'owner') or self.owner is None:
@@ -366,6 +588,9 @@ class RoboVJ(commands.AutoShardedBot):
 
         print(f'Ready: {self.user} (ID: {self.user.id})')
 
+    async def on_shard_ready(self, shard_id):
+        await self.prefixes.load_shard(shard_id)
+
     async def on_shard_resumed(self, shard_id):
         print(f'Shard ID {shard_id} has resumed...')
         self.resumes[shard_id].append(discord.utils.utcnow())
@@ -388,7 +613,7 @@ class RoboVJ(commands.AutoShardedBot):
         async with self.pool.acquire() as con:
             await con.execute("INSERT INTO guild_prefixes (id, name) VALUES ($1, $2) ON CONFLICT (id) DO NOTHING;",
                               guild.id, guild.name)
-        if guild.id not in self.prefixes.keys():
+        if await self.prefixes.fetch(guild.id) is None:
             await self.set_guild_prefixes(guild, ['!', '?'])
 
         pfx = self.get_raw_guild_prefixes(guild.id)[0]
@@ -404,8 +629,13 @@ class RoboVJ(commands.AutoShardedBot):
         if before.name != after.name:
             await self.pool.execute("UPDATE guild_prefixes SET name = $1 WHERE id = $2", after.name, after.id)
 
-    async def process_commands(self, message):
-        ctx = await self.get_context(message, cls=context.Context)
+    async def on_guild_remove(self, guild):
+        self.prefixes.discard(guild.id)
+
+    async def process_commands(self, message, *, ctx=None):
+        # on_message already parsed the context, no need to do it twice
+        if ctx is None:
+            ctx = await self.get_context(message, cls=context.Context)
 
         if ctx.command is None:
             return
@@ -444,7 +674,7 @@ class RoboVJ(commands.AutoShardedBot):
         if message.author.bot:
             return
         if message.content.strip() in [f'<@!{self.user.id}>', f'<@{self.user.id}>']:
-            prefixes = _prefix_callable(self, message)
+            prefixes = self.get_guild_prefixes(message.guild)
             # we want to remove prefix #2, because it's the 2nd form of the mention
             # and to the end user, this would end up making them confused why the
             # mention is there twice
@@ -454,28 +684,104 @@ class RoboVJ(commands.AutoShardedBot):
             e.set_footer(text=f'{len(prefixes)} prefixes  |  use <any-prefix>help for a list of commands.')
             e.description = '\n'.join(f'{index}. {elem}' for index, elem in enumerate(prefixes, 1))
             await message.channel.send(embed=e)
-        await self.process_commands(message)
+        await self.process_commands(message, ctx=ctx)
+
+    @tasks.loop(hours=6.0)
+    async def partition_maintenance(self):
+        # creates the upcoming partitions of the loaded tables and drops the expired ones,
+        # tables that aren't partitioned yet are left to `launcher.py db maintain --convert`
+        for table in db.Table.all_tables():
+            if table.__partition__ is None:
+                continue
+            try:
+                result = await table.maintain()
+            except Exception:
+                log.exception('Could not maintain the partitions of %s.', table.__tablename__)
+                continue
+            if result and (result['created'] or result['dropped'] or result['deleted']):
+                log.info('Maintained %s: created %s, dropped %s, deleted %s rows.', table.__tablename__,
+                         result['created'], result['dropped'], result['deleted'])
 
     async def close(self):
+        self.partition_maintenance.cancel()
         await super().close()
         await self.session.close()
+        await self.blocklist.flush()
+        await self.guild_allowlist.flush()
+        await self.ipc.close()
+
+    async def _timed_load_extension(self, extension):
+        start = perf_counter()
+        try:
+            await self.load_extension(extension)
+        except Exception:
+            self.failed_extensions.add(extension)
+            print(f'Failed to load extension {extension}.', file=sys.stderr)
+            traceback.print_exc()
+        finally:
+            self.extension_timings[extension] = perf_counter() - start
+
+    def add_warmup_task(self, name, coro):
+        """Runs slow start-up work in the background instead of blocking the extension load.
+
+        The time taken is recorded in the start-up report. Failures are logged
+        rather than raised, so awaiting the returned task never errors.
+        """
+
+        async def runner():
+            start = perf_counter()
+            try:
+                await coro
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception('Warm-up task %r failed.', name)
+            finally:
+                self.warmup_timings[name] = perf_counter() - start
+                self.warmup_tasks.pop(name, None)
+
+        task = self.loop.create_task(runner(), name=f'Warm-up: {name}')
+        self.warmup_tasks[name] = task
+        return task
+
+    def startup_report(self, *, limit=10):
+        lines = [f'Loaded {len(self.extension_timings) - len(self.failed_extensions)}/{len(self.extension_timings)} '
+                 f'extensions in {self.startup_time or 0:.2f}s '
+                 f'({sum(self.extension_timings.values()):.2f}s if loaded one by one).']
+        slowest = sorted(self.extension_timings.items(), key=lambda t: t[1], reverse=True)[:limit]
+        for name, elapsed in slowest:
+            failed = ' (failed)' if name in self.failed_extensions else ''
+            lines.append(f'  {name}: {elapsed * 1000:.0f}ms{failed}')
+        if self.warmup_timings or self.warmup_tasks:
+            lines.append(f'Warm-up tasks: {len(self.warmup_timings)} finished, {len(self.warmup_tasks)} pending.')
+            lines.extend(f'  {name}: {elapsed * 1000:.0f}ms' for name, elapsed in self.warmup_timings.items())
+        return '\n'.join(lines)
 
     async def setup_hook(self):
         # await bot.init_db()
         # await self.wait_until_ready()
-        for extension in initial_extensions:
-            try:
-                await self.load_extension(extension)
-            except Exception as e:
-                print(f'Failed to load extension {extension}.', file=sys.stderr)
-                traceback.print_exc()
+        await self.ipc.connect()
+        start = perf_counter()
+        if getattr(config, 'sequential_startup', False):
+            for extension in initial_extensions:
+                await self._timed_load_extension(extension)
+        else:
+            # the extensions don't depend on each other, so their async setup can overlap
+            await asyncio.gather(*(self._timed_load_extension(extension) for extension in initial_extensions))
+        self.startup_time = perf_counter() - start
+        log.info(self.startup_report())
+
+        # the pool connected before the extensions registered their queries,
+        # reconnecting on next use gets them prepared by the init hook
+        await self.pool.expire_connections()
+
+        if self.is_primary_cluster:
+            self.partition_maintenance.start()
+
         try:
             await self.load_extension('assets.kannan')  # random inside joke stuff
         except commands.ExtensionNotFound:
             pass
-        records = await self.pool.fetch("SELECT id, prefixes FROM guild_prefixes;")
-        for record in records:
-            self.prefixes[record['id']] = record['prefixes']
 
     async def start(self):
         try:
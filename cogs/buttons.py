@@ -2,6 +2,7 @@ import asyncio
 from discord.ext import commands, menus
 import discord
 from .utils.paginator import RoboPages
+from .utils import cache
 import random
 import logging
 from lru import LRU
@@ -184,9 +185,12 @@ class Buttons(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self._spoiler_cache = LRU(128)
+        self._spoiler_cache = cache.register('Buttons._spoiler_cache', LRU(128))
         self._spoiler_cooldown = SpoilerCooldown()
 
+    async def cog_unload(self):
+        cache.unregister('Buttons._spoiler_cache')
+
     @commands.command(hidden=True)
     async def feelgood(self, ctx):
         """press"""
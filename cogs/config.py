@@ -41,6 +41,12 @@ class Plonks(db.Table):
     # this can either be a channel_id or an author_id
     entity_id = db.Column(db.Integer(big=True), index=True, unique=True)
 
+# checked for every command, so they're prepared up front
+IS_PLONKED = db.Query('config.is_plonked', "SELECT 1 FROM plonks WHERE guild_id=$1 AND entity_id=$2;")
+IS_PLONKED_IN = db.Query('config.is_plonked_in', "SELECT 1 FROM plonks WHERE guild_id=$1 AND entity_id IN ($2, $3);")
+IS_PLONKED_IN_THREAD = db.Query('config.is_plonked_in_thread',
+                                "SELECT 1 FROM plonks WHERE guild_id=$1 AND entity_id IN ($2, $3, $4);")
+
 class CommandConfig(db.Table, table_name='command_config'):
     id = db.PrimaryKeyColumn()
 
@@ -183,18 +189,15 @@ class Config(commands.Cog):
                 if member is not None and member.guild_permissions.manage_guild:
                     return False
 
-        connection = connection or self.bot.db
+        connection = connection or self.bot.pool
 
         if channel is None:
-            query = "SELECT 1 FROM plonks WHERE guild_id=$1 AND entity_id=$2;"
-            row = await connection.fetchrow(query, guild_id, member_id)
+            row = await IS_PLONKED.fetchrow(connection, guild_id, member_id)
         else:
             if isinstance(channel, discord.Thread):
-                query = "SELECT 1 FROM plonks WHERE guild_id=$1 AND entity_id IN ($2, $3, $4);"
-                row = await connection.fetchrow(query, guild_id, member_id, channel.id, channel.parent_id)
+                row = await IS_PLONKED_IN_THREAD.fetchrow(connection, guild_id, member_id, channel.id, channel.parent_id)
             else:
-                query = "SELECT 1 FROM plonks WHERE guild_id=$1 AND entity_id IN ($2, $3);"
-                row = await connection.fetchrow(query, guild_id, member_id, channel.id)
+                row = await IS_PLONKED_IN.fetchrow(connection, guild_id, member_id, channel.id)
 
         return row is not None
 
@@ -252,7 +255,7 @@ class Config(commands.Cog):
                 await ctx.db.copy_records_to_table('plonks', columns=('guild_id', 'entity_id'), records=to_insert)
 
                 # invalidate the cache for this guild
-                self.is_plonked.invalidate_containing(f'{ctx.guild.id!r}:')
+                self.is_plonked.invalidate_prefix(self, ctx.guild.id)
 
     async def cog_command_error(self, ctx, error):
         if isinstance(error, commands.BadArgument):
@@ -280,7 +283,7 @@ class Config(commands.Cog):
             await ctx.db.execute(query, ctx.guild.id, ctx.channel.id)
 
             # invalidate the cache for this guild
-            self.is_plonked.invalidate_containing(f'{ctx.guild.id!r}:')
+            self.is_plonked.invalidate_prefix(self, ctx.guild.id)
         else:
             await self._bulk_ignore_entries(ctx, entities)
 
@@ -331,7 +334,7 @@ class Config(commands.Cog):
 
         query = "DELETE FROM plonks WHERE guild_id=$1;"
         await ctx.db.execute(query, ctx.guild.id)
-        self.is_plonked.invalidate_containing(f'{ctx.guild.id!r}:')
+        self.is_plonked.invalidate_prefix(self, ctx.guild.id)
         await ctx.send('Successfully cleared all ignores.')
 
     @config.group(pass_context=True, invoke_without_command=True, aliases=['unplonk'])
@@ -350,7 +353,7 @@ class Config(commands.Cog):
             entities = [c.id for c in entities]
             await ctx.db.execute(query, ctx.guild.id, entities)
 
-        self.is_plonked.invalidate_containing(f'{ctx.guild.id!r}:')
+        self.is_plonked.invalidate_prefix(self, ctx.guild.id)
         await ctx.send(ctx.tick(True))
 
     @unignore.command(name='all')
@@ -26,11 +26,13 @@ class DBL(commands.Cog):
         await self.dbl_client.close()
 
     async def update(self):
-        guild_count = len(self.bot.guilds)
+        # each cluster only sees its own guilds
+        counts = await self.bot.ipc.request('guild_count')
+        guild_count = sum(count for count in counts if count is not None)
 
         payload = json.dumps({
             'guildCount': guild_count,
-            'shardCount': len(self.bot.shards)
+            'shardCount': self.bot.shard_count or len(self.bot.shards)
         })
 
         headers = {
@@ -48,7 +50,7 @@ class DBL(commands.Cog):
         }
         payload = json.dumps({
             'server_count': guild_count,
-            'shard_count': len(self.bot.shards)
+            'shard_count': self.bot.shard_count or len(self.bot.shards)
         })
         url = f'{TOP_GG_API}/bots/{self.bot.user.id}/stats'
         async with self.bot.session.post(url, data=payload, headers=headers) as resp:
@@ -1,5 +1,6 @@
 import asyncio
 import functools
+import json
 import logging
 import re
 import textwrap
@@ -20,7 +21,7 @@ from urllib3.exceptions import ProtocolError
 from .utils.docs import RedirectOutput, ValidPythonIdentifier, ValidURL, wait_for_deletion
 from .utils.cache import AsyncCache
 from .utils.doc_paginator import LinePaginator
-from .utils import checks, db
+from .utils import cache, checks, db
 
 log = logging.getLogger(__name__)
 logging.getLogger('urllib3').setLevel(logging.WARNING)
@@ -70,7 +71,16 @@ WHITESPACE_AFTER_NEWLINES_RE = re.compile(r"(?<=\n\n)(\s+)")
 FAILED_REQUEST_RETRY_AMOUNT = 3
 NOT_FOUND_DELETE_DELAY = RedirectOutput.delete_delay
 
-symbol_cache = AsyncCache()
+
+def _embed_size(embed: Optional[discord.Embed]) -> int:
+    """Approximate the memory held by a cached embed by its payload size."""
+    if embed is None:
+        return 0
+    return len(json.dumps(embed.to_dict()))
+
+
+symbol_cache = AsyncCache(max_size=256, max_bytes=1024 * 1024, sizeof=_embed_size)
+cache.register('Doc.symbol_cache', symbol_cache, sizeof=lambda: symbol_cache.total_bytes)
 
 
 class DocMarkdownConverter(MarkdownConverter):
@@ -130,6 +140,7 @@ class Doc(commands.Cog):
         self.bot = bot
         self.inventories = {}
         self.renamed_symbols = set()
+        self.symbol_cache = symbol_cache
 
         self.bot.loop.create_task(self.init_refresh_inventory())
 
@@ -1,11 +1,10 @@
-from discord.ext import commands, tasks
-from .utils import db, checks
+from discord.ext import commands
+from .utils import buffer, db, checks
 
 from collections import Counter, defaultdict
 
 import discord
 import asyncio
-import asyncpg
 import datetime
 import logging
 import yarl
@@ -125,20 +124,17 @@ class Emoji(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self._batch_of_data = defaultdict(Counter)
-        self._batch_lock = asyncio.Lock(loop=bot.loop)
-        self.bulk_insert.add_exception_type(asyncpg.PostgresConnectionError)
-        self.bulk_insert.start()
+        # (guild_id, [emoji_id, ...]) for every message with custom emoji
+        self._batch_of_data = buffer.WriteBuffer('emoji_stats', self.bulk_insert, interval=60.0, max_size=2000).start()
 
     async def cog_unload(self):
-        self.bulk_insert.stop()
+        await self._batch_of_data.close()
 
     async def cog_command_error(self, ctx, error):
         if isinstance(error, commands.BadArgument):
             await ctx.send(error)
 
-    @tasks.loop(seconds=60.0)
-    async def bulk_insert(self):
+    async def bulk_insert(self, rows):
         query = """INSERT INTO emoji_stats (guild_id, emoji_id, total)
                    SELECT x.guild, x.emoji, x.added
                    FROM jsonb_to_recordset($1::jsonb) AS x(guild BIGINT, emoji BIGINT, added INT)
@@ -146,14 +142,16 @@ class Emoji(commands.Cog):
                    SET total = emoji_stats.total + excluded.total;
                    """
 
-        async with self._batch_lock:
-            transformed = [
-                {'guild': guild_id, 'emoji': emoji_id, 'added': count}
-                for guild_id, data in self._batch_of_data.items()
-                for emoji_id, count in data.items()
-            ]
-            self._batch_of_data.clear()
-            await self.bot.pool.execute(query, transformed)
+        batch = defaultdict(Counter)
+        for guild_id, emoji_ids in rows:
+            batch[guild_id].update(emoji_ids)
+
+        transformed = [
+            {'guild': guild_id, 'emoji': emoji_id, 'added': count}
+            for guild_id, data in batch.items()
+            for emoji_id, count in data.items()
+        ]
+        await self.bot.pool.execute(query, transformed)
 
     async def do_redirect(self, message):
         if len(message.attachments) == 0:
@@ -187,8 +185,7 @@ class Emoji(commands.Cog):
         if not matches:
             return
 
-        async with self._batch_lock:
-            self._batch_of_data[message.guild.id].update(map(int, matches))
+        await self._batch_of_data.put((message.guild.id, [int(emoji_id) for emoji_id in matches]))
 
     @commands.Cog.listener()
     async def on_guild_emojis_update(self, guild, before, after):
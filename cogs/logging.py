@@ -1,12 +1,12 @@
-import asyncio
 import datetime
 from contextlib import suppress
 import discord
-from discord.ext import commands, tasks
-from .utils import db
+from discord.ext import commands
+from .utils import buffer, db
 
 
-class MessageLog(db.Table, table_name='message_log'):
+class MessageLog(db.Table, table_name='message_log',
+                 partition=db.Partitioning('message_id', interval='month', key='snowflake')):
     channel_id = db.Column(db.Integer(big=True), primary_key=True)
     message_id = db.Column(db.Integer(big=True), primary_key=True)
     guild_id = db.Column(db.Integer(big=True), index=True)
@@ -28,25 +28,19 @@ class Logging(commands.Cog):
         self.bot = bot
         self._opted_in = set()
         self._log_nsfw = set()
-        self._batch_lock = asyncio.Lock()
-
-        self._logging_task.start()
+        self._message_log = buffer.WriteBuffer('message_log', self._logging_task, interval=60.0, max_size=5000).start()
+        self._opt_in_task = bot.loop.create_task(self._load_opt_ins())
 
     async def cog_unload(self):
-        self._logging_task.stop()
-
-    @tasks.loop(seconds=60.0)
-    async def _logging_task(self):
-        async with self._batch_lock:
-            async with self.bot.pool.acquire(timeout=300.0) as con:
-                if self.bot._message_log:
-                    query = "INSERT INTO message_log VALUES ($1, $2, $3, $4, $5, $6);"
-                    await con.executemany(query, self.bot._message_log)
+        self._opt_in_task.cancel()
+        await self._message_log.close()
 
-            self.bot._message_log.clear()
+    async def _logging_task(self, rows):
+        async with self.bot.pool.acquire(timeout=300.0) as con:
+            # a retried batch may have made it in the first time
+            await MessageLog.copy_records(rows, on_conflict='DO NOTHING', connection=con)
 
-    @_logging_task.before_loop
-    async def _before_logging_task(self):
+    async def _load_opt_ins(self):
         await self.bot.wait_until_ready()
 
         for record in await self.bot.pool.fetch("SELECT * FROM opt_in_status;"):
@@ -116,12 +110,9 @@ class Logging(commands.Cog):
         if message.channel.is_nsfw() and message.author.id not in self._log_nsfw:
             return
 
-        self.bot._message_log.append((message.channel.id, message.id, message.guild.id,
-                                      message.author.id, message.content, message.channel.is_nsfw()))
+        await self._message_log.put((message.channel.id, message.id, message.guild.id,
+                                     message.author.id, message.content, message.channel.is_nsfw()))
 
 
 async def setup(bot):
-    if not hasattr(bot, '_logging'):
-        bot._logging = True
-        bot._message_log = list()
     await bot.add_cog(Logging(bot))
@@ -15,6 +15,8 @@ import discord
 import feedparser
 from discord.ext import commands, tasks
 
+from .utils import cache
+
 MANGADEX_RSS_BASE = 'https://mangadex.org/rss/follows/{}'
 MANGADEX_API_BASE = 'https://mangadex.org/api/'
 MANGADEX_BASE = 'https://mangadex.org'
@@ -163,7 +165,7 @@ class Manga(commands.Cog):
         self.rss_url = MANGADEX_RSS_BASE.format(bot.config.mangadex_key)
         self.rss_webhook = discord.Webhook.from_url(bot.config.mangadex_webhook,
                                                     adapter=discord.AsyncWebhookAdapter(bot.session))
-        self._cache = defaultdict(set)
+        self._cache = cache.register('Manga._cache', defaultdict(set))
         self.rss_parser.start()
 
     @commands.command()
@@ -216,6 +218,7 @@ class Manga(commands.Cog):
 
     async def cog_unload(self):
         self.rss_parser.cancel()
+        cache.unregister('Manga._cache')
 
 
 async def setup(bot: RoboVJ):
@@ -7,6 +7,8 @@ import rusty_markov as markov
 import discord
 from discord.ext import commands
 
+from .utils import cache
+
 MAX_TRIES = 32
 
 
@@ -49,6 +51,10 @@ class Markov(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.model_cache: Dict[Tuple[int, ...], markov.Markov] = markov.LRUDict(max_size=12)  # idk about a good size
+        cache.register('Markov.model_cache', self.model_cache)
+
+    async def cog_unload(self):
+        cache.unregister('Markov.model_cache')
 
     async def get_model(self, query: Tuple[int, ...], *coros: Awaitable[List[asyncpg.Record]], order: int = 2) -> markov.Markov:
         # Return cached model if one exists
@@ -10,10 +10,9 @@ import datetime
 import asyncio
 import argparse, shlex
 import logging
-import asyncpg
 import io
 from datetime import timezone
-from .utils import checks, db, time, cache
+from .utils import buffer, checks, db, time, timers, cache
 from collections import Counter, defaultdict
 from inspect import cleandoc
 
@@ -164,7 +163,7 @@ class SpamChecker:
         self.new_user = commands.CooldownMapping.from_cooldown(30, 35.0, commands.BucketType.channel)
 
         # user_id flag mapping (for about 30 minutes)
-        self.fast_joiners = cache.ExpiringCache(seconds=1800.0)
+        self.fast_joiners = cache.ExpiringCache(seconds=1800.0, max_size=10000)
         self.hit_and_run = commands.CooldownMapping.from_cooldown(10, 12.0, commands.BucketType.channel)
 
     def is_new(self, member):
@@ -244,14 +243,11 @@ class Moderation(commands.Cog):
         # guild_id: SpamChecker
         self._spam_check = defaultdict(SpamChecker)
 
-        # guild_id: List[(member_id, insertion)]
+        # (guild_id, member_id, insertion)
         # A batch of data for bulk inserting mute role changes
         # True - insert, False - remove
-        self._data_batch = defaultdict(list)
-        self._batch_lock = asyncio.Lock(loop=bot.loop)
+        self._data_batch = buffer.WriteBuffer('muted_members', self.bulk_insert, interval=15.0).start()
         self._disable_lock = asyncio.Lock(loop=bot.loop)
-        self.batch_updates.add_exception_type(asyncpg.PostgresConnectionError)
-        self.batch_updates.start()
         self.modlogs = {}
         self.task = self.bot.loop.create_task(self._prepare_modlogs())
 
@@ -265,9 +261,9 @@ class Moderation(commands.Cog):
         return '<cogs.Moderation>'
 
     async def cog_unload(self):
-        self.batch_updates.stop()
         self.bulk_send_messages.stop()
         self.task.cancel()
+        await self._data_batch.close()
 
     async def _prepare_modlogs(self):
         async with self.bot.pool.acquire() as con:
@@ -289,7 +285,7 @@ class Moderation(commands.Cog):
         elif isinstance(error, NoMuteRole):
             await ctx.send(error)
 
-    async def bulk_insert(self):
+    async def bulk_insert(self, rows):
         query = """UPDATE guild_mod_config
                    SET muted_members = x.result_array
                    FROM jsonb_to_recordset($1::jsonb) AS
@@ -297,11 +293,12 @@ class Moderation(commands.Cog):
                    WHERE guild_mod_config.id = x.guild_id;
                 """
 
-        if not self._data_batch:
-            return
+        batch = defaultdict(list)
+        for guild_id, member_id, insertion in rows:
+            batch[guild_id].append((member_id, insertion))
 
         final_data = []
-        for guild_id, data in self._data_batch.items():
+        for guild_id, data in batch.items():
             # If it's touched this function then chances are that this has hit cache before
             # so it's not actually doing a query, hopefully.
             config = await self.get_guild_config(guild_id)
@@ -317,12 +314,6 @@ class Moderation(commands.Cog):
             self.get_guild_config.invalidate(self, guild_id)
 
         await self.bot.pool.execute(query, final_data)
-        self._data_batch.clear()
-
-    @tasks.loop(seconds=15.0)
-    async def batch_updates(self):
-        async with self._batch_lock:
-            await self.bulk_insert()
 
     @tasks.loop(seconds=10.0)
     async def bulk_send_messages(self):
@@ -491,10 +482,9 @@ class Moderation(commands.Cog):
         if before_has == after_has:
             return
 
-        async with self._batch_lock:
-            # If `after_has` is true, then it's an insertion operation
-            # if it's false, then the role for removed
-            self._data_batch[guild_id].append((after.id, after_has))
+        # If `after_has` is true, then it's an insertion operation
+        # if it's false, then the role for removed
+        await self._data_batch.put((guild_id, after.id, after_has))
 
     @commands.Cog.listener()
     async def on_guild_role_delete(self, role):
@@ -680,7 +670,7 @@ class Moderation(commands.Cog):
         return { 'Bot': count }
 
     async def _complex_cleanup_strategy(self, ctx, search):
-        prefixes = tuple(self.bot.get_guild_prefixes(ctx.guild))  # thanks startswith
+        prefixes = self.bot.get_prefix_matcher(ctx.guild).prefixes  # thanks startswith
 
         def check(m):
             return m.author == ctx.me or m.content.startswith(prefixes)
@@ -689,7 +679,7 @@ class Moderation(commands.Cog):
         return Counter(m.author.display_name for m in deleted)
 
     async def _regular_user_cleanup_strategy(self, ctx, search):
-        prefixes = tuple(self.bot.get_guild_prefixes(ctx.guild))
+        prefixes = self.bot.get_prefix_matcher(ctx.guild).prefixes
 
         def check(m):
             return (m.author == ctx.me or m.content.startswith(prefixes)) and not (m.mentions or m.role_mentions)
@@ -1092,7 +1082,7 @@ class Moderation(commands.Cog):
         if modlog_channel:
             await modlog_channel.send(embed=e)
 
-    @commands.Cog.listener()
+    @timers.listener
     async def on_tempban_timer_complete(self, timer):
         guild_id, mod_id, member_id = timer.args
         await self.bot.wait_until_ready()
@@ -1589,7 +1579,7 @@ class Moderation(commands.Cog):
         if modlog_channel:
             await modlog_channel.send(embed=e)
 
-    @commands.Cog.listener()
+    @timers.listener
     async def on_tempmute_timer_complete(self, timer):
         guild_id, mod_id, member_id, role_id = timer.args
         await self.bot.wait_until_ready()
@@ -1604,8 +1594,7 @@ class Moderation(commands.Cog):
         if member is None or not member._roles.has(role_id):
             # They left or don't have the role any more so it has to be manually changed in the SQL
             # if applicable, of course
-            async with self._batch_lock:
-                self._data_batch[guild_id].append((member_id, False))
+            await self._data_batch.put((guild_id, member_id, False))
             return
 
         if mod_id != member_id:
@@ -1629,8 +1618,7 @@ class Moderation(commands.Cog):
             await member.remove_roles(discord.Object(id=role_id), reason=reason)
         except discord.HTTPException:
             # if the request failed then just do it manually
-            async with self._batch_lock:
-                self._data_batch[guild_id].append((member_id, False))
+            await self._data_batch.put((guild_id, member_id, False))
 
     @_mute.group(name='role', invoke_without_command=True)
     @checks.has_guild_permissions(manage_guild=True, manage_roles=True)
@@ -1985,7 +1973,7 @@ class Moderation(commands.Cog):
             if modlog_channel:
                 await modlog_channel.send(embed=e)
             
-    @commands.Cog.listener()
+    @timers.listener
     async def on_tempblock_timer_complete(self, timer):
         guild_id, mod_id, channel_id, member_id = timer.args
 
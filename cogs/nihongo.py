@@ -9,19 +9,25 @@ from dataclasses import dataclass
 from functools import partial
 from io import BytesIO
 from textwrap import fill
-from typing import Any, IO, TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+from typing import Any, TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 from urllib.parse import quote
 
 import aiohttp
-import bs4
 import discord
-import pykakasi
 from discord.ext import commands, menus
-from PIL import Image, ImageDraw, ImageFilter, ImageFont
 from .utils.context import Context
 from .utils.formats import plural, to_codeblock
+from .utils.lazy import lazy_import, load_in_executor
 from .utils.paginator import RoboPages
 
+# only a handful of commands need these, so they're imported on first use
+bs4 = lazy_import('bs4')
+pykakasi = lazy_import('pykakasi')
+Image = lazy_import('PIL.Image')
+ImageDraw = lazy_import('PIL.ImageDraw')
+ImageFilter = lazy_import('PIL.ImageFilter')
+ImageFont = lazy_import('PIL.ImageFont')
+
 if TYPE_CHECKING:
     from bot import RoboVJ
 
@@ -46,24 +52,25 @@ class MemeDict(dict):
         raise KeyError(k)
 
 
-JLPT_N1 = list(csv.reader(open('data/jlpt_decks/n1.csv', 'r', encoding='utf-8')))
-JLPT_N2 = list(csv.reader(open('data/jlpt_decks/n2.csv', 'r', encoding='utf-8')))
-JLPT_N3 = list(csv.reader(open('data/jlpt_decks/n3.csv', 'r', encoding='utf-8')))
-JLPT_N4 = list(csv.reader(open('data/jlpt_decks/n4.csv', 'r', encoding='utf-8')))
-JLPT_N5 = list(csv.reader(open('data/jlpt_decks/n5.csv', 'r', encoding='utf-8')))
+JLPT_LEVELS = ('n1', 'n2', 'n3', 'n4', 'n5')
 JLPT_LOOKUP = MemeDict(
     {
-        ('n1', 'n 1', '1', '1 '): JLPT_N1,
-        ('n2', 'n 2', '2', '2 '): JLPT_N2,
-        ('n3', 'n 3', '3', '3 '): JLPT_N3,
-        ('n4', 'n 4', '4', '4 '): JLPT_N4,
-        ('n5', 'n 5', '5', '5 '): JLPT_N5,
+        ('n1', 'n 1', '1', '1 '): 'n1',
+        ('n2', 'n 2', '2', '2 '): 'n2',
+        ('n3', 'n 3', '3', '3 '): 'n3',
+        ('n4', 'n 4', '4', '4 '): 'n4',
+        ('n5', 'n 5', '5', '5 '): 'n5',
     }
 )
 
 
+def _read_jlpt_deck(level: str) -> List[List[str]]:
+    with open(f'data/jlpt_decks/{level}.csv', 'r', encoding='utf-8') as fp:
+        return list(csv.reader(fp))
+
+
 class JLPTConverter(commands.Converter):
-    async def convert(self, ctx, argument) -> IO:
+    async def convert(self, ctx, argument) -> str:
         try:
             return JLPT_LOOKUP[argument.lower()]
         except KeyError:
@@ -335,11 +342,32 @@ class Nihongo(commands.Cog):
 
     def __init__(self, bot: RoboVJ):
         self.bot = bot
-        self.converter = _create_kaaksi()
+        # built on first use, pykakasi loads its dictionaries on creation
+        self.converter = None
+        self.jlpt_decks: Dict[str, List[List[str]]] = {}
+        self.jlpt_task = bot.add_warmup_task('Nihongo JLPT decks', self.load_jlpt_decks())
+
+    async def cog_unload(self) -> None:
+        self.jlpt_task.cancel()
+
+    async def load_jlpt_decks(self) -> None:
+        for level in JLPT_LEVELS:
+            self.jlpt_decks[level] = await self.bot.loop.run_in_executor(None, _read_jlpt_deck, level)
+
+    async def get_jlpt_deck(self, level: str) -> List[List[str]]:
+        await self.jlpt_task
+        try:
+            return self.jlpt_decks[level]
+        except KeyError:
+            # warm-up failed, so try again on demand
+            deck = self.jlpt_decks[level] = await self.bot.loop.run_in_executor(None, _read_jlpt_deck, level)
+            return deck
 
     @commands.command()
     async def romaji(self, ctx, *, text: commands.clean_content):
         """Sends the Romaji version of the passed Kana."""
+        if self.converter is None:
+            self.converter = await self.bot.loop.run_in_executor(None, _create_kaaksi)
         ret = await self.bot.loop.run_in_executor(None, self.converter.do, text)
         await ctx.send(ret)
 
@@ -506,8 +534,9 @@ class Nihongo(commands.Cog):
             return await ctx.send('Kanarace has no winners!', delete_after=5.0)
 
     @commands.command(usage='[level=n5]')
-    async def jlpt(self, ctx, level: JLPTConverter = JLPT_N5):
-        word, reading, meaning, _ = random.choice(level)
+    async def jlpt(self, ctx, level: JLPTConverter = 'n5'):
+        deck = await self.get_jlpt_deck(level)
+        word, reading, meaning, _ = random.choice(deck)
         embed = discord.Embed(title=word, description=meaning, colour=discord.Colour.random())
         embed.add_field(name='Reading', value=f'『{reading}』')
         await ctx.send(embed=embed)
@@ -561,6 +590,7 @@ class Nihongo(commands.Cog):
 
     @commands.command(name='strokeorder', aliases=['so'])
     async def stroke_order(self, ctx, kanji: str):
+        await load_in_executor(bs4)
         responses = []
         for char in kanji:
             url = quote(f'https://jisho.org/search/{char}#kanji', safe='/:?&')
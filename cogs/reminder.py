@@ -1,11 +1,21 @@
-from .utils import db, time, formats
+from .utils import db, time, formats, timers
 from discord.ext import commands
+from collections import deque
 import discord
 import asyncio
 import asyncpg
+import contextlib
 import datetime
+import heapq
+import itertools
+import json
+import logging
+import os
+import statistics
 import textwrap
 
+log = logging.getLogger(__name__)
+
 class Reminders(db.Table):
     id = db.PrimaryKeyColumn()
 
@@ -38,6 +48,29 @@ class Timer:
         }
         return cls(record=pseudo)
 
+    @classmethod
+    def from_payload(cls, payload):
+        timer = cls.temporary(
+            expires=datetime.datetime.fromisoformat(payload['expires']),
+            created=datetime.datetime.fromisoformat(payload['created']),
+            event=payload['event'],
+            args=payload['args'],
+            kwargs=payload['kwargs'],
+        )
+        timer.id = payload['id']
+        return timer
+
+    def to_payload(self):
+        """A JSON serialisable form of the timer for sending to other clusters."""
+        return {
+            'id': self.id,
+            'event': self.event,
+            'args': self.args,
+            'kwargs': self.kwargs,
+            'created': self.created_at.isoformat(),
+            'expires': self.expires.isoformat(),
+        }
+
     def __eq__(self, other):
         try:
             return self.id == other.id
@@ -60,17 +93,187 @@ class Timer:
     def __repr__(self):
         return f'<Timer created={self.created_at} expires={self.expires} event={self.event}>'
 
+class ShortTimerLog:
+    """An append-only log of short timers that haven't fired yet.
+
+    Short timers never touch the database, so this is what lets them
+    survive a restart. Every timer is appended when created and a
+    tombstone is appended once it fires. Whatever is logged during one
+    tick of the event loop is written in one go, off the event loop.
+
+    Once the tombstones outnumber the pending timers (and there are
+    more than ``COMPACT_AFTER`` of them), or nothing is pending at all,
+    the file is rewritten with just the pending timers, so it stays
+    about the size of what's pending even under steady load.
+    """
+
+    COMPACT_AFTER = 1000
+
+    def __init__(self, name):
+        self.name = name
+        # key -> entry of every timer that hasn't fired yet
+        self._live = {}
+        self._tombstones = 0
+        self._buffer = []
+        self._needs_rewrite = False
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def replay(self):
+        """Reads back every timer that was logged but never fired.
+
+        The log is emptied afterwards, the caller is expected to add
+        the timers again.
+        """
+        pending = {}
+        try:
+            with open(self.name, 'r', encoding='utf-8') as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn write from a crash
+                        continue
+                    if 'fired' in entry:
+                        pending.pop(entry['fired'], None)
+                    else:
+                        pending[entry['key']] = entry
+        except FileNotFoundError:
+            pass
+
+        self._rewrite('')
+        timers = []
+        for entry in pending.values():
+            timers.append(Timer.temporary(
+                event=entry['event'],
+                args=entry['args'],
+                kwargs=entry['kwargs'],
+                expires=datetime.datetime.fromisoformat(entry['expires']),
+                created=datetime.datetime.fromisoformat(entry['created']),
+            ))
+        return timers
+
+    @staticmethod
+    def _encode(entries):
+        return ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries)
+
+    def _append(self, data):
+        with open(self.name, 'a', encoding='utf-8') as fp:
+            fp.write(data)
+
+    def _rewrite(self, data):
+        temp = f'{self.name}.tmp'
+        with open(temp, 'w', encoding='utf-8') as fp:
+            fp.write(data)
+        os.replace(temp, self.name)
+
+    def _schedule(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        # let the rest of this tick log its entries too
+        await asyncio.sleep(0)
+        self._task = None
+        try:
+            await self.flush()
+        except OSError:
+            log.exception('Could not write the short timer log.')
+
+    async def flush(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            if self._needs_rewrite:
+                # everything buffered is either in _live or fired already
+                self._needs_rewrite = False
+                self._buffer.clear()
+                self._tombstones = 0
+                await loop.run_in_executor(None, self._rewrite, self._encode(self._live.values()))
+            elif self._buffer:
+                data, self._buffer = ''.join(self._buffer), []
+                await loop.run_in_executor(None, self._append, data)
+
+    def append(self, key, timer):
+        entry = self._live[key] = {
+            'key': key,
+            'event': timer.event,
+            'args': timer.args,
+            'kwargs': timer.kwargs,
+            'expires': timer.expires.isoformat(),
+            'created': timer.created_at.isoformat(),
+        }
+        self._buffer.append(self._encode([entry]))
+        self._schedule()
+
+    def discard(self, key):
+        if self._live.pop(key, None) is None:
+            return
+
+        self._tombstones += 1
+        if not self._live or self._tombstones > max(self.COMPACT_AFTER, len(self._live)):
+            self._needs_rewrite = True
+        else:
+            self._buffer.append(self._encode([{'fired': key}]))
+        self._schedule()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
 class Reminder(commands.Cog):
     """Reminders to do something"""
 
+    # Timers expiring within this window are kept in memory and fired
+    # straight from the heap without a database round trip per timer.
+    HORIZON = datetime.timedelta(minutes=5)
+
+    # Upper bound on timer listeners running at once, so that a mass expiry
+    # unbans, unmutes and sends a few at a time rather than all in one go.
+    # The listeners take a slot each through cogs.utils.timers.listener.
+    MAX_CONCURRENT_DISPATCH = 8
+
     def __init__(self, bot):
         self.bot = bot
         self._have_data = asyncio.Event(loop=bot.loop)
-        self._current_timer = None
+        # (expires, key) entries, lazily invalidated through _pending
+        self._heap = []
+        # key -> Timer for every timer currently loaded in the heap
+        self._pending = {}
+        # every timer expiring before this point is known to be in _pending
+        self._horizon = None
+        self._dispatch_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_DISPATCH)
+        self._dispatching = set()
+        # (event, seconds between expiry and dispatch) for recently fired timers
+        self._dispatch_latency = deque(maxlen=1000)
+
+        # short timers live in the same heap under negative keys,
+        # optionally backed by a log so they survive restarts
+        self._short_keys = itertools.count(1)
+        self._short_log = None
+        log_name = getattr(bot.config, 'short_timer_log', 'short_timers.log')
+        if log_name is not None and bot.ipc.clustered:
+            # short timers stay in the cluster that created them
+            log_name = f'{log_name}.{bot.cluster_id}'
+        if log_name is not None:
+            self._short_log = ShortTimerLog(log_name)
+            for timer in self._short_log.replay():
+                self._push_short(timer)
+
+        # stored timers are only loaded and fired by the primary cluster,
+        # which forwards them to the others
+        bot.ipc.add_handler('timer_created', self.ipc_timer_created)
+        bot.ipc.add_handler('timer_fired', self.ipc_timer_fired)
+
         self._task = bot.loop.create_task(self.dispatch_timers())
 
     async def cog_unload(self):
         self._task.cancel()
+        self.bot.ipc.remove_handler('timer_created')
+        self.bot.ipc.remove_handler('timer_fired')
+        if self._short_log is not None:
+            await self._short_log.close()
 
     async def cog_command_error(self, ctx, error):
         if isinstance(error, commands.BadArgument):
@@ -78,60 +281,179 @@ class Reminder(commands.Cog):
         if isinstance(error, commands.TooManyArguments):
             await ctx.send(f"You called the {ctx.commands.name} command with too many arguments.")
 
-    async def get_active_timer(self, *, connection=None, days=7):
-        query = "SELECT * FROM reminders WHERE expires < (CURRENT_DATE + $1::interval) ORDER BY expires LIMIT 1;"
-        con = connection or self.bot.pool
+    def _push(self, timer, *, key=None):
+        if key is None:
+            key = timer.id
+        if key in self._pending:
+            return False
 
-        record = await con.fetchrow(query, datetime.timedelta(days=days))
-        return Timer(record=record) if record else None
+        was_earliest = not self._heap or timer.expires < self._heap[0][0]
+        self._pending[key] = timer
+        heapq.heappush(self._heap, (timer.expires, key))
+        return was_earliest
+
+    def _push_short(self, timer):
+        key = -next(self._short_keys)
+        if self._short_log is not None:
+            self._short_log.append(key, timer)
+        return self._push(timer, key=key)
+
+    def _forget(self, key):
+        # the heap entry is skipped once it's popped
+        timer = self._pending.pop(key, None)
+        if timer is not None and key < 0 and self._short_log is not None:
+            self._short_log.discard(key)
+        return timer
 
-    async def wait_for_active_timers(self, *, connection=None, days=7):
-        async with self.bot.pool.acquire() as con:
-            timer = await self.get_active_timer(connection=con, days=days)
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, key = heapq.heappop(self._heap)
+            timer = self._forget(key)
             if timer is not None:
+                due.append(timer)
+        return due
+
+    async def load_timers(self, *, connection=None, days=40):
+        """Loads every timer expiring within the horizon into the heap.
+
+        If nothing is due within the horizon, the horizon is stretched up
+        to the next stored timer (capped at ``days``) so that an idle bot
+        doesn't poll the database.
+        """
+        con = connection or self.bot.pool
+        now = datetime.datetime.utcnow()
+        if not self.bot.is_primary_cluster:
+            # only short timers live here
+            self._horizon = now + datetime.timedelta(days=days)
+            return
+
+        # this is set *before* querying so that any timer created while the
+        # query is in flight gets pushed by create_timer as well
+        self._horizon = horizon = now + self.HORIZON
+        query = "SELECT * FROM reminders WHERE expires < $1 ORDER BY expires;"
+        records = await con.fetch(query, horizon)
+        for record in records:
+            self._push(Timer(record=record))
+
+        if not self._heap:
+            query = "SELECT MIN(expires) FROM reminders;"
+            upcoming = await con.fetchval(query)
+            cap = now + datetime.timedelta(days=days)
+            if upcoming is None or upcoming > cap:
+                upcoming = cap
+            self._horizon = max(upcoming, horizon)
+
+    def get_dispatch_stats(self):
+        """Returns a summary of how late recently fired timers were dispatched.
+
+        Returns
+        --------
+        Optional[dict]
+            A mapping with ``count``, ``mean``, ``p50``, ``p99`` and ``max``
+            latencies in seconds, or ``None`` if nothing fired yet.
+        """
+        latencies = sorted(latency for _, latency in self._dispatch_latency)
+        if not latencies:
+            return None
+
+        total = len(latencies)
+        return {
+            'count': total,
+            'mean': statistics.fmean(latencies),
+            'p50': latencies[total // 2],
+            'p99': latencies[min(total - 1, int(total * 0.99))],
+            'max': latencies[-1],
+        }
+
+    @contextlib.asynccontextmanager
+    async def dispatch_slot(self):
+        """Holds one of the :attr:`MAX_CONCURRENT_DISPATCH` slots for handling a timer.
+
+        bot.dispatch only schedules the listeners, so this is what bounds
+        the work a mass expiry starts. Listeners take it through
+        :func:`cogs.utils.timers.listener`.
+        """
+        task = asyncio.current_task()
+        self._dispatching.add(task)
+        try:
+            async with self._dispatch_semaphore:
+                yield
+        finally:
+            self._dispatching.discard(task)
+
+    def _dispatch_timer(self, timer):
+        latency = (datetime.datetime.utcnow() - timer.expires).total_seconds()
+        self._dispatch_latency.append((timer.event, latency))
+        # through bot.dispatch so that wait_for('<event>_timer_complete') works too
+        self.bot.dispatch(f'{timer.event}_timer_complete', timer)
+
+    async def call_timers(self, timers):
+        # delete the timers in one go, short timers were never stored.
+        # only the ones actually deleted get fired, so a timer deleted by
+        # another cluster in the meantime stays dead
+        ids = [t.id for t in timers if t.id is not None]
+        if ids:
+            query = "DELETE FROM reminders WHERE id = ANY($1::int[]) RETURNING id;"
+            records = await self.bot.pool.fetch(query, ids)
+            deleted = {record['id'] for record in records}
+            timers = [t for t in timers if t.id is None or t.id in deleted]
+
+        # fan the events out, the listeners bound themselves with dispatch_slot
+        for timer in timers:
+            self._dispatch_timer(timer)
+            if timer.id is not None:
+                await self.bot.ipc.broadcast('timer_fired', timer.to_payload())
+
+    async def ipc_timer_created(self, payload):
+        if not self.bot.is_primary_cluster:
+            return
+        timer = Timer.from_payload(payload)
+        if self._horizon is not None and timer.expires < self._horizon:
+            if self._push(timer):
                 self._have_data.set()
-                return timer
 
-            self._have_data.clear()
-            self._current_timer = None
-            await self._have_data.wait()
-            return await self.get_active_timer(connection=con, days=days)
+    async def ipc_timer_fired(self, payload):
+        # the guild (or channel) might live in this cluster instead
+        self._dispatch_timer(Timer.from_payload(payload))
 
     async def call_timer(self, timer):
-        # delete the timer
-        query = "DELETE FROM reminders WHERE id = $1;"
-        await self.bot.pool.execute(query, timer.id)
-
-        # dispatch the event
-        event_name = f'{timer.event}_timer_complete'
-        self.bot.dispatch(event_name, timer)
+        await self.call_timers([timer])
 
     async def dispatch_timers(self):
         await self.bot.wait_until_ready()
         try:
             while not self.bot.is_closed():
-                # can only use asyncio.sleep for up to ~48 days reliably
-                # so we're gonna cap it off at 40 days
-                # see: http://bugs/python.org/issue20493
-                timer = self._current_timer = await self.wait_for_active_timers(days=40)
                 now = datetime.datetime.utcnow()
-
-                if timer.expires >= now:
-                    to_sleep = (timer.expires - now).total_seconds()
-                    await asyncio.sleep(to_sleep)
-
-                await self.call_timer(timer)
+                if self._horizon is None or now >= self._horizon:
+                    # can only use asyncio.sleep for up to ~48 days reliably
+                    # so we're gonna cap it off at 40 days
+                    # see: http://bugs/python.org/issue20493
+                    await self.load_timers(days=40)
+                    now = datetime.datetime.utcnow()
+
+                due = self._pop_due(now)
+                if due:
+                    await self.call_timers(due)
+                    continue
+
+                wake_at = self._horizon
+                if self._heap and self._heap[0][0] < wake_at:
+                    wake_at = self._heap[0][0]
+
+                # create_timer sets this when an earlier timer shows up
+                self._have_data.clear()
+                try:
+                    await asyncio.wait_for(self._have_data.wait(), timeout=(wake_at - now).total_seconds())
+                except asyncio.TimeoutError:
+                    pass
         except asyncio.CancelledError:
             raise
         except (OSError, discord.ConnectionClosed, asyncpg.PostgresConnectionError):
+            self._horizon = None
             self._task.cancel()
             self._task = self.bot.loop.create_task(self.dispatch_timers())
     
-    async def short_timer_optimisation(self, seconds, timer):
-        await asyncio.sleep(seconds)
-        event_name = f'{timer.event}_timer_complete'
-        self.bot.dispatch(event_name, timer)
-
     async def create_timer(self, *args, **kwargs):
         """Creates a timer.
         Parameters
@@ -177,8 +499,9 @@ class Reminder(commands.Cog):
         timer = Timer.temporary(event=event, args=args, kwargs=kwargs, expires=when, created=now)
         delta = (when - now).total_seconds()
         if delta <= 60:
-            # a shortcut for small timers
-            self.bot.loop.create_task(self.short_timer_optimisation(delta, timer))
+            # a shortcut for small timers, these skip the database entirely
+            if self._push_short(timer):
+                self._have_data.set()
             return timer
 
         query = """INSERT INTO reminders (event, extra, expires, created)
@@ -189,16 +512,16 @@ class Reminder(commands.Cog):
         row = await connection.fetchrow(query, event, { "args": args, "kwargs": kwargs }, when, now)
         timer.id = row[0]
 
-        # only set the data check if it can be waited on
-        if delta <= (86400 * 40): # 40 days
-            self._have_data.set()
+        if not self.bot.is_primary_cluster:
+            await self.bot.ipc.broadcast('timer_created', timer.to_payload())
+            return timer
+
+        # only touch the heap if the timer falls inside the loaded window,
+        # anything later gets picked up when the window moves forward
+        if self._horizon is not None and when < self._horizon:
+            if self._push(timer):
+                self._have_data.set()
 
-        # check if this timer is earlier than our currently run timer
-        if self._current_timer and when < self._current_timer.expires:
-            # cancel the task and re-run it
-            self._task.cancel()
-            self._task = self.bot.loop.create_task(self.dispatch_timers())
-        
         return timer
 
     @commands.group(aliases=['timer', 'remind'], usage='<when>', invoke_without_command=True)
@@ -271,10 +594,8 @@ class Reminder(commands.Cog):
         if status == 'DELETE 0':
             return await ctx.send("Could not delete any reminders with that ID")
 
-        # if the current timer is being deleted
-        if self._current_timer and self._current_timer.id == id:
-            self._task.cancel()
-            self._task = self.bot.loop.create_task(self.dispatch_timers())
+        # if the timer is already loaded then make sure it won't fire
+        self._forget(id)
 
         await ctx.send("Successfully deleted reminder.")
 
@@ -305,21 +626,33 @@ class Reminder(commands.Cog):
         query = """DELETE FROM reminders WHERE event = 'reminder' AND extra #>> '{args,0}' = $1;"""
         await ctx.db.execute(query, author_id)
 
-        # Check if the current timer is the one being cleared and cancel it if so
-        if self._current_timer and self._current_timer.author_id == ctx.author.id:
-            self._task.cancel()
-            self._task = self.bot.loop.create_task(self.dispatch_timers())
+        # Make sure none of the cleared timers that are already loaded fire
+        to_forget = [
+            timer_id for timer_id, timer in self._pending.items()
+            if timer.event == 'reminder' and timer.author_id == ctx.author.id
+        ]
+        for timer_id in to_forget:
+            self._forget(timer_id)
 
         await ctx.send(f'Successfully deleted {formats.plural(total):reminder}.')
 
-    @commands.Cog.listener()
+    @timers.listener
     async def on_reminder_timer_complete(self, timer):
         author_id, channel_id, message = timer.args
 
-        try:
-            channel = self.bot.get_channel(channel_id) or (await self.bot.fetch_channel(channel_id))
-        except discord.HTTPException:
-            return
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            # every cluster sees this timer, only the primary one goes to the API
+            # and only for channels no other cluster would have cached
+            if not self.bot.is_primary_cluster:
+                return
+            try:
+                channel = await self.bot.fetch_channel(channel_id)
+            except discord.HTTPException:
+                return
+            guild = getattr(channel, 'guild', None)
+            if guild is not None and not self.bot.owns_guild(guild.id):
+                return
 
         guild_id = channel.guild.id if isinstance(channel, (discord.TextChannel, discord.Thread)) else '@me'
         message_id = timer.kwargs.get('message_id')
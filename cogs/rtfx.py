@@ -17,7 +17,7 @@ import discord.raw_models
 from lxml import etree
 
 from discord.ext import commands, tasks
-from .utils import fuzzy
+from .utils import cache, fuzzy
 
 
 class SphinxObjectFileReader:
@@ -58,6 +58,9 @@ class RTFX(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_unload(self):
+        cache.unregister('RTFX._rtfm_cache')
+
     def parse_object_inv(self, stream, url):
         # key: URL
         # n.b.: key doesn't have `discord` or `discord.ext.commands` namespaces
@@ -117,18 +120,18 @@ class RTFX(commands.Cog):
         return result
 
     async def build_rtfm_lookup_table(self, page_types):
-        cache = {}
+        lookup = {}
         for key, page in page_types.items():
-            # sub = cache[key] = {}
+            # sub = lookup[key] = {}
             async with self.bot.session.get(page + '/objects.inv') as resp:
                 if resp.status != 200:
                     raise RuntimeError(
                         'Cannot build rtfm lookup table, try again later. Code {} page {}'.format(resp.status, resp.url))
 
                 stream = SphinxObjectFileReader(await resp.read())
-                cache[key] = self.parse_object_inv(stream, page)
+                lookup[key] = self.parse_object_inv(stream, page)
 
-        self._rtfm_cache = cache
+        self._rtfm_cache = cache.register('RTFX._rtfm_cache', lookup)
 
     async def do_rtfm(self, ctx, key, obj):
         page_types = {
@@ -1,13 +1,12 @@
-import asyncio
 import datetime
 import difflib
 import typing
 
 import discord
 from asyncpg import Record
-from discord.ext import commands, tasks, menus
+from discord.ext import commands, menus
 
-from .utils import cache, db, formats
+from .utils import buffer, cache, db, formats
 from .utils.paginator import RoboPages
 
 class RequiresSnipe(commands.CheckFailure):
@@ -22,7 +21,11 @@ class SnipePageSource(menus.ListPageSource):
     async def format_page(self, menu, page):
         return self.embeds[page]
 
-class SnipeDeleteTable(db.Table, table_name='snipe_deletes'):
+# snipes are only of interest for a little while
+SNIPE_RETENTION = datetime.timedelta(days=7)
+
+class SnipeDeleteTable(db.Table, table_name='snipe_deletes',
+                       partition=db.Partitioning('delete_time', interval='day', retention=SNIPE_RETENTION, premake=3, key='epoch')):
     id = db.PrimaryKeyColumn()
 
     user_id = db.Column(db.Integer(big=True))
@@ -33,7 +36,8 @@ class SnipeDeleteTable(db.Table, table_name='snipe_deletes'):
     attachment_urls = db.Column(db.Array(db.String), nullable=True)
     delete_time = db.Column(db.Integer(big=True))
 
-class SnipeEditTable(db.Table, table_name='snipe_edits'):
+class SnipeEditTable(db.Table, table_name='snipe_edits',
+                     partition=db.Partitioning('edited_time', interval='day', retention=SNIPE_RETENTION, premake=3, key='epoch')):
     id = db.PrimaryKeyColumn()
 
     user_id = db.Column(db.Integer(big=True))
@@ -91,15 +95,13 @@ class Snipe(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.snipe_deletes = []
-        self.snipe_edits = []
-        self._snipe_lock = asyncio.Lock(loop=bot.loop)
-        self.snipe_delete_update.start()
-        self.snipe_edit_update.start()
+        # not written yet, but still shown by the snipe commands
+        self.snipe_deletes = buffer.WriteBuffer('snipe_deletes', self.snipe_delete_update, interval=60.0).start()
+        self.snipe_edits = buffer.WriteBuffer('snipe_edits', self.snipe_edit_update, interval=60.0).start()
 
     async def cog_unload(self):
-        self.snipe_delete_update.stop()
-        self.snipe_edit_update.stop()
+        await self.snipe_deletes.close()
+        await self.snipe_edits.close()
 
     async def cog_command_error(self, ctx, error):
         error = getattr(error, 'original', error)
@@ -200,16 +202,15 @@ class Snipe(commands.Cog):
         m_id = message.id
         m_content = message.content
         attachs = [attachment.proxy_url for attachment in message.attachments if message.attachments]
-        async with self._snipe_lock:
-            self.snipe_deletes.append({
-                'user_id': a_id,
-                'guild_id': g_id,
-                'channel_id': c_id,
-                'message_id': m_id,
-                'message_content': m_content,
-                'attachment_urls': attachs,
-                'delete_time': int(delete_time)
-            })
+        await self.snipe_deletes.put({
+            'user_id': a_id,
+            'guild_id': g_id,
+            'channel_id': c_id,
+            'message_id': m_id,
+            'message_content': m_content,
+            'attachment_urls': attachs,
+            'delete_time': int(delete_time)
+        })
 
     @commands.Cog.listener()
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
@@ -236,17 +237,16 @@ class Snipe(commands.Cog):
         m_id = after.id
         before_content = before.content
         after_content = after.content
-        async with self._snipe_lock:
-            self.snipe_edits.append({
-                'user_id': a_id,
-                'guild_id': g_id,
-                'channel_id': c_id,
-                'message_id': m_id,
-                'before_content': before_content,
-                'after_content': after_content,
-                'edited_time': int(edited_time),
-                'jump_url': after.jump_url
-            })
+        await self.snipe_edits.put({
+            'user_id': a_id,
+            'guild_id': g_id,
+            'channel_id': c_id,
+            'message_id': m_id,
+            'before_content': before_content,
+            'after_content': after_content,
+            'edited_time': int(edited_time),
+            'jump_url': after.jump_url
+        })
     
     @commands.group(name='snipe', aliases=['s'], invoke_without_command=True, cooldown_after_parsing=True)
     @commands.guild_only()
@@ -399,51 +399,25 @@ class Snipe(commands.Cog):
         confirm = await ctx.prompt("This is a destructive action and is non-recoverable. Are you sure?")
         if not confirm:
             return
-        await ctx.db.execute('\n'.join([deletes, edits]), ctx.guild.id, target.id)
+        # drop the buffered rows first, this waits out a flush in progress
+        # so the rows it wrote are caught by the delete below
+        key = 'user_id' if member else 'channel_id'
+        await self.snipe_deletes.remove_if(lambda item: item[key] == target.id)
+        await self.snipe_edits.remove_if(lambda item: item[key] == target.id)
 
-        for item in self.snipe_deletes:
-            if member:
-                if item['user_id'] == target.id:
-                    self.snipe_deletes.remove(item)
-            elif channel:
-                if item['channel_id'] == target.id:
-                    self.snipe_deletes.remove(item)
-        
-        for item in self.snipe_edits:
-            if member:
-                if item['user_id'] == target.id:
-                    self.snipe_edits.remove(item)
-            elif channel:
-                if item['channel_id'] == target.id:
-                    self.snipe_edits.remove(item)
+        await ctx.db.execute('\n'.join([deletes, edits]), ctx.guild.id, target.id)
 
         return await ctx.message.add_reaction(ctx.tick(True))
 
-    @tasks.loop(minutes=1)
-    async def snipe_delete_update(self):
+    async def snipe_delete_update(self, rows):
         """Batch updates for the snipes."""
-        await self.bot.wait_until_ready()
-        query = """INSERT INTO snipe_deletes (user_id, guild_id, channel_id, message_id, message_content, attachment_urls, delete_time)
-                   SELECT x.user_id, x.guild_id, x.channel_id, x.message_id, x.message_content, x.attachment_urls, x.delete_time
-                   FROM jsonb_to_recordset($1::jsonb) AS
-                   x(user_id BIGINT, guild_id BIGINT, channel_id BIGINT, message_id BIGINT, message_content TEXT, attachment_urls TEXT ARRAY, delete_time BIGINT)
-                """
-        async with self._snipe_lock:
-            await self.bot.pool.execute(query, self.snipe_deletes)
-            self.snipe_deletes.clear()
+        columns = SnipeDeleteTable.copy_columns()
+        await SnipeDeleteTable.copy_records([tuple(row[c] for c in columns) for row in rows], columns=columns)
 
-    @tasks.loop(minutes=1)
-    async def snipe_edit_update(self):
+    async def snipe_edit_update(self, rows):
         """Batch updates for the snipes."""
-        await self.bot.wait_until_ready()
-        query = """INSERT INTO snipe_edits (user_id, guild_id, channel_id, message_id, before_content, after_content, edited_time, jump_url)
-                   SELECT x.user_id, x.guild_id, x.channel_id, x.message_id, x.before_content, x.after_content, x.edited_time, x.jump_url
-                   FROM jsonb_to_recordset($1::jsonb) AS
-                   x(user_id BIGINT, guild_id BIGINT, channel_id BIGINT, message_id BIGINT, before_content TEXT, after_content TEXT, edited_time BIGINT, jump_url TEXT)
-                """
-        async with self._snipe_lock:
-            await self.bot.pool.execute(query, self.snipe_edits)
-            self.snipe_edits.clear()
+        columns = SnipeEditTable.copy_columns()
+        await SnipeEditTable.copy_records([tuple(row[c] for c in columns) for row in rows], columns=columns)
 
     @show_snipes.error
     @show_edit_snipes.error
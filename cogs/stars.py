@@ -1,5 +1,5 @@
   
-from discord.ext import commands, tasks, menus
+from discord.ext import commands, menus
 from .utils import checks, cache, db
 from .utils.formats import plural, human_join
 from .utils.paginator import SimplePages
@@ -41,6 +41,11 @@ def MessageID(argument):
     except ValueError:
         raise StarError(f'"{argument}" is not a valid message ID. Use Developer Mode to get the Copy ID option.')
 
+def _message_size(message):
+    # a rough guess, the Message object itself and its references are
+    # a fixed overhead while the content and embeds are what vary
+    return 1024 + len(message.content) + sum(len(e) for e in message.embeds)
+
 class Starboard(db.Table):
     id = db.Column(db.Integer(big=True), primary_key=True)
 
@@ -109,8 +114,8 @@ class Stars(commands.Cog):
         self.bot = bot
 
         # cache message objects to save Discord some HTTP requests.
-        self._message_cache = {}
-        self.clean_message_cache.start()
+        self._message_cache = cache.SizedLRU(2000, max_bytes=8 * 1024 * 1024, ttl=3600.0, sizeof=_message_size)
+        cache.register('Stars._message_cache', self._message_cache, sizeof=lambda: self._message_cache.total_bytes)
 
         # if it's in this set,
         self._about_to_be_deleted = set()
@@ -118,23 +123,57 @@ class Stars(commands.Cog):
         self._locks = weakref.WeakValueDictionary()
         self.spoilers = re.compile(r'\|\|(.+?)\|\|')
 
+        # guild_id: StarboardConfig
+        # once loaded this is authoritative, every change to the starboard
+        # table goes through this cog and updates it in place
+        self._starboards = {}
+        self._starboards_loaded = False
+
+    async def cog_load(self):
+        query = "SELECT * FROM starboard;"
+        records = await self.bot.pool.fetch(query)
+        self._starboards = {
+            record['id']: StarboardConfig(guild_id=record['id'], bot=self.bot, record=record)
+            for record in records
+        }
+        self._starboards_loaded = True
+        cache.register('Stars._starboards', self._starboards)
+        log.info('Loaded %s starboard configurations.', len(self._starboards))
+
     async def cog_unload(self):
-        self.clean_message_cache.cancel()
+        cache.unregister('Stars._message_cache')
+        cache.unregister('Stars._starboards')
 
     async def cog_command_error(self, ctx, error):
         if isinstance(error, StarError):
             await ctx.send(error)
 
-    @tasks.loop(hours=1.0)
-    async def clean_message_cache(self):
-        self._message_cache.clear()
-
-    @cache.cache()
     async def get_starboard(self, guild_id, *, connection=None):
+        try:
+            return self._starboards[guild_id]
+        except KeyError:
+            pass
+
+        if self._starboards_loaded:
+            # no starboard configured
+            return StarboardConfig(guild_id=guild_id, bot=self.bot)
+
         connection = connection or self.bot.pool
         query = "SELECT * FROM starboard WHERE id = $1;"
         record = await connection.fetchrow(query, guild_id)
-        return StarboardConfig(guild_id=guild_id, bot=self.bot, record=record)
+        starboard = StarboardConfig(guild_id=guild_id, bot=self.bot, record=record)
+        if record is not None:
+            self._starboards[guild_id] = starboard
+        return starboard
+
+    def update_starboard(self, guild_id, **fields):
+        """Updates the in-memory configuration after the table was changed."""
+        starboard = self._starboards.get(guild_id)
+        if starboard is None:
+            return
+
+        for key, value in fields.items():
+            setattr(starboard, key, value)
 
     def star_emoji(self, stars):
         if 5 > stars >= 0:
@@ -258,6 +297,7 @@ class Stars(commands.Cog):
         async with self.bot.pool.acquire(timeout=300.0) as con:
             query = "DELETE FROM starboard WHERE id = $1;"
             await con.execute(query, channel.guild.id)
+        self._starboards.pop(channel.guild.id, None)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
@@ -269,6 +309,7 @@ class Stars(commands.Cog):
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload):
+        self._message_cache.pop(payload.message_id, None)
         if payload.message_id in self._about_to_be_deleted:
             # we triggered this deletion ourselves and 
             # we don't need to drop it from the database
@@ -287,6 +328,9 @@ class Stars(commands.Cog):
 
     @commands.Cog.listener()
     async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            self._message_cache.pop(message_id, None)
+
         if payload.message_ids <= self._about_to_be_deleted:
             # see comment above
             self._about_to_be_deleted.difference_update(payload.message_ids)
@@ -300,6 +344,11 @@ class Stars(commands.Cog):
             query = "DELETE FROM starboard_entries WHERE bot_message_id = ANY($1::BIGINT[]);"
             await con.execute(query, list(payload.message_ids))
 
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        # the cached copy is stale now, it gets fetched again on the next star
+        self._message_cache.pop(payload.message_id, None)
+
     @commands.Cog.listener()
     async def on_raw_reaction_clear(self, payload):
         guild = self.bot.get_guild(payload.guild_id)
@@ -575,11 +624,6 @@ class Stars(commands.Cog):
         You must have Manage Server permission to use this.
         """
 
-        # bypass the cache just in case someone used the star
-        # reaction earlier before having it set up, or they
-        # decided to use the !star command
-        self.get_starboard.invalidate(self, ctx.guild.id)
-
         starboard = await self.get_starboard(ctx.guild.id, connection=ctx.db)
         if starboard.channel is not None:
             return await ctx.send(f'This server already has a starboard ({starboard.channel.mention}).')
@@ -592,6 +636,7 @@ class Stars(commands.Cog):
             else:
                 if confirm:
                     await ctx.db.execute('DELETE FROM starboard WHERE id=$1;', ctx.guild.id)
+                    self._starboards.pop(ctx.guild.id, None)
                 else:
                     return await ctx.send('Aborting starboard creation. Join the bot support server for more questions.')
 
@@ -616,14 +661,14 @@ class Stars(commands.Cog):
         except discord.HTTPException:
             return await ctx.send('\N{NO ENTRY SIGN} This channel name is bad or an unknown error happened.')
 
-        query = "INSERT INTO starboard (id, channel_id) VALUES ($1, $2);"
+        query = "INSERT INTO starboard (id, channel_id) VALUES ($1, $2) RETURNING *;"
         try:
-            await ctx.db.execute(query, ctx.guild.id, channel.id)
+            record = await ctx.db.fetchrow(query, ctx.guild.id, channel.id)
         except:
             await channel.delete(reason='Failure to commit to create the ')
             await ctx.send('Could not create the channel due to an internal error. Join the bot support server for help.')
         else:
-            self.get_starboard.invalidate(self, ctx.guild.id)
+            self._starboards[ctx.guild.id] = StarboardConfig(guild_id=ctx.guild.id, bot=self.bot, record=record)
             await ctx.send(f'\N{GLOWING STAR} Starboard created at {channel.mention}.')
 
     @starboard.command(name='info')
@@ -1020,7 +1065,7 @@ class Stars(commands.Cog):
 
         query = "UPDATE starboard SET locked=TRUE WHERE id=$1;"
         await ctx.db.execute(query, ctx.guild.id)
-        self.get_starboard.invalidate(self, ctx.guild.id)
+        self.update_starboard(ctx.guild.id, locked=True, needs_migration=False)
 
         await ctx.send('Starboard is now locked.')
 
@@ -1037,7 +1082,7 @@ class Stars(commands.Cog):
 
         query = "UPDATE starboard SET locked=FALSE WHERE id=$1;"
         await ctx.db.execute(query, ctx.guild.id)
-        self.get_starboard.invalidate(self, ctx.guild.id)
+        self.update_starboard(ctx.guild.id, locked=False, needs_migration=False)
 
         await ctx.send('Starboard is now unlocked.')
 
@@ -1070,7 +1115,7 @@ class Stars(commands.Cog):
         guild_id = ctx.guild.id
         query = "UPDATE starboard SET locked=TRUE WHERE id=$1;"
         await ctx.db.execute(query, guild_id)
-        self.get_starboard.invalidate(self, guild_id)
+        self.update_starboard(guild_id, locked=True, needs_migration=False)
 
         await ctx.send('Starboard is now locked and migration will now begin.')
 
@@ -1107,7 +1152,7 @@ class Stars(commands.Cog):
             delta = time.time() - start
             query = "UPDATE starboard SET locked = FALSE WHERE id=$1;"
             await ctx.db.execute(query, guild_id)
-            self.get_starboard.invalidate(self, guild_id)
+            self.update_starboard(guild_id, locked=False, needs_migration=False)
 
             m = await ctx.send(f'{ctx.author.mention}, we are done migrating!\n' \
                                 'The starboard has been unlocked.\n' \
@@ -1145,7 +1190,7 @@ class Stars(commands.Cog):
         stars = min(max(stars, 1), 100)
         query = "UPDATE starboard SET threshold=$2 WHERE id=$1;"
         await ctx.db.execute(query, ctx.guild.id, stars)
-        self.get_starboard.invalidate(self, ctx.guild.id)
+        self.update_starboard(ctx.guild.id, threshold=stars)
 
         await ctx.send(f'Messages now require {plural(stars):star} to show up in the starboard.')
     
@@ -1182,9 +1227,9 @@ class Stars(commands.Cog):
         # the input is sanitised so this should be ok
         # only doing this because asyncpg requires a timedelta object but
         # generating that with these clamp units is overkill
-        query = f"UPDATE starboard SET max_age='{number} {units}'::interval WHERE id=$1;"
-        await ctx.db.execute(query, ctx.guild.id)
-        self.get_starboard.invalidate(self, ctx.guild.id)
+        query = f"UPDATE starboard SET max_age='{number} {units}'::interval WHERE id=$1 RETURNING max_age;"
+        max_age = await ctx.db.fetchval(query, ctx.guild.id)
+        self.update_starboard(ctx.guild.id, max_age=max_age)
 
         if number == 1:
             age = f'1 {units[:-1]}'
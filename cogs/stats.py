@@ -2,7 +2,7 @@ import sys
 from discord.ext import commands, tasks, menus
 from collections import Counter, defaultdict
 
-from .utils import checks, time, db, formats
+from .utils import buffer, cache, checks, counters, time, db, formats
 
 import pkg_resources
 import logging
@@ -12,11 +12,9 @@ import datetime
 import traceback
 import itertools
 import typing
-import asyncpg
 import asyncio
 import pygit2
 import psutil
-import json
 import os
 import re
 import io
@@ -37,7 +35,10 @@ class GatewayHandler(logging.Handler):
     def emit(self, record):
         self.cog.add_record(record)
 
-class Commands(db.Table):
+# Older rows are dropped a partition at a time, the rollups below keep the totals.
+COMMANDS_PARTITIONING = db.Partitioning('used', interval='month', retention=datetime.timedelta(days=90))
+
+class Commands(db.Table, partition=COMMANDS_PARTITIONING):
     id = db.PrimaryKeyColumn()
 
     guild_id = db.Column(db.Integer(big=True), index=True)
@@ -48,6 +49,166 @@ class Commands(db.Table):
     command = db.Column(db.String, index=True)
     failed = db.Column(db.Boolean, index=True)
 
+    @classmethod
+    async def retention_ready(cls, connection):
+        # old rows may only go once the rollups hold the whole history,
+        # which is only known once `stats rebuild` has backfilled them
+        query = "SELECT EXISTS (SELECT 1 FROM command_rollup_state WHERE name = 'backfill');"
+        return await connection.fetchval(query)
+
+# Pre-aggregated command usage, kept up to date by Stats.bulk_insert so that
+# the stats commands don't have to scan the whole commands table.
+# These are primary keys, so direct messages are stored under guild ID 0.
+
+class CommandGuildRollup(db.Table, table_name='command_rollup_guilds'):
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    command = db.Column(db.String, primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0)
+    failed = db.Column(db.Integer(big=True), default=0)
+    first_used = db.Column(db.Datetime)
+
+class CommandAuthorRollup(db.Table, table_name='command_rollup_authors'):
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    author_id = db.Column(db.Integer(big=True), primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0)
+    first_used = db.Column(db.Datetime)
+
+class CommandRollup(db.Table, table_name='command_rollup_commands'):
+    command = db.Column(db.String, primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0)
+    failed = db.Column(db.Integer(big=True), default=0)
+
+# All time totals per guild and per user across guilds, so that the top of
+# `stats global` is read off the index on uses instead of summing every row.
+
+class CommandGuildTotal(db.Table, table_name='command_rollup_guild_totals'):
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0, index=True)
+
+class CommandAuthorTotal(db.Table, table_name='command_rollup_author_totals'):
+    author_id = db.Column(db.Integer(big=True), primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0, index=True)
+
+# The same, bucketed by hour (or by UTC day for the global top guilds and
+# users), for the "today" views. Only the last ROLLUP_HOURLY_RETENTION worth is kept.
+
+class CommandHourlyRollup(db.Table, table_name='command_rollup_hourly'):
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    bucket = db.Column(db.Datetime, primary_key=True, index=True)
+    command = db.Column(db.String, primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0)
+    failed = db.Column(db.Integer(big=True), default=0)
+
+class CommandAuthorHourlyRollup(db.Table, table_name='command_rollup_hourly_authors'):
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    bucket = db.Column(db.Datetime, primary_key=True, index=True)
+    author_id = db.Column(db.Integer(big=True), primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0)
+
+class CommandDailyGuildRollup(db.Table, table_name='command_rollup_daily_guilds'):
+    bucket = db.Column(db.Datetime, primary_key=True)
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0, index=True)
+
+class CommandDailyAuthorRollup(db.Table, table_name='command_rollup_daily_authors'):
+    bucket = db.Column(db.Datetime, primary_key=True)
+    author_id = db.Column(db.Integer(big=True), primary_key=True)
+    uses = db.Column(db.Integer(big=True), default=0, index=True)
+
+ROLLUP_HOURLY_RETENTION = datetime.timedelta(days=2)
+
+# Milestones of the rollups. The 'backfill' row is written by `stats rebuild`
+# once the rollups were computed from the whole raw history, and until it
+# exists Commands.retention_ready keeps the old partitions around.
+
+class CommandRollupState(db.Table, table_name='command_rollup_state'):
+    name = db.Column(db.String, primary_key=True)
+    reached = db.Column(db.Datetime, default="now() at time zone 'utc'")
+
+# Snapshots of bot.command_stats and bot.socket_stats, which only live in
+# memory, so that rates can be looked at across restarts. Every cluster
+# adds its counts onto the same rows.
+
+class CounterSnapshot(db.Table, table_name='counter_snapshots',
+                      partition=db.Partitioning('bucket', interval='week', retention=datetime.timedelta(days=30))):
+    counter = db.Column(db.String, primary_key=True)
+    name = db.Column(db.String, primary_key=True)
+    bucket = db.Column(db.Datetime, primary_key=True, index=True)
+    count = db.Column(db.Integer(big=True), default=0)
+
+# in seconds, this is also the size of a bucket
+COUNTER_SNAPSHOT_INTERVAL = 300
+
+def _rollup_upsert(table, key, columns):
+    # adds the batch's counts onto the existing ones
+    updates = []
+    for column in columns:
+        if column == 'first_used':
+            updates.append(f'first_used = LEAST({table}.first_used, excluded.first_used)')
+        else:
+            updates.append(f'{column} = {table}.{column} + excluded.{column}')
+    return f'({", ".join(key)}) DO UPDATE SET {", ".join(updates)}'
+
+def aggregate_commands(rows):
+    """Turns rows of the commands table into the counts for every rollup table.
+
+    Returns a list of (table, columns, records) tuples.
+    """
+    guilds = {}
+    authors = {}
+    totals = {}
+    hourly = {}
+    hourly_authors = Counter()
+    guild_totals = Counter()
+    author_totals = Counter()
+    daily_guilds = Counter()
+    daily_authors = Counter()
+
+    def add(store, key, used, failed):
+        try:
+            entry = store[key]
+        except KeyError:
+            store[key] = [1, failed, used]
+        else:
+            entry[0] += 1
+            entry[1] += failed
+            if used < entry[2]:
+                entry[2] = used
+
+    for guild_id, _, author_id, used, _, command, failed in rows:
+        guild_id = guild_id or 0
+        failed = int(bool(failed))
+        bucket = used.replace(minute=0, second=0, microsecond=0)
+        add(guilds, (guild_id, command), used, failed)
+        add(authors, (guild_id, author_id), used, 0)
+        add(totals, command, used, failed)
+        add(hourly, (guild_id, bucket, command), used, failed)
+        hourly_authors[guild_id, bucket, author_id] += 1
+        day = bucket.replace(hour=0)
+        guild_totals[guild_id] += 1
+        author_totals[author_id] += 1
+        daily_guilds[day, guild_id] += 1
+        daily_authors[day, author_id] += 1
+
+    return [
+        (CommandGuildRollup, ('guild_id', 'command', 'uses', 'failed', 'first_used'),
+         [(*key, uses, failed, first) for key, (uses, failed, first) in guilds.items()]),
+        (CommandAuthorRollup, ('guild_id', 'author_id', 'uses', 'first_used'),
+         [(*key, uses, first) for key, (uses, _, first) in authors.items()]),
+        (CommandRollup, ('command', 'uses', 'failed'),
+         [(key, uses, failed) for key, (uses, failed, _) in totals.items()]),
+        (CommandHourlyRollup, ('guild_id', 'bucket', 'command', 'uses', 'failed'),
+         [(*key, uses, failed) for key, (uses, failed, _) in hourly.items()]),
+        (CommandAuthorHourlyRollup, ('guild_id', 'bucket', 'author_id', 'uses'),
+         [(*key, uses) for key, uses in hourly_authors.items()]),
+        (CommandGuildTotal, ('guild_id', 'uses'), list(guild_totals.items())),
+        (CommandAuthorTotal, ('author_id', 'uses'), list(author_totals.items())),
+        (CommandDailyGuildRollup, ('bucket', 'guild_id', 'uses'),
+         [(*key, uses) for key, uses in daily_guilds.items()]),
+        (CommandDailyAuthorRollup, ('bucket', 'author_id', 'uses'),
+         [(*key, uses) for key, uses in daily_authors.items()]),
+    ]
+
 _INVITE_REGEX = re.compile(r'(?:https?:\/\/)?discord(?:\.gg|\.com|app\.com\/invite)?\/[A-Za-z0-9]+')
 
 def censor_invite(obj, *, _regex=_INVITE_REGEX):
@@ -68,35 +229,200 @@ class Stats(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.process = psutil.Process()
-        self._batch_lock = asyncio.Lock(loop=bot.loop)
-        self._data_batch = []
-        self.bulk_insert_loop.add_exception_type(asyncpg.PostgresConnectionError)
-        self.bulk_insert_loop.start()
+        self._data_batch = buffer.WriteBuffer('commands', self.bulk_insert, interval=10.0, max_size=500).start()
+        if bot.is_primary_cluster:
+            self.rollup_maintenance.start()
         self._gateway_queue = asyncio.Queue(loop=bot.loop)
         self.gateway_worker.start()
-
-    async def bulk_insert(self):
-        query = """INSERT INTO commands (guild_id, channel_id, author_id, used, prefix, command, failed)
-                   SELECT x.guild, x.channel, x.author, x.used, x.prefix, x.command, x.failed
-                   FROM jsonb_to_recordset($1::jsonb) AS
-                   x(guild BIGINT, channel BIGINT, author BIGINT, used TIMESTAMP, prefix TEXT, command TEXT, failed BOOLEAN)
+        self.counter_snapshots.start()
+        bot.ipc.add_handler('stats', self.ipc_stats)
+
+    async def bulk_insert(self, rows):
+        # (guild_id, channel_id, author_id, used, prefix, command, failed)
+        async with self.bot.pool.acquire() as con:
+            # all or nothing, a retried batch mustn't be counted twice
+            async with con.transaction():
+                total = await Commands.copy_records(rows, connection=con)
+                await self.update_rollups(con, rows)
+        if total > 1:
+            log.info('Registered %s commands to database.', total)
+
+    async def update_rollups(self, con, rows):
+        for table, columns, records in aggregate_commands(rows):
+            key = [c for c in columns if c not in ('uses', 'failed', 'first_used')]
+            on_conflict = _rollup_upsert(table.__tablename__, key, columns[len(key):])
+            await table.copy_records(records, columns=columns, on_conflict=on_conflict, connection=con)
+
+    async def rebuild_rollups(self, con):
+        """Recomputes every rollup table from the commands table.
+
+        This marks the rollups as backfilled, which lets the retention
+        policy drop old commands from then on.
+        """
+        truncate = """TRUNCATE command_rollup_guilds, command_rollup_authors, command_rollup_commands,
+                               command_rollup_hourly, command_rollup_hourly_authors,
+                               command_rollup_daily_guilds, command_rollup_daily_authors;
+                   """
+
+        guilds = """INSERT INTO command_rollup_guilds (guild_id, command, uses, failed, first_used)
+                    SELECT COALESCE(guild_id, 0), command, COUNT(*), COUNT(*) FILTER (WHERE failed), MIN(used)
+                    FROM commands
+                    GROUP BY 1, 2;
+                 """
+
+        authors = """INSERT INTO command_rollup_authors (guild_id, author_id, uses, first_used)
+                     SELECT COALESCE(guild_id, 0), author_id, COUNT(*), MIN(used)
+                     FROM commands
+                     GROUP BY 1, 2;
+                  """
+
+        totals = """INSERT INTO command_rollup_commands (command, uses, failed)
+                    SELECT command, COUNT(*), COUNT(*) FILTER (WHERE failed)
+                    FROM commands
+                    GROUP BY 1;
+                 """
+
+        hourly = """INSERT INTO command_rollup_hourly (guild_id, bucket, command, uses, failed)
+                    SELECT COALESCE(guild_id, 0), date_trunc('hour', used), command, COUNT(*), COUNT(*) FILTER (WHERE failed)
+                    FROM commands
+                    WHERE used > (CURRENT_TIMESTAMP - $1::interval)
+                    GROUP BY 1, 2, 3;
+                 """
+
+        hourly_authors = """INSERT INTO command_rollup_hourly_authors (guild_id, bucket, author_id, uses)
+                            SELECT COALESCE(guild_id, 0), date_trunc('hour', used), author_id, COUNT(*)
+                            FROM commands
+                            WHERE used > (CURRENT_TIMESTAMP - $1::interval)
+                            GROUP BY 1, 2, 3;
+                         """
+
+        daily_guilds = """INSERT INTO command_rollup_daily_guilds (bucket, guild_id, uses)
+                          SELECT date_trunc('day', bucket), guild_id, SUM(uses)
+                          FROM command_rollup_hourly
+                          GROUP BY 1, 2;
+                       """
+
+        daily_authors = """INSERT INTO command_rollup_daily_authors (bucket, author_id, uses)
+                           SELECT date_trunc('day', bucket), author_id, SUM(uses)
+                           FROM command_rollup_hourly_authors
+                           GROUP BY 1, 2;
+                        """
+
+        backfilled = """INSERT INTO command_rollup_state (name) VALUES ('backfill')
+                        ON CONFLICT (name) DO UPDATE SET reached = excluded.reached;
+                     """
+
+        async with con.transaction():
+            await con.execute(truncate)
+            await con.execute(guilds)
+            await con.execute(authors)
+            await con.execute(totals)
+            await con.execute(hourly, ROLLUP_HOURLY_RETENTION)
+            await con.execute(hourly_authors, ROLLUP_HOURLY_RETENTION)
+            await con.execute(daily_guilds)
+            await con.execute(daily_authors)
+            await self.rebuild_totals(con)
+            await con.execute(backfilled)
+
+    async def rebuild_totals(self, con):
+        """Recomputes the all time guild and user totals from the other rollups.
+
+        This doesn't need the raw history, so it's also how the totals
+        are filled in on a database that had the rollups before them.
+        """
+        # a batch being written waits on the lock and adds itself on top afterwards,
+        # the rows it already put in the other rollups aren't visible to us until then
+        lock = "LOCK TABLE command_rollup_guild_totals, command_rollup_author_totals IN SHARE ROW EXCLUSIVE MODE;"
+
+        guild_totals = """INSERT INTO command_rollup_guild_totals (guild_id, uses)
+                          SELECT guild_id, SUM(uses)
+                          FROM command_rollup_guilds
+                          GROUP BY 1;
+                       """
+
+        author_totals = """INSERT INTO command_rollup_author_totals (author_id, uses)
+                           SELECT author_id, SUM(uses)
+                           FROM command_rollup_authors
+                           GROUP BY 1;
+                        """
+
+        async with con.transaction():
+            await con.execute(lock)
+            await con.execute("TRUNCATE command_rollup_guild_totals, command_rollup_author_totals;")
+            await con.execute(guild_totals)
+            await con.execute(author_totals)
+
+    @tasks.loop(hours=1.0)
+    async def rollup_maintenance(self):
+        query = "DELETE FROM command_rollup_hourly WHERE bucket < (CURRENT_TIMESTAMP - $1::interval);"
+        await self.bot.pool.execute(query, ROLLUP_HOURLY_RETENTION)
+        query = "DELETE FROM command_rollup_hourly_authors WHERE bucket < (CURRENT_TIMESTAMP - $1::interval);"
+        await self.bot.pool.execute(query, ROLLUP_HOURLY_RETENTION)
+        query = "DELETE FROM command_rollup_daily_guilds WHERE bucket < (CURRENT_TIMESTAMP - $1::interval);"
+        await self.bot.pool.execute(query, ROLLUP_HOURLY_RETENTION)
+        query = "DELETE FROM command_rollup_daily_authors WHERE bucket < (CURRENT_TIMESTAMP - $1::interval);"
+        await self.bot.pool.execute(query, ROLLUP_HOURLY_RETENTION)
+
+    @rollup_maintenance.before_loop
+    async def before_rollup_maintenance(self):
+        await self.bot.wait_until_ready()
+
+    async def snapshot_counters(self):
+        """Adds the counts made since the last snapshot to the current bucket."""
+        now = discord.utils.utcnow()
+        bucket = now - datetime.timedelta(seconds=now.timestamp() % COUNTER_SNAPSHOT_INTERVAL)
+        bucket = bucket.replace(tzinfo=None)
+
+        taken = [(counter, counter.take()) for counter in (self.bot.command_stats, self.bot.socket_stats)]
+        rows = [(counter.name, name, bucket, count) for counter, delta in taken for name, count in delta]
+        if not rows:
+            return 0
+
+        query = """INSERT INTO counter_snapshots (counter, name, bucket, count)
+                   VALUES ($1, $2, $3, $4)
+                   ON CONFLICT (counter, name, bucket) DO UPDATE
+                   SET count = counter_snapshots.count + EXCLUDED.count;
                 """
-        
-        if self._data_batch:
-            await self.bot.pool.execute(query, self._data_batch)
-            total = len(self._data_batch)
-            if total > 1:
-                log.info('Registered %s commands to database.', total)
-            self._data_batch.clear()
+        try:
+            await self.bot.pool.executemany(query, rows)
+        except Exception:
+            # they'll go in the next snapshot instead
+            for counter, delta in taken:
+                counter.give_back(delta)
+            raise
+        return len(rows)
+
+    @tasks.loop(seconds=COUNTER_SNAPSHOT_INTERVAL)
+    async def counter_snapshots(self):
+        try:
+            await self.snapshot_counters()
+        except Exception:
+            log.exception('Could not snapshot the counters.')
+
+    async def windowed_counts(self, counter, window):
+        """The counts of ``counter`` over the last ``window``, across restarts and clusters."""
+        query = """SELECT name, SUM(count) AS "count"
+                   FROM counter_snapshots
+                   WHERE counter = $1
+                   AND bucket > (CURRENT_TIMESTAMP - $2::interval)
+                   GROUP BY name;
+                """
+        records = await self.bot.pool.fetch(query, counter.name, window)
+        counts = Counter({record['name']: record['count'] for record in records})
+        # what this cluster counted since the last snapshot
+        counts.update(dict(counter.pending()))
+        return counts
 
     async def cog_unload(self):
-        self.bulk_insert_loop.stop()
+        self.rollup_maintenance.cancel()
         self.gateway_worker.cancel()
-
-    @tasks.loop(seconds=10.0)
-    async def bulk_insert_loop(self):
-        async with self._batch_lock:
-            await self.bulk_insert()
+        self.counter_snapshots.cancel()
+        self.bot.ipc.remove_handler('stats')
+        await self._data_batch.close()
+        try:
+            await self.snapshot_counters()
+        except Exception:
+            log.exception('Could not snapshot the counters on unload.')
 
     @tasks.loop(seconds=0.0)
     async def gateway_worker(self):
@@ -108,7 +434,7 @@ class Stats(commands.Cog):
             return
 
         command = ctx.command.qualified_name
-        self.bot.command_stats[command] += 1
+        self.bot.command_stats.incr(command)
         message = ctx.message
         destination = None
         if ctx.guild is None:
@@ -119,24 +445,17 @@ class Stats(commands.Cog):
             guild_id = ctx.guild.id
         
         log.info(f'{message.created_at}: {message.author} in {destination}: {message.content}')
-        async with self._batch_lock:
-            self._data_batch.append({
-                'guild': guild_id,
-                'channel': ctx.channel.id,
-                'author': ctx.author.id,
-                'used': message.created_at.isoformat(),
-                'prefix': ctx.prefix,
-                'command': command,
-                'failed': ctx.command_failed
-            })
+        # the column is a naive TIMESTAMP in UTC
+        used = message.created_at.replace(tzinfo=None)
+        await self._data_batch.put((guild_id, ctx.channel.id, ctx.author.id, used, ctx.prefix, command, ctx.command_failed))
 
     @commands.Cog.listener()
     async def on_command_completion(self, ctx):
         await self.register_command(ctx)
 
     @commands.Cog.listener()
-    async def on_socket_response(self, msg):
-        self.bot.socket_stats[msg.get('t')] += 1
+    async def on_socket_event_type(self, event_type):
+        self.bot.socket_stats.incr(event_type)
 
     @discord.utils.cached_property
     def webhook(self):
@@ -164,12 +483,20 @@ class Stats(commands.Cog):
 
     @commands.command(hidden=True)
     @commands.is_owner()
-    async def commandstats(self, ctx, limit=20):
+    async def commandstats(self, ctx, limit=20, window: time.ShortTime = None):
         """Shows command stats.
         Use a negative number for bottom instead of top.
-        This is only for the current session.
+        This is only for the current session, unless a window
+        such as 1h or 7d is given.
         """
         counter = self.bot.command_stats
+        if window is not None:
+            delta = window.dt - ctx.message.created_at
+            counter = await self.windowed_counts(counter, delta)
+
+        if not counter:
+            return await ctx.send('No commands used.')
+
         width = len(max(counter, key=len))
         total = sum(counter.values())
 
@@ -179,16 +506,84 @@ class Stats(commands.Cog):
             common = counter.most_common()[limit:]
 
         output = '\n'.join(f'{k:<{width}}: {c}' for k, c in common)
+        if window is not None:
+            minutes = delta.total_seconds() / 60
+            output = f'{total} commands ({total / minutes:.2f}/minute)\n\n{output}'
 
         await ctx.send(f'```\n{output}\n```')
 
     @commands.command(hidden=True)
-    async def socketstats(self, ctx):
-        delta = discord.utils.utcnow() - self.bot.uptime
+    @commands.is_owner()
+    async def cachestats(self, ctx, *, name: str = None):
+        """Shows the size, memory and hit rate of the registered caches.
+
+        Optionally filters to caches containing the given name.
+        """
+        caches = cache.report()
+        if name is not None:
+            caches = [c for c in caches if name.lower() in c['name'].lower()]
+
+        if not caches:
+            return await ctx.send('No caches found.')
+
+        def fmt(value):
+            return '-' if value is None else str(value)
+
+        table = formats.TabularData()
+        table.set_columns(['Cache', 'Size', 'KiB', 'Hit Rate', 'Evictions'])
+        for c in sorted(caches, key=lambda c: c['memory'], reverse=True):
+            hits, misses = c['hits'], c['misses']
+            if hits is None or hits + misses == 0:
+                rate = '-'
+            else:
+                rate = f'{hits / (hits + misses):.1%}'
+            table.add_row([c['name'], fmt(c['size']), f'{c["memory"] / 1024:.1f}', rate, fmt(c['evictions'])])
+
+        render = table.render()
+        output = f'```\n{render}\n```'
+        if len(output) > 2000:
+            fp = io.BytesIO(render.encode('utf-8'))
+            await ctx.send('Too many results...', file=discord.File(fp, 'caches.txt'))
+        else:
+            await ctx.send(output)
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def startup(self, ctx, limit: int = 15):
+        """Shows how long the extensions and warm-up tasks took at start-up."""
+        await ctx.send(f'```\n{self.bot.startup_report(limit=limit)}\n```')
+
+    @commands.command(hidden=True)
+    async def socketstats(self, ctx, window: time.ShortTime = None):
+        """Shows the gateway events received since start-up.
+
+        With a window such as 1h or 7d, shows them over that period
+        instead, across restarts and clusters.
+        """
+        if window is None:
+            delta = discord.utils.utcnow() - self.bot.uptime
+            counter = self.bot.socket_stats
+        else:
+            delta = window.dt - ctx.message.created_at
+            counter = await self.windowed_counts(self.bot.socket_stats, delta)
+
         minutes = delta.total_seconds() / 60
-        total = sum(self.bot.socket_stats.values())
+        total = sum(counter.values())
         cpm = total / minutes
-        await ctx.send(f'{total} socket events observed ({cpm:.2f}/minute):\n{self.bot.socket_stats}')
+
+        table = formats.TabularData()
+        table.set_columns(['Event', 'Count', 'Per Minute'])
+        for name, count in counter.most_common():
+            table.add_row([name, count, f'{count / minutes:.2f}'])
+
+        render = table.render()
+        header = f'{total} socket events observed ({cpm:.2f}/minute):'
+        output = f'{header}\n```\n{render}\n```'
+        if len(output) > 2000:
+            fp = io.BytesIO(render.encode('utf-8'))
+            await ctx.send(header, file=discord.File(fp, 'socketstats.txt'))
+        else:
+            await ctx.send(output)
 
     def get_bot_uptime(self, *, brief=False):
         return time.human_timedelta(self.bot.uptime, accuracy=None, brief=brief, suffix=False)
@@ -229,25 +624,26 @@ class Stats(commands.Cog):
         owner = await self.bot.get_or_fetch_member(support_guild, self.bot.owner_id)
         embed.set_author(name=str(owner), url=f"https://discord.com/users/{self.bot.owner_id}", icon_url=owner.avatar.url)
 
-        # Statistics
-        total_members = 0
-        total_unique = len(self.bot.users)
-
-        text = 0
-        voice = 0
-        guilds = 0
-        for guild in self.bot.guilds:
-            guilds += 1
-            if guild.unavailable:
-                continue
-            total_members += guild.member_count
-            for channel in guild.channels:
-                if isinstance(channel, discord.TextChannel):
-                    text += 1
-                elif isinstance(channel, discord.VoiceChannel):
-                    voice += 1
-        
-        embed.add_field(name='Members', value=f'{total_members} total\n{total_unique} unique')
+        # Statistics, summed up across the clusters
+        totals = Counter()
+        clusters = 0
+        for result in await self.bot.ipc.request('stats'):
+            if result is not None:
+                totals.update(result)
+                clusters += 1
+
+        total_members = totals['members']
+        total_unique = totals['unique']
+        text = totals['text']
+        voice = totals['voice']
+        guilds = totals['guilds']
+
+        if clusters > 1:
+            # users sharing guilds on different clusters are counted by each of them
+            unique = f'up to {total_unique} unique'
+        else:
+            unique = f'{total_unique} unique'
+        embed.add_field(name='Members', value=f'{total_members} total\n{unique}')
         embed.add_field(name='Channels', value=f'{text + voice} total\n{text} text\n{voice} voice')
 
         memory_usage = self.process.memory_full_info().uss / 1024**2
@@ -267,6 +663,26 @@ class Stats(commands.Cog):
         embed.timestamp = discord.utils.utcnow()
         await ctx.send(embed=embed)
 
+    async def ipc_stats(self, data):
+        stats = {
+            'guilds': 0,
+            'members': 0,
+            'unique': len(self.bot.users),
+            'text': 0,
+            'voice': 0,
+        }
+        for guild in self.bot.guilds:
+            stats['guilds'] += 1
+            if guild.unavailable:
+                continue
+            stats['members'] += guild.member_count
+            for channel in guild.channels:
+                if isinstance(channel, discord.TextChannel):
+                    stats['text'] += 1
+                elif isinstance(channel, discord.VoiceChannel):
+                    stats['voice'] += 1
+        return stats
+
     def censor_object(self, obj):
         if not isinstance(obj, str) and obj.id in self.bot.blocklist:
             return '[censored]'
@@ -284,7 +700,7 @@ class Stats(commands.Cog):
         embed = discord.Embed(title='Server Command Stats', colour=discord.Colour.blurple())
 
         # total command uses
-        query = "SELECT COUNT(*), MIN(used) FROM commands WHERE guild_id=$1;"
+        query = "SELECT COALESCE(SUM(uses), 0)::bigint, MIN(first_used) FROM command_rollup_guilds WHERE guild_id=$1;"
         count = await ctx.db.fetchrow(query, ctx.guild.id)
 
         embed.description = f'{count[0]} commands used.'
@@ -295,12 +711,10 @@ class Stats(commands.Cog):
 
         embed.set_footer(text='Tracking command usage since').timestamp = timestamp
 
-        query = """SELECT command,
-                          COUNT(*) as "uses"
-                   FROM commands
+        query = """SELECT command, uses
+                   FROM command_rollup_guilds
                    WHERE guild_id=$1
-                   GROUP BY command
-                   ORDER BY "uses" DESC
+                   ORDER BY uses DESC
                    LIMIT 5;
                 """
 
@@ -312,10 +726,10 @@ class Stats(commands.Cog):
         embed.add_field(name='Top Commands', value=value, inline=True)
 
         query = """SELECT command,
-                          COUNT(*) as "uses"
-                   FROM commands
+                          SUM(uses) as "uses"
+                   FROM command_rollup_hourly
                    WHERE guild_id=$1
-                   AND used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
+                   AND bucket > (CURRENT_TIMESTAMP - INTERVAL '1 day')
                    GROUP BY command
                    ORDER BY "uses" DESC
                    LIMIT 5;
@@ -328,12 +742,10 @@ class Stats(commands.Cog):
         embed.add_field(name='Top Commands Today', value=value, inline=True)
         embed.add_field(name='\u200b', value='\u200b', inline=True)
 
-        query = """SELECT author_id,
-                          COUNT(*) AS "uses"
-                   FROM commands
+        query = """SELECT author_id, uses
+                   FROM command_rollup_authors
                    WHERE guild_id=$1
-                   GROUP BY author_id
-                   ORDER BY "uses" DESC
+                   ORDER BY uses DESC
                    LIMIT 5;
                 """
 
@@ -346,10 +758,10 @@ class Stats(commands.Cog):
         embed.add_field(name='Top Command Users', value=value, inline=True)
 
         query = """SELECT author_id,
-                          COUNT(*) AS "uses"
-                   FROM commands
+                          SUM(uses) AS "uses"
+                   FROM command_rollup_hourly_authors
                    WHERE guild_id=$1
-                   AND used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
+                   AND bucket > (CURRENT_TIMESTAMP - INTERVAL '1 day')
                    GROUP BY author_id
                    ORDER BY "uses" DESC
                    LIMIT 5;
@@ -377,8 +789,8 @@ class Stats(commands.Cog):
         embed.set_author(name=str(member), icon_url=member.avatar.url)
 
         # total command uses
-        query = "SELECT COUNT(*), MIN(used) FROM commands WHERE guild_id=$1 AND author_id=$2;"
-        count = await ctx.db.fetchrow(query, ctx.guild.id, member.id)
+        query = "SELECT uses, first_used FROM command_rollup_authors WHERE guild_id=$1 AND author_id=$2;"
+        count = await ctx.db.fetchrow(query, ctx.guild.id, member.id) or (0, None)
 
         embed.description = f'{count[0]} commands used.'
         if count[1]:
@@ -439,7 +851,7 @@ class Stats(commands.Cog):
     async def stats_global(self, ctx):
         """Global all time command statistics."""
 
-        query = "SELECT COUNT(*) FROM commands;"
+        query = "SELECT COALESCE(SUM(uses), 0)::bigint FROM command_rollup_commands;"
         total = await ctx.db.fetchrow(query)
 
         e = discord.Embed(title='Command Stats', colour=discord.Colour.blurple())
@@ -453,10 +865,9 @@ class Stats(commands.Cog):
             '\N{SPORTS MEDAL}'
         )
 
-        query = """SELECT command, COUNT(*) AS "uses"
-                   FROM commands
-                   GROUP BY command
-                   ORDER BY "uses" DESC
+        query = """SELECT command, uses
+                   FROM command_rollup_commands
+                   ORDER BY uses DESC
                    LIMIT 5;
                 """
 
@@ -464,17 +875,16 @@ class Stats(commands.Cog):
         value = '\n'.join(f'{lookup[index]}: {command} ({uses} uses)' for (index, (command, uses)) in enumerate(records))
         e.add_field(name='Top Commands', value=value, inline=False)
 
-        query = """SELECT guild_id, COUNT(*) AS "uses"
-                   FROM commands
-                   GROUP BY guild_id
-                   ORDER BY "uses" DESC
+        query = """SELECT guild_id, uses
+                   FROM command_rollup_guild_totals
+                   ORDER BY uses DESC
                    LIMIT 5;
                 """
 
         records = await ctx.db.fetch(query)
         value = []
         for (index, (guild_id, uses)) in enumerate(records):
-            if guild_id is None:
+            if guild_id == 0:
                 guild = 'Private Message'
             else:
                 guild = self.censor_object(self.bot.get_guild(guild_id) or f'<Unknown {guild_id}>')
@@ -484,10 +894,9 @@ class Stats(commands.Cog):
 
         e.add_field(name='Top Guilds', value='\n'.join(value), inline=False)
 
-        query = """SELECT author_id, COUNT(*) AS "uses"
-                   FROM commands
-                   GROUP BY author_id
-                   ORDER BY "uses" DESC
+        query = """SELECT author_id, uses
+                   FROM command_rollup_author_totals
+                   ORDER BY uses DESC
                    LIMIT 5;
                 """
 
@@ -506,22 +915,15 @@ class Stats(commands.Cog):
     async def stats_today(self, ctx):
         """Global command statistics for the day."""
 
-        query = "SELECT failed, COUNT(*) FROM commands WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day') GROUP BY failed;"
-        total = await ctx.db.fetch(query)
-        failed = 0
-        success = 0
-        question = 0
-        for state, count in total:
-            if state is False:
-                success += count
-            elif state is True:
-                failed += count
-            else:
-                question += count
+        query = """SELECT COALESCE(SUM(uses), 0)::bigint, COALESCE(SUM(failed), 0)::bigint
+                   FROM command_rollup_hourly
+                   WHERE bucket > (CURRENT_TIMESTAMP - INTERVAL '1 day');
+                """
+        total, failed = await ctx.db.fetchrow(query)
+        success = total - failed
 
         e = discord.Embed(title='Last 24 Hour Command Stats', colour=discord.Colour.blurple())
-        e.description = f'{failed + success + question} commands used today. ' \
-                        f'({success} succeeded, {failed} failed, {question} unknown)'
+        e.description = f'{total} commands used today. ({success} succeeded, {failed} failed)'
 
         lookup = (
             '\N{FIRST PLACE MEDAL}',
@@ -531,9 +933,9 @@ class Stats(commands.Cog):
             '\N{SPORTS MEDAL}'
         )
 
-        query = """SELECT command, COUNT(*) AS "uses"
-                   FROM commands
-                   WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
+        query = """SELECT command, SUM(uses) AS "uses"
+                   FROM command_rollup_hourly
+                   WHERE bucket > (CURRENT_TIMESTAMP - INTERVAL '1 day')
                    GROUP BY command
                    ORDER BY "uses" DESC
                    LIMIT 5;
@@ -543,31 +945,31 @@ class Stats(commands.Cog):
         value = '\n'.join(f'{lookup[index]}: {command} ({uses} uses)' for (index, (command, uses)) in enumerate(records))
         e.add_field(name='Top Commands', value=value, inline=False)
 
-        query = """SELECT guild_id, COUNT(*) AS "uses"
-                   FROM commands
-                   WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
-                   GROUP BY guild_id
-                   ORDER BY "uses" DESC
+        # the top guilds and users are for the current UTC day, so that
+        # they come off one day's rows rather than summing 24 hours of them
+        query = """SELECT guild_id, uses
+                   FROM command_rollup_daily_guilds
+                   WHERE bucket = date_trunc('day', CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
+                   ORDER BY uses DESC
                    LIMIT 5;
                 """
 
         records = await ctx.db.fetch(query)
         value = []
         for (index, (guild_id, uses)) in enumerate(records):
-            if guild_id is None:
+            if guild_id == 0:
                 guild = 'Private Message'
             else:
                 guild = self.censor_object(self.bot.get_guild(guild_id) or f'<Unknown {guild_id}>')
             emoji = lookup[index]
             value.append(f'{emoji}: {guild} ({uses} uses)')
 
-        e.add_field(name='Top Guilds', value='\n'.join(value), inline=False)
+        e.add_field(name='Top Guilds Since 00:00 UTC', value='\n'.join(value), inline=False)
 
-        query = """SELECT author_id, COUNT(*) AS "uses"
-                   FROM commands
-                   WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
-                   GROUP BY author_id
-                   ORDER BY "uses" DESC
+        query = """SELECT author_id, uses
+                   FROM command_rollup_daily_authors
+                   WHERE bucket = date_trunc('day', CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
+                   ORDER BY uses DESC
                    LIMIT 5;
                 """
 
@@ -578,9 +980,35 @@ class Stats(commands.Cog):
             emoji = lookup[index]
             value.append(f'{emoji}: {user} ({uses} uses)')
 
-        e.add_field(name='Top Users', value='\n'.join(value), inline=False)
+        e.add_field(name='Top Users Since 00:00 UTC', value='\n'.join(value), inline=False)
         await ctx.send(embed=e)
 
+    @stats.command(name='rebuild', hidden=True)
+    @commands.is_owner()
+    async def stats_rebuild(self, ctx):
+        """Recomputes the command stats rollups from the raw command history."""
+        retention = COMMANDS_PARTITIONING.retention
+        # before the first rebuild nothing has been dropped, so there's nothing to lose
+        if retention is not None and await Commands.retention_ready(ctx.db):
+            days = retention.days
+            confirm = await ctx.prompt(f'The raw history only goes back {days} days, anything older '
+                                       'will be gone from the rollups. Rebuild anyway?')
+            if not confirm:
+                return await ctx.send('Aborting.')
+
+        async with ctx.typing():
+            await self._data_batch.flush()
+            await self.rebuild_rollups(ctx.db)
+        await ctx.send(ctx.tick(True))
+
+    @stats.command(name='totals', hidden=True)
+    @commands.is_owner()
+    async def stats_totals(self, ctx):
+        """Recomputes the all time guild and user totals from the rollups."""
+        async with ctx.typing():
+            await self.rebuild_totals(ctx.db)
+        await ctx.send(ctx.tick(True))
+
     async def send_guild_stats(self, e, guild):
         e.add_field(name='Name', value=guild.name)
         e.add_field(name='ID', value=guild.id)
@@ -737,9 +1165,56 @@ class Stats(commands.Cog):
         embed.add_field(name='Events Waiting', value=f'Total: {len(event_tasks)}', inline=False)
 
         command_waiters = len(self._data_batch)
-        is_locked = self._batch_lock.locked()
+        is_locked = self._data_batch.flushing
         description.append(f'Commands Waiting: {command_waiters}, Batch Locked: {is_locked}')
 
+        reminder = self.bot.get_cog('Reminder')
+        if reminder is not None:
+            latency = reminder.get_dispatch_stats()
+            dispatching = len(reminder._dispatching)
+            if latency is not None:
+                value = (f'Loaded: {len(reminder._pending)}, Dispatching: {dispatching}\n'
+                         f'Latency p50: {latency["p50"]:.3f}s, p99: {latency["p99"]:.3f}s, '
+                         f'max: {latency["max"]:.3f}s ({latency["count"]} fired)')
+            else:
+                value = f'Loaded: {len(reminder._pending)}, Dispatching: {dispatching}'
+            embed.add_field(name='Timers', value=value, inline=False)
+
+        caches = cache.report()
+        if caches:
+            total_memory = sum(c['memory'] for c in caches) / 1024**2
+            biggest = sorted(caches, key=lambda c: c['memory'], reverse=True)[:5]
+            lines = [f'Total: {len(caches)} ({total_memory:.2f} MiB)']
+            for c in biggest:
+                line = f'{c["name"]}: {c["size"]} entries, {c["memory"] / 1024:.1f} KiB'
+                if c['hits'] is not None and c['hits'] + c['misses']:
+                    line = f'{line}, {c["hits"] / (c["hits"] + c["misses"]):.1%} hits'
+                lines.append(line)
+            embed.add_field(name='Caches', value='\n'.join(lines), inline=False)
+
+        buffers = buffer.report()
+        if buffers:
+            lines = []
+            for b in buffers:
+                line = f'{b["name"]}: {b["depth"]} waiting, {b["rows_per_flush"]:.1f} rows/flush'
+                if b['latency'] is not None:
+                    line = f'{line}, {b["latency"][0] * 1000:.1f}ms avg, {b["latency"][1] * 1000:.1f}ms max'
+                if b['failures'] or b['dropped']:
+                    total_warnings += 1
+                    line = f'{line}, {b["failures"]} failed, {b["dropped"]} dropped'
+                lines.append(line)
+            embed.add_field(name='Write Buffers', value='\n'.join(lines), inline=False)
+
+        queries = [q for q in db.query_report() if q['calls']]
+        if queries:
+            slowest = sorted(queries, key=lambda q: q['average'], reverse=True)[:5]
+            lines = []
+            for q in slowest:
+                p95 = '>1s' if q['p95'] == float('inf') else f'<={q["p95"] * 1000:.0f}ms'
+                lines.append(f'{q["name"]}: {q["average"] * 1000:.2f}ms avg, {q["max"] * 1000:.1f}ms max, '
+                             f'p95 {p95} ({q["calls"]} calls)')
+            embed.add_field(name='Slowest Queries', value='\n'.join(lines), inline=False)
+
         memory_usage = self.process.memory_full_info().uss / 1024**2
         cpu_usage = self.process.cpu_percent() / psutil.cpu_count()
         embed.add_field(name='Process', value=f'{memory_usage:.2f} MiB\n{cpu_usage:.2f}% CPU', inline=False)
@@ -1090,11 +1565,11 @@ async def on_error(self, event, *args, **kwargs):
         pass
 
 async def setup(bot):
-    if not hasattr(bot, 'command_stats'):
-        bot.command_stats = Counter()
+    if not isinstance(getattr(bot, 'command_stats', None), counters.HotCounter):
+        bot.command_stats = counters.HotCounter('commands')
 
-    if not hasattr(bot, 'socket_stats'):
-        bot.socket_stats = Counter()
+    if not isinstance(getattr(bot, 'socket_stats', None), counters.HotCounter):
+        bot.socket_stats = counters.HotCounter('socket')
 
     cog = Stats(bot)
     await bot.add_cog(cog)
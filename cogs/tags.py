@@ -111,6 +111,21 @@ class TagLookup(db.Table, table_name='tag_lookup'):
 
         return statement + '\n' + sql
 
+# run on every tag lookup, so they're prepared up front
+
+GET_TAG = db.Query('tags.get_tag', """SELECT tags.name, tags.content
+                                      FROM tag_lookup
+                                      INNER JOIN tags ON tags.id = tag_lookup.tag_id
+                                      WHERE tag_lookup.location_id = $1 AND LOWER(tag_lookup.name) = $2;
+                                   """)
+
+SIMILAR_TAGS = db.Query('tags.similar_tags', """SELECT     tag_lookup.name
+                                                FROM       tag_lookup
+                                                WHERE      tag_lookup.location_id = $1 AND tag_lookup.name % $2
+                                                ORDER BY   similarity(tag_lookup.name, $2) DESC
+                                                LIMIT 3;
+                                             """)
+
 class TagName(commands.clean_content):
     def __init__(self, *, lower=False):
         self.lower = lower
@@ -239,21 +254,9 @@ class Tags(commands.Cog):
 
         con = connection or self.bot.pool
 
-        query = """SELECT tags.name, tags.content
-                   FROM tag_lookup
-                   INNER JOIN tags ON tags.id = tag_lookup.tag_id
-                   WHERE tag_lookup.location_id = $1 AND LOWER(tag_lookup.name) = $2;
-                """
-        row = await con.fetchrow(query, guild_id, name)
+        row = await GET_TAG.fetchrow(con, guild_id, name)
         if row is None:
-            query = """SELECT     tag_lookup.name
-                       FROM       tag_lookup
-                       WHERE      tag_lookup.location_id = $1 AND tag_lookup.name % $2
-                       ORDER BY   similarity(tag_lookup.name, $2) DESC
-                       LIMIT 3;
-                    """
-            
-            return disambiguate(await con.fetch(query, guild_id, name), name)
+            return disambiguate(await SIMILAR_TAGS.fetch(con, guild_id, name), name)
         else:
             return row
 
@@ -2,7 +2,7 @@ import datetime
 from typing import Optional
 import discord
 from discord.ext import commands
-from .utils import db
+from .utils import db, timers
 
 GUILD_ID = 718378271800033318
 CAT_ID = 775265697827127328
@@ -85,20 +85,26 @@ If there isn't a response after 12 hours, we will close the ticket automatically
         except discord.HTTPException:
             pass
 
-    @commands.Cog.listener()
+    @timers.listener
     async def on_ticket_close_timer_complete(self, timer):
         channel_id, member_id = timer.args
         await self.bot.wait_until_ready()
+        if self.guild is None:
+            # the support server lives in another cluster
+            return
         channel = self.guild.get_channel(channel_id)
         if channel is None:
             return
         msg = await channel.send('Ticket has been inactive for 12 hours. Closing...')
         await self.close_ticket(msg)
 
-    @commands.Cog.listener()
+    @timers.listener
     async def on_ticket_del_timer_complete(self, timer):
         channel_id, member_id = timer.args
         await self.bot.wait_until_ready()
+        if self.guild is None:
+            # the support server lives in another cluster
+            return
         channel = self.guild.get_channel(channel_id)
         if channel is None:
             return
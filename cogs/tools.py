@@ -4,16 +4,19 @@ from discord.ext import commands
 import io
 import re
 
-import matplotlib
-import matplotlib.figure
-import numexpr
-import numpy
-import seaborn
 import math
 import multiprocessing
 import concurrent.futures
 import asyncio
-import sympy
+
+from .utils.lazy import lazy_import, load_in_executor
+
+# these take a good second or so to import, only pay for them when they're used
+matplotlib_figure = lazy_import('matplotlib.figure')
+numexpr = lazy_import('numexpr')
+numpy = lazy_import('numpy')
+seaborn = lazy_import('seaborn')
+sympy = lazy_import('sympy')
 
 
 class Paginator(commands.Paginator):
@@ -61,12 +64,13 @@ class Tools(commands.Cog):
             equation = self.string_to_equation(equation)
         except SyntaxError as e:
             return await ctx.reply(f':no_entry: Error: {e}')
+        await load_in_executor(numpy, numexpr, matplotlib_figure)
         x = numpy.linspace(lower_limit, upper_limit, 250)
         try:
             y = numexpr.evaluate(equation)
         except Exception as e:
             return await ctx.reply(f'```py\n{e.__class__.__name__}: {e}\n```')
-        figure = matplotlib.figure.Figure()
+        figure = matplotlib_figure.Figure()
         axes = figure.add_subplot()
         try:
             axes.plot(x, y)
@@ -93,6 +97,7 @@ class Tools(commands.Cog):
     @commands.is_owner()
     async def graph_alternative(self, ctx, *, data: str):
         """WIP"""
+        await load_in_executor(seaborn)
         buffer = io.BytesIO()
         seaborn.jointplot(**eval(data)).savefig(buffer, format='PNG')
         buffer.seek(0)
@@ -192,6 +197,7 @@ class Tools(commands.Cog):
         with respect to x (dx)
         """
 
+        await load_in_executor(sympy)
         x = sympy.symbols('x')
         try:
             await ctx.reply(embed=discord.Embed(description=f'`{sympy.diff(equation.strip("`"), x)}`',
@@ -206,6 +212,7 @@ class Tools(commands.Cog):
         Integrate an equation
         with respect to x (dx)
         """
+        await load_in_executor(sympy)
         x = sympy.symbols('x')
         try:
             await ctx.reply(embed=discord.Embed(description=f'`{sympy.integrate(equation.strip("`"), x)}`',
@@ -220,6 +227,7 @@ class Tools(commands.Cog):
         Definite integral of an equation
         with respect to x (dx)
         """
+        await load_in_executor(sympy)
         x = sympy.symbols('x')
         try:
             await ctx.reply(embed=discord.Embed(
@@ -118,6 +118,15 @@ class Twitter(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.blocklisted_handles = []
+        self.stream_listener = TwitterStreamListener(bot)
+        self.blocklist_task = bot.add_warmup_task('Twitter blocklist', self.load_blocklist())
+        self.task = self.bot.loop.create_task(self.start_twitter_feeds(), name = "Start Twitter Stream")
+
+    async def load_blocklist(self):
+        # tweepy is synchronous, keep it off the event loop
+        await self.bot.loop.run_in_executor(None, self._fetch_protected_handles)
+
+    def _fetch_protected_handles(self):
         try:
             twitter_account = self.bot.twitter_api.verify_credentials()
             if twitter_account.protected:
@@ -131,12 +140,11 @@ class Twitter(commands.Cog):
                         self.blocklisted_handles.append(friend.screen_name.lower())
         except tweepy.TweepError as e:
             log.exception(f"Failed to initialize Twitter cog blocklist: {e}")
-        self.stream_listener = TwitterStreamListener(bot)
-        self.task = self.bot.loop.create_task(self.start_twitter_feeds(), name = "Start Twitter Stream")
 
     async def cog_unload(self):
         if self.stream_listener.stream:
             self.stream_listener.stream.disconnect()
+        self.blocklist_task.cancel()
         self.task.cancel()
 
     @commands.group(invoke_without_command=True)
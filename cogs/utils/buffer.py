@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import asyncpg
+
+log = logging.getLogger(__name__)
+
+# name -> WriteBuffer
+_registry = {}
+
+
+def report():
+    """Returns the :meth:`WriteBuffer.metrics` of every running buffer."""
+    return [buffer.metrics() for buffer in _registry.values()]
+
+
+class BufferFull(Exception):
+    """Raised by :meth:`WriteBuffer.put_nowait` when there's no room left."""
+
+
+class WriteBuffer:
+    """Collects rows in memory and writes them out in batches.
+
+    Rows are added with :meth:`put` and passed to ``flush``, a coroutine
+    function taking a list of rows, once ``max_size`` of them are waiting
+    or every ``interval`` seconds, whichever comes first. A batch is never
+    bigger than ``max_size`` and empty batches are never flushed.
+
+    If writing a batch fails because the database can't be reached
+    (see :attr:`RETRY_ON`) the rows are kept and retried with a backoff.
+    Any other error means the rows themselves are bad, so the batch is
+    logged and dropped rather than retried forever.
+
+    Once ``max_pending`` rows are waiting, :meth:`put` waits for a flush
+    to make room. If none does within ``put_timeout`` seconds the oldest
+    rows are dropped to make room instead.
+
+    The rows that haven't been written yet can be iterated over.
+    """
+
+    RETRY_ON = (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError)
+
+    def __init__(self, name, flush, *, interval=60.0, max_size=1000, max_pending=None, put_timeout=30.0):
+        self.name = name
+        self._flush = flush
+        self.interval = interval
+        self.max_size = max_size
+        self.max_pending = max_pending or max_size * 10
+        self.put_timeout = put_timeout
+        self._pending = []
+        self._in_flight = []
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._task = None
+
+        self.flushes = 0
+        self.rows = 0
+        self.failures = 0
+        self.dropped = 0
+        self.waits = 0
+        self._latencies = deque(maxlen=100)
+
+    def __repr__(self):
+        return f'<WriteBuffer name={self.name!r} depth={self.depth}>'
+
+    def __len__(self):
+        return self.depth
+
+    def __iter__(self):
+        yield from self._in_flight
+        yield from self._pending
+
+    @property
+    def depth(self):
+        """The rows waiting to be written, including a batch being written right now."""
+        return len(self._pending) + len(self._in_flight)
+
+    @property
+    def flushing(self):
+        return self._lock.locked()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f'WriteBuffer {self.name}')
+        _registry[self.name] = self
+        return self
+
+    async def close(self):
+        """Stops the background task and writes out whatever is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        try:
+            await self.flush()
+        except self.RETRY_ON as e:
+            log.warning('Lost %s rows for %s on close: %s', self.depth, self.name, e)
+        finally:
+            if _registry.get(self.name) is self:
+                del _registry[self.name]
+
+    def _add(self, row):
+        self._pending.append(row)
+        if len(self._pending) >= self.max_size:
+            self._wakeup.set()
+
+    def put_nowait(self, row):
+        """Adds a row without waiting, raising :exc:`BufferFull` if there's no room."""
+        if self.depth >= self.max_pending:
+            self._wakeup.set()
+            raise BufferFull(f'{self.name} has {self.depth} rows waiting to be written.')
+        self._add(row)
+
+    async def put(self, row):
+        """Adds a row, waiting for room if the buffer is full."""
+        if self.depth >= self.max_pending:
+            await self._wait_for_room()
+        self._add(row)
+
+    async def _wait_for_room(self):
+        self.waits += 1
+        self._room.clear()
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._room.wait(), self.put_timeout)
+        except asyncio.TimeoutError:
+            overflow = self.depth - self.max_pending + 1
+            if overflow > 0 and self._pending:
+                overflow = min(overflow, len(self._pending))
+                del self._pending[:overflow]
+                self.dropped += overflow
+                log.warning('Dropped the %s oldest rows of %s, the database is not keeping up.', overflow, self.name)
+
+    async def remove_if(self, predicate):
+        """Removes the rows not written yet that match ``predicate``, returning how many.
+
+        A batch being written can't be taken back, so this waits for the
+        flush in progress first. Whatever it wrote is in the database by the
+        time this returns, so delete there *after* calling this.
+        """
+        async with self._lock:
+            before = len(self._pending)
+            self._pending = [row for row in self._pending if not predicate(row)]
+            return before - len(self._pending)
+
+    async def flush(self):
+        """Writes out every waiting row right away, returning how many were written.
+
+        Raises one of :attr:`RETRY_ON` if the database couldn't be
+        reached, in which case the rows are kept for the next attempt.
+        """
+        written = 0
+        async with self._lock:
+            while self._pending:
+                batch = self._in_flight = self._pending[:self.max_size]
+                del self._pending[:self.max_size]
+                start = time.perf_counter()
+                try:
+                    await self._flush(batch)
+                except (asyncio.CancelledError, *self.RETRY_ON):
+                    # put them back in front of anything added since
+                    self._pending[:0] = batch
+                    self.failures += 1
+                    raise
+                except Exception:
+                    self.failures += 1
+                    self.dropped += len(batch)
+                    log.exception('Dropped a batch of %s rows for %s.', len(batch), self.name)
+                else:
+                    self._latencies.append(time.perf_counter() - start)
+                    self.flushes += 1
+                    self.rows += len(batch)
+                    written += len(batch)
+                finally:
+                    self._in_flight = []
+
+            self._room.set()
+        return written
+
+    async def _run(self):
+        failures = 0
+        while True:
+            if failures:
+                # don't hammer a database that's down, even if rows keep coming in
+                await asyncio.sleep(min(2 ** failures, self.interval))
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except self.RETRY_ON as e:
+                failures += 1
+                log.warning('Could not flush %s (%s rows waiting), attempt %s: %s', self.name, self.depth, failures, e)
+            else:
+                failures = 0
+
+    def metrics(self):
+        """Returns the current state of the buffer.
+
+        Returns
+        --------
+        dict
+            ``name``, ``depth``, ``flushes``, ``rows``, ``rows_per_flush``,
+            ``latency`` (average and max of the last 100 flushes, in
+            seconds, ``None`` if there were none), ``failures``,
+            ``dropped`` and ``waits`` (times :meth:`put` had to wait).
+        """
+        latencies = self._latencies
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'flushes': self.flushes,
+            'rows': self.rows,
+            'rows_per_flush': self.rows / self.flushes if self.flushes else 0.0,
+            'latency': (sum(latencies) / len(latencies), max(latencies)) if latencies else None,
+            'failures': self.failures,
+            'dropped': self.dropped,
+            'waits': self.waits,
+        }
@@ -1,19 +1,19 @@
 import inspect
 import asyncio
 import enum
+import sys
 import time
 
-from functools import wraps
+from functools import partial, wraps
 
 from lru import LRU
 from collections import OrderedDict
-from typing import Any, Callable
+from typing import Any, Callable, Optional, Tuple
 
-def _wrap_and_store_coroutine(cache, key, coro):
+def _wrap_in_flight(task):
     async def func():
-        value = await coro
-        cache[key] = value
-        return value
+        # a waiter being cancelled shouldn't cancel everyone else's result
+        return await asyncio.shield(task)
     return func()
 
 def _wrap_new_coroutine(value):
@@ -21,34 +21,291 @@ def _wrap_new_coroutine(value):
         return value
     return new_coroutine()
 
-class ExpiringCache(dict):
-    def __init__(self, seconds):
+# name -> (cache, stats, evictions, sizeof)
+_registry = {}
+
+def register(name, cache, *, stats=None, evictions=None, sizeof=None):
+    """Registers a cache so that it shows up in :func:`report`.
+
+    Registering under an existing name replaces the previous entry,
+    so caches that get rebuilt or reloaded can just register again.
+
+    Parameters
+    -----------
+    name: str
+        The name to show the cache under.
+    cache: Any
+        The cache itself. Only ``len`` is required of it.
+    stats: Optional[Callable[[], Tuple[int, int]]]
+        Returns the (hits, misses) of the cache.
+        Defaults to ``cache.get_stats`` if it exists.
+    evictions: Optional[Callable[[], int]]
+        Returns the amount of evictions so far.
+        Defaults to reading ``cache.evictions`` if it exists.
+    sizeof: Optional[Callable[[], int]]
+        Returns the memory used by the cache in bytes.
+        Defaults to :func:`estimate_size`.
+
+    Returns
+    --------
+    Any
+        The cache passed in, for convenience.
+    """
+    if stats is None:
+        stats = getattr(cache, 'get_stats', None)
+    if evictions is None and hasattr(cache, 'evictions'):
+        evictions = lambda: cache.evictions
+    _registry[name] = (cache, stats, evictions, sizeof)
+    return cache
+
+def unregister(name):
+    """Removes a cache from the registry, e.g. when its cog unloads."""
+    _registry.pop(name, None)
+
+def estimate_size(obj, *, depth=2):
+    """Roughly estimates the memory of a container and what it holds.
+
+    Only ``depth`` levels of nested containers are followed and the
+    objects at the bottom are measured shallowly.
+    """
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+
+    if hasattr(obj, 'items'):
+        try:
+            items = list(obj.items())
+        except TypeError:
+            return size
+        for k, v in items:
+            size += sys.getsizeof(k) + estimate_size(v, depth=depth - 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += estimate_size(v, depth=depth - 1)
+    return size
+
+def report():
+    """Returns the current state of every registered cache.
+
+    Returns
+    --------
+    List[dict]
+        One dict per cache with ``name``, ``size``, ``memory``, ``hits``,
+        ``misses`` and ``evictions`` keys. Anything the cache can't tell
+        is ``None``.
+    """
+    result = []
+    for name, (cache, stats, evictions, sizeof) in _registry.items():
+        try:
+            size = len(cache)
+        except TypeError:
+            size = None
+
+        hits = misses = None
+        if stats is not None:
+            hits, misses = stats()
+
+        result.append({
+            'name': name,
+            'size': size,
+            'memory': sizeof() if sizeof is not None else estimate_size(cache),
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions() if evictions is not None else None,
+        })
+    return result
+
+class ExpiringCache(OrderedDict):
+    """A dict whose entries expire a set amount of seconds after insertion.
+
+    Entries are kept in insertion order, which for a single TTL is also
+    expiry order, so only the expired head ever has to be looked at.
+    Optionally bounded by ``max_size``, evicting the oldest entries.
+    """
+
+    def __init__(self, seconds, *, max_size=None):
         self.__ttl = seconds
+        self.__max_size = max_size
+        self.__callback = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
         super().__init__()
 
+    def __evict_oldest(self):
+        key, (value, _) = super().popitem(last=False)
+        self.evictions += 1
+        if self.__callback is not None:
+            self.__callback(key, value)
+
     def __verify_cache_integrity(self):
-        # Have to do this in two steps...
-        current_time = time.monotonic()
-        to_remove = [k for (k, (v, t)) in self.items() if current_time > (t + self.__ttl)]
-        for k in to_remove:
-            del self[k]
+        deadline = time.monotonic() - self.__ttl
+        while self:
+            oldest = next(iter(self))
+            if super().__getitem__(oldest)[1] >= deadline:
+                break
+            self.__evict_oldest()
 
     def __contains__(self, key):
         self.__verify_cache_integrity()
-        return super().__contains__(key)
+        if super().__contains__(key):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
 
     def __getitem__(self, key):
         self.__verify_cache_integrity()
-        return super().__getitem__(key)
+        try:
+            value = super().__getitem__(key)[0]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
 
     def __setitem__(self, key, value):
         super().__setitem__(key, (value, time.monotonic()))
+        # a refreshed entry expires last
+        self.move_to_end(key)
+        if self.__max_size is not None and len(self) > self.__max_size:
+            self.__evict_oldest()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def get_stats(self):
+        return (self.hits, self.misses)
+
+    def set_callback(self, callback):
+        """Sets a function called with ``(key, value)`` on every eviction."""
+        self.__callback = callback
+
+class SizedLRU:
+    """An LRU mapping bounded by entry count and an estimated byte budget.
+
+    Entries expire ``ttl`` seconds after they were last touched. Since
+    every access moves an entry to the end, the least recently used
+    entry is also the first one to expire, so expiry only ever looks at
+    the head.
+    """
+
+    def __init__(self, max_size, *, max_bytes=None, ttl=None, sizeof=sys.getsizeof):
+        # key -> [value, size, last access]
+        self._data = OrderedDict()
+        self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._sizeof = sizeof
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self.total_bytes -= size
+
+    def _expire(self, now):
+        if self._ttl is None:
+            return
+
+        deadline = now - self._ttl
+        while self._data:
+            oldest = next(iter(self._data))
+            if self._data[oldest][2] >= deadline:
+                break
+            self._remove(oldest)
+            self.evictions += 1
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and (self._ttl is None or entry[2] >= time.monotonic() - self._ttl)
+
+    def __getitem__(self, key):
+        now = time.monotonic()
+        self._expire(now)
+        try:
+            entry = self._data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self.hits += 1
+        entry[2] = now
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        size = 0 if self._max_bytes is None else self._sizeof(value)
+        if key in self._data:
+            self._remove(key)
+
+        now = time.monotonic()
+        self._expire(now)
+        if self._max_bytes is not None and size > self._max_bytes:
+            return
+
+        self._data[key] = [value, size, now]
+        self.total_bytes += size
+        while len(self._data) > self._max_size or (self._max_bytes is not None and self.total_bytes > self._max_bytes):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def __delitem__(self, key):
+        self._remove(key)
+
+    def pop(self, key, *default):
+        try:
+            value = self._data[key][0]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        self._remove(key)
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self.total_bytes = 0
+
+    def get_stats(self):
+        return (self.hits, self.misses)
 
 class Strategy(enum.Enum):
     lru = 1
     raw = 2
     timed = 3
 
+_HASHABLE_BUILTINS = frozenset((int, str, bool, float, type(None)))
+
+def _true_key(o):
+    if o.__class__ in _HASHABLE_BUILTINS:
+        return o
+
+    # we don't care what 'self' parameter is, so every object using the
+    # default __repr__ collapses into its class
+    if o.__class__.__repr__ is object.__repr__:
+        return f'<{o.__class__.__module__}.{o.__class__.__name__}>'
+
+    try:
+        hash(o)
+    except TypeError:
+        return repr(o)
+    return o
+
 def cache(maxsize=128, strategy=Strategy.lru, ignore_kwargs=False):
     def decorator(func):
         if strategy is Strategy.lru:
@@ -59,31 +316,62 @@ def cache(maxsize=128, strategy=Strategy.lru, ignore_kwargs=False):
             _stats = lambda: (0, 0)
         elif strategy is Strategy.timed:
             _internal_cache = ExpiringCache(maxsize)
-            _stats = lambda: (0, 0)
+            _stats = _internal_cache.get_stats
+
+        namespace = f'{func.__module__}.{func.__qualname__}'
+
+        # keys are indexed by the first argument (skipping 'self') so that
+        # everything cached for e.g. a guild can be dropped without a scan
+        try:
+            first_param = next(iter(inspect.signature(func).parameters))
+        except (StopIteration, ValueError):
+            first_param = None
+        _prefix_length = 3 if first_param == 'self' else 2
+        _index = {}
+        _evictions = 0
+        # key -> Task for coroutines that missed and are still running
+        _in_flight = {}
 
         def _make_key(args, kwargs):
-            # this is a bit of a cluster fuck
-            # we do care what 'self' parameter is when we __repr__ it
-            def _true_repr(o):
-                if o.__class__.__repr__ is object.__repr__:
-                    return f'<{o.__class__.__module__}.{o.__class__.__name__}>'
-                return repr(o)
-
-            key = [ f'{func.__module__}.{func.__name__}' ]
-            key.extend(_true_repr(o) for o in args)
-            if not ignore_kwargs:
-                for k, v in kwargs.items():
-                    # note: this only really works for this use case in particular
-                    # I want to pass asyncpg.Connection objects to the parameters
-                    # however, they use default __repr__ and I do not care what
-                    # connection is passed in, so I needed a bypass.
-                    if k == 'connection':
-                        continue
-
-                    key.append(_true_repr(k))
-                    key.append(_true_repr(v))
-
-            return ':'.join(key)
+            if ignore_kwargs or not kwargs:
+                return (namespace, *map(_true_key, args))
+
+            key = [namespace]
+            key.extend(map(_true_key, args))
+            for k, v in kwargs.items():
+                # note: this only really works for this use case in particular
+                # I want to pass asyncpg.Connection objects to the parameters
+                # however, they use default __repr__ and I do not care what
+                # connection is passed in, so I needed a bypass.
+                if k == 'connection':
+                    continue
+
+                key.append(k)
+                key.append(_true_key(v))
+
+            return tuple(key)
+
+        def _unindex(key, value=None):
+            prefix = key[:_prefix_length]
+            try:
+                keys = _index[prefix]
+            except KeyError:
+                return
+            keys.discard(key)
+            if not keys:
+                del _index[prefix]
+
+        def _store(key, value):
+            _internal_cache[key] = value
+            _index.setdefault(key[:_prefix_length], set()).add(key)
+
+        def _evicted(key, value):
+            nonlocal _evictions
+            _evictions += 1
+            _unindex(key)
+
+        if strategy is not Strategy.raw:
+            _internal_cache.set_callback(_evicted)
 
         @wraps(func)
         def wrapper(*args, **kwargs):
@@ -91,12 +379,33 @@ def cache(maxsize=128, strategy=Strategy.lru, ignore_kwargs=False):
             try:
                 value = _internal_cache[key]
             except KeyError:
+                # somebody is already computing this, share their result
+                try:
+                    task = _in_flight[key]
+                except KeyError:
+                    pass
+                else:
+                    return _wrap_in_flight(task)
+
                 value = func(*args, **kwargs)
 
                 if inspect.isawaitable(value):
-                    return _wrap_and_store_coroutine(_internal_cache, key, value)
+                    task = asyncio.ensure_future(value)
+                    _in_flight[key] = task
+
+                    def _done(task):
+                        # only store it if it wasn't invalidated in the meantime
+                        if _in_flight.get(key) is not task:
+                            return
+                        del _in_flight[key]
+                        # exceptions propagate to the waiters but aren't cached
+                        if not task.cancelled() and task.exception() is None:
+                            _store(key, task.result())
+
+                    task.add_done_callback(_done)
+                    return _wrap_in_flight(task)
 
-                _internal_cache[key] = value
+                _store(key, value)
                 return value
             else:
                 if asyncio.iscoroutinefunction(func):
@@ -104,42 +413,95 @@ def cache(maxsize=128, strategy=Strategy.lru, ignore_kwargs=False):
                 return value
 
         def _invalidate(*args, **kwargs):
+            key = _make_key(args, kwargs)
+            _in_flight.pop(key, None)
+            _unindex(key)
             try:
-                del _internal_cache[_make_key(args, kwargs)]
+                del _internal_cache[key]
             except KeyError:
                 return False
             else:
                 return True
 
-        def _invalidate_containing(key):
-            to_remove = []
-            for k in _internal_cache.keys():
-                if key in k:
-                    to_remove.append(k)
-            for k in to_remove:
+        def _invalidate_prefix(*args):
+            """Invalidates every entry whose leading arguments match.
+
+            These are the same leading arguments the function takes, i.e.
+            ``self`` followed by the first argument for methods.
+            """
+            prefix = _make_key(args, {})
+            if len(prefix) != _prefix_length:
+                raise TypeError(f'expected {_prefix_length - 1} argument(s), got {len(args)}')
+
+            for k in [k for k in _in_flight if k[:_prefix_length] == prefix]:
+                del _in_flight[k]
+
+            keys = _index.pop(prefix, ())
+            for k in keys:
                 try:
                     del _internal_cache[k]
                 except KeyError:
                     continue
+            return len(keys)
 
         wrapper.cache = _internal_cache
         wrapper.get_key = lambda *args, **kwargs: _make_key(args, kwargs)
         wrapper.invalidate = _invalidate
         wrapper.get_stats = _stats
-        wrapper.invalidate_containing = _invalidate_containing
+        wrapper.invalidate_prefix = _invalidate_prefix
+        register(namespace, _internal_cache, stats=_stats, evictions=lambda: _evictions)
         return wrapper
     return decorator
 
 class AsyncCache:
     """
     LRU cache implementation for coroutines.
-    Once the cache exceeds the maximum size, keys are deleted in FIFO order.
+    Once the cache exceeds the maximum size or byte budget, the least recently used keys are evicted.
+    Concurrent misses for the same key share a single call to the coroutine.
     An offset may be optionally provided to be applied to the coroutine's arguments when creating the cache key.
     """
 
-    def __init__(self, max_size: int = 128):
+    def __init__(self, max_size: int = 128, *, max_bytes: Optional[int] = None,
+                 sizeof: Callable[[Any], int] = sys.getsizeof):
+        # key -> (value, size)
         self._cache = OrderedDict()
+        self._in_flight = {}
         self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def _store(self, key: Tuple, value: Any) -> None:
+        size = 0 if self._max_bytes is None else self._sizeof(value)
+        if self._max_bytes is not None and size > self._max_bytes:
+            # it'd just evict everything else and then itself
+            return
+
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+
+        self._cache[key] = (value, size)
+        self.total_bytes += size
+        while len(self._cache) > self._max_size or (self._max_bytes is not None and self.total_bytes > self._max_bytes):
+            _, (_, evicted_size) = self._cache.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def _done(self, key: Tuple, task: asyncio.Task) -> None:
+        # it was cleared in the meantime
+        if self._in_flight.get(key) is not task:
+            return
+
+        del self._in_flight[key]
+        if not task.cancelled() and task.exception() is None:
+            self._store(key, task.result())
 
     def __call__(self, arg_offset: int = 0) -> Callable:
         """Decorator for async cache."""
@@ -152,15 +514,33 @@ class AsyncCache:
                 """Decorator wrapper for the caching logic."""
                 key = args[arg_offset:]
 
-                if key not in self._cache:
-                    if len(self._cache) > self._max_size:
-                        self._cache.popitem(last=False)
+                try:
+                    value, _ = self._cache[key]
+                except KeyError:
+                    pass
+                else:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return value
 
-                    self._cache[key] = await function(*args)
-                return self._cache[key]
+                self.misses += 1
+                try:
+                    task = self._in_flight[key]
+                except KeyError:
+                    task = asyncio.ensure_future(function(*args))
+                    self._in_flight[key] = task
+                    task.add_done_callback(partial(self._done, key))
+
+                return await asyncio.shield(task)
             return wrapper
         return decorator
 
+    def get_stats(self) -> Tuple[int, int]:
+        """Returns the amount of hits and misses."""
+        return (self.hits, self.misses)
+
     def clear(self) -> None:
         """Clear cache instance."""
-        self._cache.clear()
\ No newline at end of file
+        self._cache.clear()
+        self._in_flight.clear()
+        self.total_bytes = 0
@@ -3,6 +3,8 @@ import os
 import uuid
 import asyncio
 
+from .persistence import Persister
+
 def _create_encoder(cls):
     def _default(self, o):
         if isinstance(o, cls):
@@ -12,12 +14,18 @@ def _create_encoder(cls):
     return type('_Encoder', (json.JSONEncoder,), { 'default': _default })
 
 class Config:
-    """The "database" object. Internally based on ``json``."""
+    """The "database" object. Internally based on ``json``.
+
+    Writes can be coalesced with ``save_delay`` and journaled with
+    ``journal``, see :class:`Persister`. With ``int_keys`` the keys are
+    kept as integers in memory, e.g. for ID lookups.
+    """
 
     def __init__(self, name, **options):
         self.name = name
         self.object_hook = options.pop('object_hook', None)
         self.encoder = options.pop('encoder', None)
+        self._key = int if options.pop('int_keys', False) else str
 
         try:
             hook = options.pop('hook')
@@ -29,6 +37,9 @@ class Config:
 
         self.loop = options.pop('loop', asyncio.get_event_loop())
         self.lock = asyncio.Lock()
+        journal = f'{name}.journal' if options.pop('journal', False) else None
+        self.persister = Persister(name, self._dump, delay=options.pop('save_delay', 0.0), journal=journal,
+                                   encoder=self.encoder)
         if options.pop('load_later', False):
             self.loop.create_task(self.load())
         else:
@@ -37,11 +48,17 @@ class Config:
     def load_from_file(self):
         try:
             with open(self.name, 'r') as f:
-                self._db = json.load(f, object_hook=self.object_hook)
+                db = json.load(f, object_hook=self.object_hook)
         except FileNotFoundError:
-            self._db = {}
+            db = {}
+
+        if self._key is not str:
+            db = {self._key(k): v for k, v in db.items()}
+        self._db = self.persister.replay(db, key=self._key, object_hook=self.object_hook)
 
     async def load(self):
+        # anything not written yet would be lost otherwise
+        await self.flush()
         async with self.lock:
             await self.loop.run_in_executor(None, self.load_from_file)
 
@@ -54,28 +71,42 @@ class Config:
         os.replace(temp, self.name)
 
     async def save(self):
-        async with self.lock:
-            await self.loop.run_in_executor(None, self._dump)
+        """Rewrites the whole file, e.g. after changing an entry in place."""
+        await self.persister.mark()
+
+    async def flush(self):
+        """Writes out any changes still waiting on the save delay."""
+        await self.persister.close()
 
     def get(self, key, *args):
         """Retrieves a config entry."""
-        return self._db.get(str(key), *args)
+        return self._db.get(self._key(key), *args)
 
     async def put(self, key, value, *args):
         """Edits a config entry."""
-        self._db[str(key)] = value
-        await self.save()
+        key = self._key(key)
+        self._db[key] = value
+        await self.persister.mark(('put', key, value))
 
     async def remove(self, key):
         """Removes a config entry."""
-        del self._db[str(key)]
-        await self.save()
+        key = self._key(key)
+        del self._db[key]
+        await self.persister.mark(('remove', key))
+
+    def cache_put(self, key, value):
+        """Edits an entry in memory only, for changes persisted elsewhere."""
+        self._db[self._key(key)] = value
+
+    def cache_remove(self, key):
+        """Removes an entry from memory only, for changes persisted elsewhere."""
+        self._db.pop(self._key(key), None)
 
     def __contains__(self, item):
-        return str(item) in self._db
+        return self._key(item) in self._db
 
     def __getitem__(self, item):
-        return self._db[str(item)]
+        return self._db[self._key(item)]
 
     def __len__(self):
         return len(self._db)
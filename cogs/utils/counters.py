@@ -0,0 +1,79 @@
+from array import array
+from collections.abc import Mapping
+from operator import itemgetter
+
+
+class HotCounter(Mapping):
+    """A counter for a small, mostly fixed set of keys that are counted very often.
+
+    Every key gets a slot the first time it's seen, after which counting
+    it is an index into a flat array of integers rather than a ``Counter``
+    lookup and store. It reads like a (read only) ``Counter``.
+
+    The counts made since they were last taken out with :meth:`take` are
+    what gets snapshotted to the database, see :class:`cogs.stats.Stats`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # key -> index into _counts
+        self._slots = {}
+        self._keys = []
+        self._counts = array('Q')
+        # the counts as of the last take()
+        self._taken = array('Q')
+
+    def __repr__(self):
+        return f'<HotCounter name={self.name!r} keys={len(self._keys)} total={self.total()}>'
+
+    def __getitem__(self, key):
+        slot = self._slots.get(key)
+        return 0 if slot is None else self._counts[slot]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def slot(self, key):
+        """Returns the slot of ``key``, giving it one if it doesn't have one yet."""
+        try:
+            return self._slots[key]
+        except KeyError:
+            slot = self._slots[key] = len(self._keys)
+            self._keys.append(key)
+            self._counts.append(0)
+            self._taken.append(0)
+            return slot
+
+    def incr(self, key, amount=1):
+        try:
+            self._counts[self._slots[key]] += amount
+        except KeyError:
+            self._counts[self.slot(key)] += amount
+
+    def total(self):
+        return sum(self._counts)
+
+    def most_common(self, n=None):
+        pairs = sorted(zip(self._keys, self._counts), key=itemgetter(1), reverse=True)
+        return pairs if n is None else pairs[:n]
+
+    def pending(self):
+        """The ``(key, count)`` pairs counted since the last :meth:`take`, without taking them."""
+        return [(key, count - taken) for key, count, taken in zip(self._keys, self._counts, self._taken) if count != taken]
+
+    def take(self):
+        """Takes out the counts made since the last call, as a list of ``(key, count)`` pairs.
+
+        If they can't be stored, hand them back with :meth:`give_back`
+        so the next call includes them again.
+        """
+        delta = self.pending()
+        self._taken = array('Q', self._counts)
+        return delta
+
+    def give_back(self, delta):
+        for key, count in delta:
+            self._taken[self._slots[key]] -= count
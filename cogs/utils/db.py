@@ -16,6 +16,8 @@ import json
 import os
 import pydoc
 import uuid
+import time
+import weakref
 import datetime
 import inspect
 import decimal
@@ -23,6 +25,11 @@ import asyncpg
 import logging
 import asyncio
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 log = logging.getLogger(__name__)
 
 class SchemaError(Exception):
@@ -427,6 +434,247 @@ class SchemaDiff:
 
         return '\n'.join(statements)
 
+_DISCORD_EPOCH = 1420070400000
+
+class Partitioning:
+    """Declares a table as range partitioned by time.
+
+    Pass it as the ``partition`` class keyword of a :class:`Table`.
+    The partitions are created ahead of time and expired ones dropped
+    by :meth:`Table.maintain`.
+
+    Parameters
+    -----------
+    column: str
+        The column to partition by. It's added to the primary key,
+        as PostgreSQL requires.
+    interval: str
+        How much time one partition covers, ``'day'``, ``'week'`` or ``'month'``.
+    retention: Optional[datetime.timedelta]
+        How long rows are kept. Partitions entirely older than this
+        are dropped. ``None`` keeps everything.
+    premake: int
+        How many partitions past the current one to keep around.
+    key: str
+        How the column stores time. ``'timestamp'`` for a (naive UTC)
+        ``TIMESTAMP``, ``'epoch'`` for UNIX seconds and ``'snowflake'``
+        for Discord IDs.
+    """
+
+    def __init__(self, column, *, interval='month', retention=None, premake=2, key='timestamp'):
+        if interval not in ('day', 'week', 'month'):
+            raise SchemaError('Partition interval must be day, week or month.')
+        if key not in ('timestamp', 'epoch', 'snowflake'):
+            raise SchemaError('Partition key must be timestamp, epoch or snowflake.')
+
+        self.column = column
+        self.interval = interval
+        self.retention = retention
+        self.premake = premake
+        self.key = key
+
+    def floor(self, dt):
+        """The start of the partition ``dt`` falls in."""
+        dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.interval == 'week':
+            return dt - datetime.timedelta(days=dt.weekday())
+        if self.interval == 'month':
+            return dt.replace(day=1)
+        return dt
+
+    def next(self, dt):
+        """The start of the partition after the one starting at ``dt``."""
+        if self.interval == 'day':
+            return dt + datetime.timedelta(days=1)
+        if self.interval == 'week':
+            return dt + datetime.timedelta(days=7)
+        return (dt.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+    def to_key(self, dt):
+        """Converts a naive UTC datetime to an SQL literal of the column's type."""
+        if self.key == 'timestamp':
+            return "'%s'" % dt.isoformat(sep=' ')
+
+        seconds = dt.replace(tzinfo=datetime.timezone.utc).timestamp()
+        if self.key == 'epoch':
+            return str(int(seconds))
+        return str((int(seconds * 1000) - _DISCORD_EPOCH) << 22)
+
+    def from_key(self, value):
+        """Converts a value of the column back to a naive UTC datetime."""
+        if self.key == 'timestamp':
+            return value
+
+        if self.key == 'epoch':
+            seconds = value
+        else:
+            seconds = ((value >> 22) + _DISCORD_EPOCH) / 1000
+        return datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc).replace(tzinfo=None)
+
+    def partition_name(self, table, start):
+        return '%s_p%s' % (table, start.strftime('%Y%m%d'))
+
+    def default_name(self, table):
+        return '%s_default' % table
+
+    def partition_start(self, table, name):
+        """The start of a partition going by its name, ``None`` if it's not one of ours."""
+        prefix = table + '_p'
+        if not name.startswith(prefix):
+            return None
+        try:
+            return datetime.datetime.strptime(name[len(prefix):], '%Y%m%d')
+        except ValueError:
+            return None
+
+# jsonb codecs, see Table.create_pool
+
+def _json_default(obj):
+    # naive datetimes are UTC in this code base, say so for TIMESTAMPTZ's sake
+    if isinstance(obj, datetime.datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=datetime.timezone.utc)
+        return obj.isoformat()
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+def _encode_jsonb(value):
+    return json.dumps(value, default=_json_default, separators=(',', ':'))
+
+def _decode_jsonb(value):
+    return json.loads(value)
+
+# the binary format of jsonb is its text with a version byte in front
+_JSONB_VERSION = 1
+
+if orjson is not None:
+    # datetimes come out the same as _json_default makes them
+    _ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+    def _encode_jsonb_binary(value):
+        return b'\x01' + orjson.dumps(value, default=_json_default, option=_ORJSON_OPTIONS)
+
+    def _decode_jsonb_binary(data):
+        if data[0] != _JSONB_VERSION:
+            raise ValueError(f'Unsupported jsonb version {data[0]}')
+        return orjson.loads(memoryview(data)[1:])
+
+# name -> Query
+_queries = {}
+
+def query_report():
+    """Returns the :meth:`Query.metrics` of every registered query."""
+    return [q.metrics() for q in _queries.values()]
+
+class Query:
+    """A query that's run often enough to be worth preparing up front.
+
+    Creating one registers it under its name, replacing any previous
+    query of that name, so they can just be declared at module level.
+    Every connection the pool opens prepares the registered queries in
+    its ``init`` hook, so running one skips parsing and planning.
+    Connections opened before the query was registered prepare it on
+    first use instead.
+
+    The calls and their latency are tracked, see :meth:`metrics`.
+    """
+
+    # upper bounds of the latency histogram buckets, in seconds
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float('inf'))
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * len(self.BUCKETS)
+        # connection -> PreparedStatement
+        self._statements = weakref.WeakKeyDictionary()
+        _queries[name] = self
+
+    def __repr__(self):
+        return f'<Query name={self.name!r} calls={self.calls}>'
+
+    async def prepare(self, con):
+        # pooled connections are proxies, the statements belong to the real connection
+        con = getattr(con, '_con', con)
+        statement = self._statements[con] = await con.prepare(self.sql)
+        return statement
+
+    async def _run(self, con, method, args, kwargs):
+        if isinstance(con, asyncpg.Pool):
+            async with con.acquire() as con:
+                return await self._run(con, method, args, kwargs)
+
+        statement = self._statements.get(getattr(con, '_con', con))
+        if statement is None:
+            statement = await self.prepare(con)
+
+        start = time.perf_counter()
+        try:
+            try:
+                return await getattr(statement, method)(*args, **kwargs)
+            except asyncpg.InvalidCachedStatementError:
+                # the schema changed under it
+                statement = await self.prepare(con)
+                return await getattr(statement, method)(*args, **kwargs)
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def _record(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        for index, bound in enumerate(self.BUCKETS):
+            if elapsed <= bound:
+                self.histogram[index] += 1
+                break
+
+    async def fetch(self, con, *args, timeout=None):
+        return await self._run(con, 'fetch', args, {'timeout': timeout})
+
+    async def fetchrow(self, con, *args, timeout=None):
+        return await self._run(con, 'fetchrow', args, {'timeout': timeout})
+
+    async def fetchval(self, con, *args, column=0, timeout=None):
+        return await self._run(con, 'fetchval', args, {'column': column, 'timeout': timeout})
+
+    def percentile(self, fraction):
+        """The upper bound of the histogram bucket the given fraction of calls fall under."""
+        if not self.calls:
+            return None
+        target = self.calls * fraction
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.histogram):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.BUCKETS[-1]
+
+    def metrics(self):
+        """Returns the call statistics of the query.
+
+        Returns
+        --------
+        dict
+            ``name``, ``calls``, ``average`` and ``max`` (in seconds,
+            ``None`` without calls), ``p95`` (the histogram bucket 95%
+            of the calls fall under) and ``histogram``, a list of
+            ``(upper bound, calls)`` pairs.
+        """
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'average': self.total / self.calls if self.calls else None,
+            'max': self.max if self.calls else None,
+            'p95': self.percentile(0.95),
+            'histogram': list(zip(self.BUCKETS, self.histogram)),
+        }
+
 class MaybeAcquire:
     def __init__(self, connection, *, pool):
         self.connection = connection
@@ -458,6 +706,7 @@ class TableMeta(type):
             table_name = name.lower()
 
         dct['__tablename__'] = table_name
+        partition = dct['__partition__'] = kwargs.get('partition')
 
         for elem, value in dct.items():
             if isinstance(value, Column):
@@ -469,6 +718,9 @@ class TableMeta(type):
 
                 columns.append(value)
 
+        if partition is not None and partition.column not in [c.name for c in columns]:
+            raise SchemaError('Cannot partition %s by unknown column %s.' % (table_name, partition.column))
+
         dct['columns'] = columns
         return super().__new__(cls, name, parents, dct)
 
@@ -477,7 +729,7 @@ class TableMeta(type):
 
 class Table(metaclass=TableMeta):
     @classmethod
-    async def create_pool(cls, uri, **kwargs):
+    async def create_pool(cls, uri, *, fast_json=True, **kwargs):
         """Sets up and returns the PostgreSQL connection pool that is used.
 
         .. note::
@@ -489,23 +741,36 @@ class Table(metaclass=TableMeta):
         -----------
         uri: str
             The PostgreSQL URI to connect to.
+        fast_json: bool
+            Whether to use orjson and the binary format for ``jsonb``
+            if orjson is installed. Otherwise it's the json module and
+            the text format. Either way datetimes are encoded as ISO 8601,
+            naive ones as UTC, and decoded as strings.
         \*\*kwargs
             The arguments to forward to asyncpg.create_pool.
+            The statement cache is made bigger than asyncpg's default
+            of 100, the cogs run more distinct queries than that.
         """
 
-        def _encode_jsonb(value):
-            return json.dumps(value)
+        if fast_json and orjson is not None:
+            codec = {'encoder': _encode_jsonb_binary, 'decoder': _decode_jsonb_binary, 'format': 'binary'}
+        else:
+            codec = {'encoder': _encode_jsonb, 'decoder': _decode_jsonb, 'format': 'text'}
 
-        def _decode_jsonb(value):
-            return json.loads(value)
-        
         old_init = kwargs.pop('init', None)
+        kwargs.setdefault('statement_cache_size', 512)
 
         async def init(con):
-            await con.set_type_codec('jsonb', schema='pg_catalog', encoder=_encode_jsonb, decoder=_decode_jsonb, format='text')
+            await con.set_type_codec('jsonb', schema='pg_catalog', **codec)
+            for query in list(_queries.values()):
+                try:
+                    await query.prepare(con)
+                except asyncpg.PostgresError as e:
+                    # e.g. its table isn't created yet, it's tried again on first use
+                    log.warning('Could not prepare query %s: %s', query.name, e)
             if old_init is not None:
                 await old_init(con)
-            
+
         cls._pool = pool = await asyncpg.create_pool(uri, init=init, **kwargs)
         return pool
     
@@ -659,6 +924,8 @@ class Table(metaclass=TableMeta):
                 if verbose:
                     print(sql)
                 await con.execute(sql)
+                if cls.__partition__ is not None:
+                    await cls.maintain(connection=con)
 
             # since that step passed, let's go ahead and make the migration
             with p.open('w', encoding='utf-8') as fp:
@@ -765,9 +1032,16 @@ class Table(metaclass=TableMeta):
             column_creations.append(col._create_table())
             if col.primary_key:
                 primary_keys.append(col.name)
-            
+
+        partition = cls.__partition__
+        if partition is not None and partition.column not in primary_keys:
+            # a partitioned table's primary key must contain the partition key
+            primary_keys.append(partition.column)
+
         column_creations.append('PRIMARY KEY (%s)' % ', '.join(primary_keys))
         builder.append('(%s)' % ', '.join(column_creations))
+        if partition is not None:
+            builder.append('PARTITION BY RANGE (%s)' % partition.column)
         statements.append(' '.join(builder) + ';')
 
         # handle the index creations
@@ -805,6 +1079,251 @@ class Table(metaclass=TableMeta):
         async with MaybeAcquire(connection, pool = cls._pool) as con:
             await con.execute(sql, *verified.values())
 
+    @classmethod
+    def copy_columns(cls):
+        """The columns :meth:`copy_records` expects by default, i.e. all but SERIAL ones."""
+        return [
+            column.name for column in cls.columns
+            if not (isinstance(column.column_type, Integer) and column.column_type.auto_increment)
+        ]
+
+    @classmethod
+    async def copy_records(cls, records, *, columns=None, on_conflict=None, connection=None):
+        """Bulk inserts rows using the binary COPY protocol.
+
+        This is a lot faster than ``executemany`` or ``jsonb_to_recordset``
+        for big batches, since nothing has to be serialised to text and
+        parsed again on the server.
+
+        COPY can't deal with conflicts, so with ``on_conflict`` the rows
+        are copied into a temporary staging table first and then moved
+        over with an ``INSERT ... ON CONFLICT``. Note that ``DO UPDATE``
+        fails if the same key shows up twice in one batch.
+
+        Parameters
+        -----------
+        records: Iterable[tuple]
+            The rows, with the values in the same order as ``columns``.
+            Timestamps must be naive datetimes for ``TIMESTAMP`` columns.
+        columns: Optional[List[str]]
+            The columns the values are for. Defaults to :meth:`copy_columns`.
+        on_conflict: Optional[str]
+            What goes after ``ON CONFLICT``, e.g. ``'DO NOTHING'`` or
+            ``'(guild_id, emoji_id) DO UPDATE SET ...'``.
+        connection: Optional[asyncpg.Connection]
+            The connection to use, if not provided will acquire one from
+            the internal pool.
+
+        Returns
+        --------
+        int
+            How many rows were inserted.
+        """
+
+        if columns is None:
+            columns = cls.copy_columns()
+
+        table = cls.__tablename__
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            if on_conflict is None:
+                status = await con.copy_records_to_table(table, records=records, columns=columns)
+                return int(status.split()[-1])
+
+            # temporary tables live as long as the connection, so this is only created once per connection
+            staging = '_copy_staging_%s' % table
+            names = ', '.join(columns)
+            async with con.transaction():
+                await con.execute('CREATE TEMPORARY TABLE IF NOT EXISTS {0} ON COMMIT DELETE ROWS AS '
+                                  'SELECT * FROM {1} WITH NO DATA;'.format(staging, table))
+                await con.copy_records_to_table(staging, records=records, columns=columns)
+                sql = 'INSERT INTO {0} ({1}) SELECT {1} FROM {2} ON CONFLICT {3};'.format(table, names, staging, on_conflict)
+                status = await con.execute(sql)
+                # ON COMMIT only helps once the outermost transaction is done
+                await con.execute('TRUNCATE {0};'.format(staging))
+            return int(status.split()[-1])
+
+    @classmethod
+    async def retention_ready(cls, connection):
+        """Whether the retention policy may drop rows yet.
+
+        Tables whose old rows are only kept elsewhere once something
+        else has caught up (e.g. a rollup) override this.
+        """
+        return True
+
+    @classmethod
+    async def _create_partitions(cls, con, start, end, *, existing=()):
+        # every partition from the one holding start up to premake past the one holding end
+        partition = cls.__partition__
+        table = cls.__tablename__
+        default = partition.default_name(table)
+        created = []
+
+        if default not in existing:
+            # catches anything outside the ranges, so inserts don't fail if maintenance lapses
+            await con.execute('CREATE TABLE IF NOT EXISTS {0} PARTITION OF {1} DEFAULT;'.format(default, table))
+            created.append(default)
+
+        current = partition.floor(start)
+        last = partition.floor(end)
+        for _ in range(partition.premake):
+            last = partition.next(last)
+
+        while current <= last:
+            upper = partition.next(current)
+            name = partition.partition_name(table, current)
+            if name not in existing:
+                await cls._create_partition(con, name, partition.to_key(current), partition.to_key(upper))
+                created.append(name)
+            current = upper
+        return created
+
+    @classmethod
+    async def _create_partition(cls, con, name, lower, upper):
+        partition = cls.__partition__
+        table = cls.__tablename__
+        default = partition.default_name(table)
+        bounds = 'FOR VALUES FROM ({0}) TO ({1})'.format(lower, upper)
+        in_range = '{0} >= {1} AND {0} < {2}'.format(partition.column, lower, upper)
+
+        async with con.transaction():
+            query = 'SELECT EXISTS (SELECT 1 FROM {0} WHERE {1});'.format(default, in_range)
+            if not await con.fetchval(query):
+                await con.execute('CREATE TABLE IF NOT EXISTS {0} PARTITION OF {1} {2};'.format(name, table, bounds))
+                return
+
+            # the default partition holds rows of this range, which would make
+            # creating it fail, so move them over before attaching it
+            await con.execute('CREATE TABLE {0} (LIKE {1} INCLUDING DEFAULTS);'.format(name, table))
+            await con.execute('INSERT INTO {0} SELECT * FROM {1} WHERE {2};'.format(name, default, in_range))
+            await con.execute('DELETE FROM {0} WHERE {1};'.format(default, in_range))
+            await con.execute('ALTER TABLE {0} ATTACH PARTITION {1} {2};'.format(table, name, bounds))
+
+    @classmethod
+    async def maintain(cls, *, connection=None, now=None):
+        """Creates upcoming partitions and applies the retention policy.
+
+        Tables that aren't partitioned yet are left alone, they have to
+        be converted with :meth:`partition_existing` first. Nothing is
+        dropped unless :meth:`retention_ready` says so.
+
+        Parameters
+        -----------
+        connection: Optional[asyncpg.Connection]
+            The connection to use, if not provided will acquire one from
+            the internal pool.
+        now: Optional[datetime.datetime]
+            The current naive UTC time, for testing.
+
+        Returns
+        --------
+        Optional[dict]
+            The names of the ``created`` and ``dropped`` partitions, the
+            amount of rows ``deleted`` from the default partition and
+            whether ``retained`` is on hold. ``None`` if the table isn't
+            declared as partitioned or isn't partitioned yet.
+        """
+
+        partition = cls.__partition__
+        if partition is None:
+            return None
+
+        table = cls.__tablename__
+        now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        result = {'created': [], 'dropped': [], 'deleted': 0, 'retained': False}
+
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            kind = await con.fetchval('SELECT relkind::text FROM pg_class WHERE oid = to_regclass($1);', table)
+            if kind != 'p':
+                return None
+
+            query = """SELECT c.relname
+                       FROM pg_inherits i
+                       INNER JOIN pg_class c ON c.oid = i.inhrelid
+                       WHERE i.inhparent = $1::regclass;
+                    """
+            existing = {record[0] for record in await con.fetch(query, table)}
+            result['created'] = await cls._create_partitions(con, now, now, existing=existing)
+
+            if partition.retention is None:
+                return result
+
+            if not await cls.retention_ready(con):
+                result['retained'] = True
+                return result
+
+            cutoff = now - partition.retention
+            for name in sorted(existing):
+                start = partition.partition_start(table, name)
+                if start is not None and partition.next(start) <= cutoff:
+                    await con.execute('DROP TABLE {0};'.format(name))
+                    result['dropped'].append(name)
+
+            sql = 'DELETE FROM {0} WHERE {1} < {2};'
+            status = await con.execute(sql.format(partition.default_name(table), partition.column, partition.to_key(cutoff)))
+            result['deleted'] = int(status.split()[-1])
+
+        return result
+
+    @classmethod
+    async def partition_existing(cls, *, connection=None, now=None):
+        """Converts a plain table into the partitioned one it's declared as.
+
+        The rows are copied over, except those past the retention period
+        if :meth:`retention_ready` allows dropping them, and the old table
+        is dropped. The table is locked while this runs.
+
+        Returns
+        --------
+        int
+            The amount of rows copied over.
+        """
+
+        partition = cls.__partition__
+        if partition is None:
+            raise SchemaError('%s is not declared as partitioned.' % cls.__tablename__)
+
+        table = cls.__tablename__
+        old = table + '_unpartitioned'
+        column = partition.column
+        now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            async with con.transaction():
+                await con.execute('LOCK TABLE {0} IN ACCESS EXCLUSIVE MODE;'.format(table))
+
+                # the new table's indexes want the same names
+                query = 'SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = $1;'
+                indexes = [record[0] for record in await con.fetch(query, table)]
+                await con.execute('ALTER TABLE {0} RENAME TO {1};'.format(table, old))
+                for index, name in enumerate(indexes):
+                    await con.execute('ALTER INDEX {0} RENAME TO {1}_{2};'.format(name, old, index))
+
+                await con.execute(cls.create_table(exists_ok=False))
+
+                oldest, newest = await con.fetchrow('SELECT MIN({0}), MAX({0}) FROM {1};'.format(column, old))
+                start = now if oldest is None else min(partition.from_key(oldest), now)
+                end = now if newest is None else max(partition.from_key(newest), now)
+                where = ''
+                if partition.retention is not None and await cls.retention_ready(con):
+                    start = max(start, now - partition.retention)
+                    where = 'WHERE {0} >= {1}'.format(column, partition.to_key(start))
+
+                await cls._create_partitions(con, start, end)
+
+                columns = ', '.join(c.name for c in cls.columns)
+                status = await con.execute('INSERT INTO {0} ({1}) SELECT {1} FROM {2} {3};'.format(table, columns, old, where))
+
+                # the new SERIAL columns got new sequences, which start over
+                for c in cls.columns:
+                    if isinstance(c.column_type, Integer) and c.column_type.auto_increment:
+                        sql = "SELECT setval(pg_get_serial_sequence($1, $2), COALESCE(MAX({0}), 0) + 1, false) FROM {1};"
+                        await con.fetchval(sql.format(c.name, table), table, c.name)
+
+                await con.execute('DROP TABLE {0};'.format(old))
+
+        return int(status.split()[-1])
+
     @classmethod
     def to_dict(cls):
         x = {}
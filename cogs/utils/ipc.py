@@ -0,0 +1,323 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+# A tiny message relay between cluster processes, newline delimited JSON
+# over a local (unix) socket. The launcher runs the IPCServer, every
+# cluster connects to it with an IPC client.
+#
+# There are two kinds of messages:
+#
+# - broadcasts, fire and forget, delivered to every *other* cluster
+# - requests, delivered to every cluster (including the one asking), the
+#   answers are gathered and sent back as a list ordered by cluster ID
+
+_LINE_LIMIT = 2 ** 20
+
+
+def cluster_shards(shard_count, clusters):
+    """Splits the shard IDs into ``clusters`` contiguous, near equal ranges."""
+    if clusters > shard_count:
+        raise ValueError(f'Cannot split {shard_count} shards across {clusters} clusters.')
+
+    per_cluster, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for index in range(clusters):
+        end = start + per_cluster + (index < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def _encode(payload):
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class _PendingRequest:
+    __slots__ = ('origin', 'nonce', 'expected', 'results', 'handle')
+
+    def __init__(self, origin, nonce, expected):
+        self.origin = origin
+        self.nonce = nonce
+        self.expected = expected
+        self.results = {}
+        self.handle = None
+
+
+class IPCServer:
+    """Relays broadcasts and requests between the clusters."""
+
+    def __init__(self, path, *, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self.clients = {}
+        self._pending = {}
+        self._nonces = itertools.count()
+        self._server = None
+        self._connections = set()
+
+    async def start(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_client, path=self.path, limit=_LINE_LIMIT)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+        for writer in self.clients.values():
+            writer.close()
+        # let the connection handlers see the EOF and clean up
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+    def _send(self, cluster_id, payload):
+        writer = self.clients.get(cluster_id)
+        if writer is not None and not writer.is_closing():
+            writer.write(_encode(payload))
+
+    async def _handle_client(self, reader, writer):
+        cluster_id = None
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            async for line in reader:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    log.warning('Cluster %s sent invalid JSON: %r', cluster_id, line[:100])
+                    continue
+
+                op = data.get('op')
+                if op == 'identify':
+                    cluster_id = data['cluster']
+                    self.clients[cluster_id] = writer
+                    log.info('Cluster %s connected to IPC.', cluster_id)
+                elif cluster_id is None:
+                    log.warning('Unidentified IPC client sent %r, ignoring.', op)
+                elif op == 'broadcast':
+                    payload = {'op': 'event', 'event': data['event'], 'data': data.get('data'), 'origin': cluster_id}
+                    for other in self.clients:
+                        if other != cluster_id:
+                            self._send(other, payload)
+                elif op == 'request':
+                    self._start_request(cluster_id, data)
+                elif op == 'response':
+                    self._add_response(cluster_id, data['nonce'], data.get('data'))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if cluster_id is not None and self.clients.get(cluster_id) is writer:
+                del self.clients[cluster_id]
+                log.info('Cluster %s disconnected from IPC.', cluster_id)
+                # don't leave requests waiting on an answer that won't come
+                for nonce, pending in list(self._pending.items()):
+                    if cluster_id in pending.expected:
+                        pending.expected.discard(cluster_id)
+                        self._maybe_finish(nonce)
+            writer.close()
+            self._connections.discard(task)
+
+    def _start_request(self, origin, data):
+        nonce = next(self._nonces)
+        pending = _PendingRequest(origin, data['nonce'], set(self.clients))
+        self._pending[nonce] = pending
+        timeout = data.get('timeout') or self.timeout
+        pending.handle = asyncio.get_running_loop().call_later(timeout, self._finish, nonce)
+
+        payload = {'op': 'request', 'nonce': nonce, 'event': data['event'], 'data': data.get('data'), 'origin': origin}
+        for cluster_id in pending.expected:
+            self._send(cluster_id, payload)
+
+    def _add_response(self, cluster_id, nonce, data):
+        pending = self._pending.get(nonce)
+        if pending is None:
+            # timed out already
+            return
+        pending.results[cluster_id] = data
+        self._maybe_finish(nonce)
+
+    def _maybe_finish(self, nonce):
+        pending = self._pending[nonce]
+        if pending.expected.issubset(pending.results):
+            self._finish(nonce)
+
+    def _finish(self, nonce):
+        pending = self._pending.pop(nonce, None)
+        if pending is None:
+            return
+        pending.handle.cancel()
+        results = [pending.results[key] for key in sorted(pending.results)]
+        self._send(pending.origin, {'op': 'reply', 'nonce': pending.nonce, 'data': results})
+
+
+class IPC:
+    """A cluster's connection to the other clusters.
+
+    Without a path there is only the one cluster, requests are answered
+    by the local handlers and broadcasts go nowhere, so callers never
+    need to check which mode the bot is running in.
+    """
+
+    def __init__(self, cluster_id=0, path=None, *, timeout=10.0):
+        self.cluster_id = cluster_id
+        self.path = path
+        self.timeout = timeout
+        self.handlers = {}
+        self._futures = {}
+        self._nonces = itertools.count()
+        self._reader = None
+        self._writer = None
+        self._task = None
+
+    @property
+    def clustered(self):
+        return self.path is not None
+
+    def add_handler(self, event, func):
+        """Registers a coroutine function called with the data of a request or broadcast.
+
+        For requests its return value is sent back to the requester, so it
+        must be JSON serialisable.
+        """
+        self.handlers[event] = func
+
+    def remove_handler(self, event):
+        self.handlers.pop(event, None)
+
+    async def connect(self):
+        if self.path is None:
+            return
+        await self._open()
+        self._task = asyncio.create_task(self._run(), name=f'IPC reader (cluster {self.cluster_id})')
+
+    async def _open(self):
+        reader, writer = await asyncio.open_unix_connection(self.path, limit=_LINE_LIMIT)
+        writer.write(_encode({'op': 'identify', 'cluster': self.cluster_id}))
+        await writer.drain()
+        self._reader, self._writer = reader, writer
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._drop_connection()
+
+    def _drop_connection(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        for future in self._futures.values():
+            if not future.done():
+                future.set_exception(ConnectionResetError('IPC connection lost'))
+        self._futures.clear()
+
+    async def _call(self, event, data):
+        try:
+            handler = self.handlers[event]
+        except KeyError:
+            return None
+
+        try:
+            return await handler(data)
+        except Exception:
+            log.exception('IPC handler for %r failed.', event)
+            return None
+
+    async def _respond(self, nonce, event, data):
+        result = await self._call(event, data)
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(_encode({'op': 'response', 'nonce': nonce, 'data': result}))
+
+    async def _read_loop(self):
+        async for line in self._reader:
+            data = json.loads(line)
+            op = data['op']
+            if op == 'request':
+                asyncio.create_task(self._respond(data['nonce'], data['event'], data['data']))
+            elif op == 'event':
+                asyncio.create_task(self._call(data['event'], data['data']))
+            elif op == 'reply':
+                future = self._futures.pop(data['nonce'], None)
+                if future is not None and not future.done():
+                    future.set_result(data['data'])
+
+    async def _run(self):
+        while True:
+            try:
+                await self._read_loop()
+            except (OSError, ValueError) as e:
+                log.warning('IPC connection for cluster %s failed: %s', self.cluster_id, e)
+            else:
+                log.warning('IPC connection for cluster %s closed.', self.cluster_id)
+
+            self._drop_connection()
+            await self._reconnect()
+
+    async def _reconnect(self):
+        attempt = 0
+        while True:
+            await asyncio.sleep(min(2 ** attempt, 60))
+            attempt += 1
+            try:
+                await self._open()
+            except OSError as e:
+                log.warning('Cluster %s could not reconnect to IPC (attempt %s): %s', self.cluster_id, attempt, e)
+            else:
+                log.info('Cluster %s reconnected to IPC after %s attempts.', self.cluster_id, attempt)
+                return
+
+    async def _send(self, payload):
+        # a lost connection is logged rather than raised, the reader reconnects
+        writer = self._writer
+        if writer is None or writer.is_closing():
+            return False
+        try:
+            writer.write(_encode(payload))
+            await writer.drain()
+        except OSError as e:
+            log.warning('Could not send %s over IPC: %s', payload['op'], e)
+            writer.close()
+            return False
+        return True
+
+    async def request(self, event, data=None, *, timeout=None):
+        """Asks every cluster, returning their answers ordered by cluster ID.
+
+        Clusters that don't answer in time are left out. If the other
+        clusters can't be reached at all, only this one answers.
+        """
+        if self._writer is None:
+            return [await self._call(event, data)]
+
+        timeout = timeout or self.timeout
+        nonce = next(self._nonces)
+        future = self._futures[nonce] = asyncio.get_running_loop().create_future()
+        payload = {'op': 'request', 'nonce': nonce, 'event': event, 'data': data, 'timeout': timeout}
+        try:
+            if await self._send(payload):
+                # the server times out itself and replies with what it has
+                return await asyncio.wait_for(future, timeout + 1.0)
+        except (OSError, asyncio.TimeoutError) as e:
+            log.warning('IPC request %r failed, answering locally: %r', event, e)
+        finally:
+            self._futures.pop(nonce, None)
+        return [await self._call(event, data)]
+
+    async def broadcast(self, event, data=None):
+        """Sends an event to every other cluster.
+
+        Never raises, if the connection is down the event is lost.
+        """
+        if self.path is None:
+            return
+        if not await self._send({'op': 'broadcast', 'event': event, 'data': data}):
+            log.warning('Dropped IPC broadcast %r, not connected.', event)
@@ -0,0 +1,56 @@
+import asyncio
+import importlib
+import sys
+
+# Heavy dependencies that only a couple of commands need (numpy, matplotlib,
+# PIL, ...) shouldn't be paid for by every process on start-up. A LazyModule
+# stands in for the module and imports it on first attribute access.
+
+
+class LazyModule:
+    def __init__(self, name):
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def _lazy_load(self):
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        # only called for attributes not found on the proxy itself
+        return getattr(self._lazy_load(), attr)
+
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+    def __repr__(self):
+        state = 'loaded' if self._lazy_module is not None else 'not loaded'
+        return f'<LazyModule {self._lazy_name!r} ({state})>'
+
+
+def lazy_import(name):
+    """Returns the module if it's already imported, otherwise a :class:`LazyModule` for it."""
+    try:
+        return sys.modules[name]
+    except KeyError:
+        return LazyModule(name)
+
+
+def is_loaded(module):
+    return not isinstance(module, LazyModule) or module._lazy_module is not None
+
+
+def load(module):
+    """Forces the import, e.g. to do it inside an executor rather than on the event loop."""
+    if isinstance(module, LazyModule):
+        return module._lazy_load()
+    return module
+
+
+async def load_in_executor(*modules):
+    """Imports any modules that aren't loaded yet without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    for module in modules:
+        if not is_loaded(module):
+            await loop.run_in_executor(None, load, module)
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _resolve(db, key, path):
+    # walks down nested dicts, e.g. db['participants']['1234']
+    node = db[key]
+    for part in path:
+        node = node[part]
+    return node
+
+
+class Persister:
+    """Writes a JSON "database" (see :class:`Config` and :class:`Storage`) to disk.
+
+    Every change marks the file as dirty. With a ``delay`` the write is
+    deferred by that many seconds, so a burst of changes results in one
+    write instead of one each. Without one, every change is written
+    before returning, which is how these files always behaved.
+
+    With a ``journal``, plain puts and removes are appended to a
+    journal file rather than rewriting the whole file, and the file
+    is only rewritten (compacted) once the journal grows past
+    ``compact_after`` entries or a full save is asked for. With a
+    ``compact_ratio`` it is also compacted once the journal is that
+    many times the size of the file, which keeps loading cheap.
+    """
+
+    def __init__(self, name, dump, *, delay=0.0, journal=None, compact_after=1000, compact_ratio=None, encoder=None):
+        self.name = name
+        self._dump = dump
+        self.delay = delay
+        self.journal = journal
+        self.compact_after = compact_after
+        self.compact_ratio = compact_ratio
+        self.encoder = encoder
+        self.lock = asyncio.Lock()
+        self._dirty = False
+        self._needs_dump = False
+        # path -> entry, only the last change to a path is worth writing
+        self._pending = {}
+        self._journal_size = 0
+        self._journal_bytes = 0
+        self._file_bytes = 0
+        self._task = None
+        # how many changes were asked for versus how many writes happened
+        self.changes = 0
+        self.writes = 0
+
+    def replay(self, db, *, key=str, object_hook=None):
+        """Applies the journal, if any, on top of a freshly loaded file."""
+        if self.journal is None:
+            return db
+
+        self._journal_size = self._journal_bytes = 0
+        self._file_bytes = _file_size(self.name)
+        try:
+            fp = open(self.journal, 'rb+')
+        except FileNotFoundError:
+            return db
+
+        with fp:
+            for line in fp:
+                try:
+                    op, *args = json.loads(line, object_hook=object_hook)
+                except ValueError:
+                    # a write torn by a crash, everything after it is suspect too.
+                    # cut it off so new entries don't end up glued to it
+                    log.warning('Stopped replaying %s at a corrupt entry.', self.journal)
+                    fp.truncate(self._journal_bytes)
+                    break
+
+                if op == 'put':
+                    db[key(args[0])] = args[1]
+                elif op == 'remove':
+                    db.pop(key(args[0]), None)
+                elif op == 'set':
+                    path, value = args
+                    try:
+                        if len(path) == 1:
+                            db[key(path[0])] = value
+                        else:
+                            _resolve(db, key(path[0]), path[1:-1])[path[-1]] = value
+                    except (KeyError, TypeError):
+                        log.warning('Skipped a journal entry for %r in %s, its parent is gone.', path, self.journal)
+                self._journal_size += 1
+                self._journal_bytes += len(line)
+        return db
+
+    async def mark(self, entry=None):
+        """Marks the file as changed.
+
+        ``entry`` is a journal entry, ``('put', key, value)``,
+        ``('remove', key)`` or ``('set', path, value)`` where ``path`` is
+        a list of keys into nested dicts. Without one the whole file gets
+        rewritten.
+        """
+        self.changes += 1
+        self._dirty = True
+        if entry is None or self.journal is None:
+            self._needs_dump = True
+        else:
+            path = tuple(entry[1]) if entry[0] == 'set' else (entry[1],)
+            # moving it to the end keeps it after any earlier change to a parent
+            self._pending.pop(path, None)
+            self._pending[path] = entry
+
+        if self.delay <= 0:
+            await self.flush()
+        elif self._task is None:
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self._task = None
+        await self.flush()
+
+    def _encode(self, entries):
+        # done on the event loop, the entries may hold objects that are still being changed
+        return ''.join(
+            json.dumps(entry, ensure_ascii=True, cls=self.encoder, separators=(',', ':')) + '\n'
+            for entry in entries
+        )
+
+    def _append(self, data):
+        with open(self.journal, 'a', encoding='utf-8') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def _compact(self):
+        self._dump()
+        if self.journal is not None:
+            # the file has everything now, start the journal over
+            with open(self.journal, 'w', encoding='utf-8'):
+                pass
+        return _file_size(self.name)
+
+    def _should_compact(self, entries, size):
+        if self._journal_size + entries > self.compact_after:
+            return True
+        if self.compact_ratio is None:
+            return False
+        return self._journal_bytes + size > self._file_bytes * self.compact_ratio
+
+    async def flush(self, *, compact=False):
+        """Writes any pending changes right away."""
+        async with self.lock:
+            if not self._dirty and not compact:
+                return
+
+            pending, self._pending = self._pending, {}
+            data = '' if compact or self._needs_dump else self._encode(pending.values())
+            needs_dump = compact or self._needs_dump or self._should_compact(len(pending), len(data))
+            self._dirty = self._needs_dump = False
+
+            loop = asyncio.get_running_loop()
+            try:
+                if needs_dump:
+                    self._file_bytes = await loop.run_in_executor(None, self._compact)
+                    self._journal_size = self._journal_bytes = 0
+                else:
+                    await loop.run_in_executor(None, self._append, data)
+                    self._journal_size += len(pending)
+                    self._journal_bytes += len(data)
+            except Exception:
+                # keep the changes around for the next attempt, behind any made since
+                for path, entry in self._pending.items():
+                    pending.pop(path, None)
+                    pending[path] = entry
+                self._pending = pending
+                self._dirty = True
+                self._needs_dump = self._needs_dump or needs_dump
+                raise
+            self.writes += 1
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
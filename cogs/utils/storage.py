@@ -4,6 +4,8 @@ import uuid
 import asyncio
 import datetime
 
+from .persistence import Persister
+
 
 class StorageHook(json.JSONEncoder):
     def default(self, o):
@@ -36,9 +38,16 @@ class Storage:
 
     It must subclass StorageHook and can provide a from_json
     classmethod.
+
+    Writes can be coalesced with ``save_delay`` and journaled with
+    ``journal``, see :class:`Persister`. With ``int_keys`` the keys are
+    kept as integers in memory.
     """
 
-    def __init__(self, name, *, hook=StorageHook, init=None):
+    compact_after = 1000
+    compact_ratio = None
+
+    def __init__(self, name, *, hook=StorageHook, init=None, save_delay=0.0, journal=False, int_keys=False):
         self.name = name
         if not issubclass(hook, StorageHook):
             raise TypeError('hook has to subclass StorageHook')
@@ -48,19 +57,36 @@ class Storage:
         self.loop = asyncio.get_event_loop()
         self.lock = asyncio.Lock()
         self.init = init
+        self._key = int if int_keys else str
+        journal = f'{name}.journal' if journal else None
+        self.persister = Persister(
+            name,
+            self._dump,
+            delay=save_delay,
+            journal=journal,
+            compact_after=self.compact_after,
+            compact_ratio=self.compact_ratio,
+            encoder=self.encoder,
+        )
         self.load_from_file()
 
     def load_from_file(self):
         try:
             with open(self.name, 'r') as f:
-                self._db = json.load(f, object_hook=self.object_hook)
+                db = json.load(f, object_hook=self.object_hook)
         except FileNotFoundError:
             if self.init is not None:
-                self._db = self.init()
+                db = self.init()
             else:
-                self._db = {}
+                db = {}
+
+        if self._key is not str:
+            db = {self._key(k): v for k, v in db.items()}
+        self._db = self.persister.replay(db, key=self._key, object_hook=self.object_hook)
 
     async def load(self):
+        # anything not written yet would be lost otherwise
+        await self.flush()
         async with self.lock:
             await self.loop.run_in_executor(None, self.load_from_file)
 
@@ -73,31 +99,79 @@ class Storage:
         os.replace(temp, self.name)
 
     async def save(self):
-        async with self.lock:
-            await self.loop.run_in_executor(None, self._dump)
+        """Rewrites the whole file, e.g. after changing an entry in place."""
+        await self.persister.mark()
+
+    async def touch(self, key, *path):
+        """Saves an entry that was changed in place.
+
+        ``path`` points further into nested dicts, e.g.
+        ``touch('participants', '1234')``, so with a journal only that
+        one value is written. Without a journal this is :meth:`save`.
+        """
+        key = self._key(key)
+        if not path:
+            await self.persister.mark(('put', key, self._db[key]))
+        else:
+            node = self._db[key]
+            for part in path[:-1]:
+                node = node[part]
+            await self.persister.mark(('set', [key, *path], node[path[-1]]))
+
+    async def flush(self):
+        """Writes out any changes still waiting on the save delay."""
+        await self.persister.close()
+
+    async def compact(self):
+        """Rewrites the whole file and starts the journal over."""
+        await self.persister.flush(compact=True)
 
     def get(self, key, *args):
         """Retrieves a config entry."""
-        return self._db.get(str(key), *args)
+        return self._db.get(self._key(key), *args)
 
     async def put(self, key, value, *args):
         """Edits a config entry."""
-        self._db[str(key)] = value
-        await self.save()
+        key = self._key(key)
+        self._db[key] = value
+        await self.persister.mark(('put', key, value))
 
     async def remove(self, key):
         """Removes a config entry."""
-        del self._db[str(key)]
-        await self.save()
+        key = self._key(key)
+        del self._db[key]
+        await self.persister.mark(('remove', key))
 
     def __contains__(self, item):
-        return str(item) in self._db
+        return self._key(item) in self._db
 
     def __getitem__(self, item):
-        return self._db[str(item)]
+        return self._db[self._key(item)]
 
     def __len__(self):
         return len(self._db)
 
     def all(self):
         return self._db
+
+
+class JournaledStorage(Storage):
+    """A :class:`Storage` meant for large files that change a little at a time.
+
+    Every change is appended to an operation log next to the file
+    (``<name>.journal``) instead of rewriting the file, so a write costs
+    about the size of the change. Loading reads the file and replays the
+    log on top of it.
+
+    The file is rewritten (compacted) and the log emptied once the log
+    is bigger than the file itself, so it never costs more than twice a
+    plain load.
+
+    Entries changed in place should be saved with :meth:`touch`.
+    """
+
+    compact_after = 100_000
+    compact_ratio = 1.0
+
+    def __init__(self, name, *, hook=StorageHook, init=None, save_delay=0.0, int_keys=False):
+        super().__init__(name, hook=hook, init=init, save_delay=save_delay, journal=True, int_keys=int_keys)
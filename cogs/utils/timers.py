@@ -0,0 +1,22 @@
+from discord.ext import commands
+import functools
+
+
+def listener(func):
+    """Like ``commands.Cog.listener()``, for an ``on_<event>_timer_complete`` listener.
+
+    The listener waits for one of the Reminder cog's dispatch slots before
+    running, so no more than ``Reminder.MAX_CONCURRENT_DISPATCH`` timers are
+    handled at once however many expire together. Without the Reminder cog
+    loaded it runs straight away.
+    """
+
+    @functools.wraps(func)
+    async def wrapped(self, timer):
+        reminder = self.bot.get_cog('Reminder')
+        if reminder is None:
+            return await func(self, timer)
+        async with reminder.dispatch_slot():
+            return await func(self, timer)
+
+    return commands.Cog.listener()(wrapped)
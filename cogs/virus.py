@@ -386,7 +386,8 @@ class Virus(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.storage = storage.Storage('virus.json', hook=VirusStorageHook, init=self.init_storage)
+        # participants change on nearly every message, so only the changed ones get written
+        self.storage = storage.JournaledStorage('virus.json', hook=VirusStorageHook, init=self.init_storage, save_delay=1.0)
         # last 5 (unique) authors of a message
         # these are Participant instances
         self._authors = defaultdict(lambda: UniqueCappedList(maxlen=5))
@@ -396,6 +397,7 @@ class Virus(commands.Cog):
 
     async def cog_unload(self):
         self._task.cancel()
+        await self.storage.flush()
 
     def init_storage(self):
         from .data import items
@@ -441,9 +443,15 @@ class Virus(commands.Cog):
                 raise VirusError('The evangelist cannot participate.')
 
             participants[string_id] = participant = Participant(member_id=member_id)
-            await self.storage.put('participants', participants)
+            await self.storage.touch('participants', string_id)
             return participant
 
+    async def save_participants(self, *users, stats=False):
+        for user in users:
+            await self.storage.touch('participants', str(user.member_id))
+        if stats:
+            await self.storage.touch('stats')
+
     async def day_cycle(self):
         if self.storage.get('next_cycle') is None:
             await self._timer_has_data.wait()
@@ -505,7 +513,7 @@ class Virus(commands.Cog):
             finally:
                 participants[str(member.id)] = p = Participant(member_id=member.id, healer=True)
 
-        await self.storage.save()
+        await self.save_participants(*(participants[str(m.id)] for m in infected_ret | healers_ret), stats=True)
 
         infected_mentions = [str(m) for m in infected_ret]
         healer_mentions = [str(m) for m in healers_ret]
@@ -551,11 +559,10 @@ class Virus(commands.Cog):
 
             if user.is_infectious():
                 died = user.add_sickess(15)
+                await self.save_participants(user)
                 if died is State.dead:
                     await self.kill(user)
 
-        await self.storage.save()
-
     def get_member(self, member_id):
         guild = self.bot.get_guild(GUILD_ID)
         return guild.get_member(member_id)
@@ -566,7 +573,7 @@ class Virus(commands.Cog):
 
     async def infect(self, user: Participant):
         self.storage['stats'].infected += user.infect()
-        await self.storage.save()
+        await self.save_participants(user, stats=True)
 
         member = self.get_member(user.member_id)
         if member is not None:
@@ -585,18 +592,18 @@ class Virus(commands.Cog):
             return await self.process_state(state, user)
 
         user.infect(force=True)
-        await self.storage.save()
+        await self.save_participants(user, stats=True)
         await self.send_reinfect_message(user)
 
     async def kill(self, user: Participant):
         self.storage['stats'].dead += user.kill()
-        await self.storage.save()
+        await self.save_participants(user, stats=True)
         await self.send_dead_message(user)
 
     async def cure(self, user: Participant):
         user.sickness = 0
         self.storage['stats'].cured += 1
-        await self.storage.save()
+        await self.save_participants(user, stats=True)
         await self.send_cured_message(user)
 
     async def potentially_infect(self, channel_id, participant: Participant):
@@ -636,10 +643,9 @@ class Virus(commands.Cog):
                 roll = random.random()
                 if roll < 0.1:
                     state = p.add_sickness(int(-(base * (1 - p.sickness_rate / 100))))
+                    await self.save_participants(p)
                     await self.process_state(state, p, cause=healer)
 
-        await self.storage.save()
-
     async def apply_sickness_to_all(self, channel: discord.TextChannel, sickness, *, cause=None):
         # A helper function to help apply a sickness to all
         # recent people in a channel (i.e. an area)
@@ -652,10 +658,9 @@ class Virus(commands.Cog):
             participant = await self.get_participant(author.id)
             if participant.is_infectious():
                 state = participant.add_sickness(sickness)
+                await self.save_participants(participant)
                 await self.process_state(state, participant, cause=cause)
 
-        await self.storage.save()
-
     async def send_dead_message(self, participant):
         total = self.storage['stats'].dead
 
@@ -760,7 +765,7 @@ class Virus(commands.Cog):
     async def vaccinate(self, user: Participant):
         user.sickness = 0
         self.storage['stats'].vaccinated += 1
-        await self.storage.save()
+        await self.save_participants(user, stats=True)
         vaccinated = self.storage['stats'].vaccinated
 
         if vaccinated in VACCINE_MILESTONES:
@@ -796,6 +801,7 @@ class Virus(commands.Cog):
             if user.immune_until is None or user.immune_until < message.created_at:
                 state = user.add_sickness()
                 await self.process_state(state, user)
+                await self.save_participants(user)
 
         self._authors[message.channel.id].append(user)
 
@@ -849,7 +855,8 @@ class Virus(commands.Cog):
             return await ctx.send(random.choice(dialogue))
 
         user.buy(item)
-        await self.storage.save()
+        await self.save_participants(user)
+        await self.storage.touch('store')
         await ctx.send(f'Alright {ctx.author.mention}, you bought {item.emoji}. Check your backpack.')
 
     @shop_buy.error
@@ -877,7 +884,7 @@ class Virus(commands.Cog):
                 elif ctx.invoked_with == 'lock':
                     item.unlocked = False
 
-        await self.storage.save()
+        await self.storage.touch('store')
         await ctx.send('\n'.join(status))
 
     @shop.command(name='refresh')
@@ -988,7 +995,7 @@ class Virus(commands.Cog):
             except discord.HTTPException:
                 pass
             finally:
-                await self.storage.save()
+                await self.save_participants(user, stats=True)
                 await self.send_healer_message(user)
         elif state is State.reinfect:
             if cause is not None:
@@ -1007,7 +1014,7 @@ class Virus(commands.Cog):
             except discord.HTTPException:
                 pass
             finally:
-                await self.storage.save()
+                await self.save_participants(user, stats=True)
                 await self.send_healer_remove_message(user)
 
     @backpack.command(name='use')
@@ -1042,7 +1049,7 @@ class Virus(commands.Cog):
             return await ctx.send("Can't let you do that chief.")
 
         state = await user.use(ctx, item)
-        await self.storage.save()
+        await self.save_participants(user)
 
         if state is State.already_dead:
             return await ctx.send("The dead can't use items...")
@@ -1104,7 +1111,7 @@ class Virus(commands.Cog):
             except discord.HTTPException:
                 pass
             finally:
-                await self.storage.save()
+                await self.save_participants(user, stats=True)
                 await self.send_healer_message(user)
         elif ctx.invoked_with == 'kill':
             await self.kill(user)
@@ -1182,6 +1189,7 @@ class Virus(commands.Cog):
         other = await self.get_participant(member.id)
         state = user.heal(other)
         await self.process_state(state, other, member=member, cause=user)
+        await self.save_participants(user, other, stats=True)
         dialogue = [
             (2, '*some sound effect*'),
             (7, 'Congrats, seems like this might have done something.'),
@@ -1225,7 +1233,7 @@ class Virus(commands.Cog):
         await self.process_state(other.hug(user), other, cause=user)
         user.pda_cooldown = dt + datetime.timedelta(hours=1)
 
-        await self.storage.save()
+        await self.save_participants(user, other)
 
         dialogue = [
             (2, "Aw isn't that cute. You hugged someone!"),
@@ -1267,7 +1275,8 @@ class Virus(commands.Cog):
         item.in_stock = 10
         item.total = 10
         item.unlocked = True
-        await self.storage.save()
+        await self.save_participants(user)
+        await self.storage.touch('store')
         await self.log_channel.send(f'\N{CHEERING MEGAPHONE} {ctx.author.mention} seems to have found a cure? '
                                     f'Check the store.')
 
@@ -2,14 +2,18 @@ import sys
 import click
 import logging
 import asyncio
+import aiohttp
 import asyncpg
 import discord
 import importlib
 import contextlib
+import multiprocessing
 import os
+import subprocess
 
 from bot import RoboVJ, initial_extensions
 from cogs.utils.db import Table
+from cogs.utils.ipc import IPCServer, cluster_shards
 
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
@@ -37,7 +41,7 @@ class RemoveNoise(logging.Filter):
         return True
 
 @contextlib.contextmanager
-def setup_logging():
+def setup_logging(cluster_id=None):
     try:
         # __enter__
         max_bytes = 32 * 1024 * 1024 # 32 MiB
@@ -47,7 +51,8 @@ def setup_logging():
 
         log = logging.getLogger()
         log.setLevel(logging.INFO)
-        handler = RotatingFileHandler(filename='robovj.log', encoding='utf-8', mode='w', maxBytes=max_bytes, backupCount=5)
+        filename = 'robovj.log' if cluster_id is None else f'robovj-{cluster_id}.log'
+        handler = RotatingFileHandler(filename=filename, encoding='utf-8', mode='w', maxBytes=max_bytes, backupCount=5)
         dt_fmt = '%Y-%m-%d %H:%M:%S'
         fmt = logging.Formatter('[{asctime}] [{levelname:<7}] {name}: {message}', dt_fmt, style='{')
         handler.setFormatter(fmt)
@@ -61,12 +66,12 @@ def setup_logging():
             hdlr.close()
             log.removeHandler(hdlr)
 
-async def run_bot():
+async def run_bot(*, cluster_id=None, shard_ids=None, shard_count=None, ipc_path=None, pool_size=20):
     log = logging.getLogger()
     kwargs = {
         'command_timeout': 60,
-        'max_size': 20,
-        'min_size': 20
+        'max_size': pool_size,
+        'min_size': pool_size
     }
     try:
         pool = await Table.create_pool(config.postgresql, **kwargs)
@@ -75,18 +80,80 @@ async def run_bot():
         log.exception('Could not set up PostgreSQL. Exiting.')
         return
 
-    bot = RoboVJ()
+    bot = RoboVJ(cluster_id=cluster_id, ipc_path=ipc_path, shard_ids=shard_ids, shard_count=shard_count)
     bot.pool = pool
     await bot.start()
 
+async def fetch_recommended_shards():
+    headers = {'Authorization': f'Bot {config.token}'}
+    async with aiohttp.ClientSession() as session:
+        async with session.get('https://discord.com/api/v10/gateway/bot', headers=headers) as resp:
+            data = await resp.json()
+            return data['shards']
+
+def run_cluster(cluster_id, shard_ids, shard_count, ipc_path, pool_size):
+    # entry point of a cluster process
+    with setup_logging(cluster_id):
+        asyncio.run(run_bot(cluster_id=cluster_id, shard_ids=shard_ids, shard_count=shard_count,
+                            ipc_path=ipc_path, pool_size=pool_size))
+
+async def run_clusters(clusters, shard_count=None):
+    log = logging.getLogger()
+    if shard_count is None:
+        shard_count = await fetch_recommended_shards()
+
+    ranges = cluster_shards(shard_count, clusters)
+    ipc_path = getattr(config, 'ipc_path', os.path.join(__dirname__, 'robovj-ipc.sock'))
+    server = IPCServer(ipc_path)
+    await server.start()
+
+    # each cluster gets its own pool, keep the total about the same
+    pool_size = max(4, 20 // clusters)
+    context = multiprocessing.get_context('spawn')
+    processes = {}
+
+    def spawn(cluster_id):
+        args = (cluster_id, ranges[cluster_id], shard_count, ipc_path, pool_size)
+        process = context.Process(target=run_cluster, args=args, name=f'cluster-{cluster_id}')
+        process.start()
+        processes[cluster_id] = process
+        log.info('Started cluster %s (PID %s) with shards %s.', cluster_id, process.pid, ranges[cluster_id])
+
+    for cluster_id in range(clusters):
+        spawn(cluster_id)
+
+    try:
+        while processes:
+            await asyncio.sleep(5)
+            for cluster_id, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                if process.exitcode == 0:
+                    log.info('Cluster %s shut down.', cluster_id)
+                    del processes[cluster_id]
+                else:
+                    log.warning('Cluster %s exited with code %s, restarting.', cluster_id, process.exitcode)
+                    spawn(cluster_id)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(10)
+        await server.close()
+
 @click.group(invoke_without_command=True, options_metavar='[options]')
+@click.option('--clusters', help='how many processes to split the shards across', default=1)
+@click.option('--shards', 'shard_count', help='total shard count, defaults to what Discord recommends', type=int)
 @click.pass_context
-def main(ctx):
+def main(ctx, clusters, shard_count):
     """Launches the bot"""
     if ctx.invoked_subcommand is None:
         loop = asyncio.get_event_loop()
         with setup_logging():
-            asyncio.run(run_bot())
+            if clusters > 1:
+                asyncio.run(run_clusters(clusters, shard_count))
+            else:
+                asyncio.run(run_bot(shard_count=shard_count))
 
 @main.group(short_help='database stuff', options_metavar='[options]')
 def db():
@@ -229,6 +296,71 @@ async def remove_databases(pool, cog, quiet):
             await tr.commit()
             click.echo(f'successfully removed {cog} tables.')
 
+@db.command(short_help='maintains the partitioned tables', options_metavar='[options]')
+@click.argument('cogs', nargs=-1, metavar='[cogs]')
+@click.option('--convert', help='turn existing plain tables into partitioned ones', is_flag=True)
+@click.option('-q', '--quiet', help='less verbose output', is_flag=True)
+def maintain(cogs, convert, quiet):
+    """Creates upcoming partitions and drops the ones past their retention.
+
+    The bot does this on its own every few hours, this is for doing
+    it by hand, e.g. after a long downtime.
+
+    Tables created before they were declared as partitioned are left
+    alone unless --convert is given, which converts them first. This
+    copies every row that's still within the retention period and
+    locks the table while doing so, so stop the bot first.
+    """
+
+    run = asyncio.get_event_loop().run_until_complete
+    try:
+        run(Table.create_pool(config.postgresql))
+    except Exception:
+        click.echo(f'Could not create PostgreSQL connection pool.\n{traceback.format_exc()}', err=True)
+        return
+
+    if not cogs:
+        cogs = initial_extensions
+    else:
+        cogs = [f'cogs.{e}' if not e.startswith('cogs') else e for e in cogs]
+
+    for ext in cogs:
+        try:
+            importlib.import_module(ext)
+        except Exception:
+            click.echo(f'Could not load {ext}.\n{traceback.format_exc()}', err=True)
+            return
+
+    for table in Table.all_tables():
+        if table.__partition__ is None:
+            continue
+
+        name = f'[{table.__module__}] {table.__tablename__}'
+        try:
+            kind = run(Table._pool.fetchval('SELECT relkind::text FROM pg_class WHERE oid = to_regclass($1);', table.__tablename__))
+            if kind is None:
+                click.echo(f'{name}: does not exist, run db init first.')
+                continue
+            if kind == 'r':
+                if not convert:
+                    click.echo(f'{name}: not partitioned yet, run with --convert to convert it.')
+                    continue
+                copied = run(table.partition_existing())
+                click.echo(f'{name}: converted, copied {copied} rows.')
+            result = run(table.maintain())
+        except Exception:
+            click.echo(f'Could not maintain {table.__tablename__}.\n{traceback.format_exc()}', err=True)
+            continue
+
+        if result is None:
+            continue
+        if result['retained']:
+            click.echo(f'{name}: retention is on hold until its history is backfilled, nothing was dropped.')
+        if not quiet or result['created'] or result['dropped'] or result['deleted']:
+            created = ', '.join(result['created']) or 'none'
+            dropped = ', '.join(result['dropped']) or 'none'
+            click.echo(f'{name}: created {created}; dropped {dropped}; deleted {result["deleted"]} rows.')
+
 @db.command(short_help="removes a cog's table", options_metavar='[options]')
 @click.argument('cog',  metavar='<cog>')
 @click.option('-q', '--quiet', help='less verbose output', is_flag=True)
@@ -262,5 +394,72 @@ def drop(cog, quiet):
 
     run(remove_databases(pool, cog, quiet))
 
+_IMPORTTIME_SCRIPT = """
+import importlib, sys
+for name in sys.argv[1:]:
+    sys.stderr.write(f'@@ {name}\\n')
+    try:
+        importlib.import_module(name)
+    except Exception as e:
+        sys.stderr.write(f'!! {e!r}\\n')
+"""
+
+def parse_importtime(output):
+    """Splits ``-X importtime`` output into per-module sections.
+
+    Each import is only reported by the first module that pulls it in,
+    so a section's cost is what that module adds on top of the earlier ones.
+    """
+    sections = {}
+    current = None
+    for line in output.splitlines():
+        if line.startswith('@@ '):
+            current = sections[line[3:]] = {'total': 0, 'packages': {}, 'error': None}
+        elif line.startswith('!! ') and current is not None:
+            current['error'] = line[3:]
+        elif line.startswith('import time:') and current is not None:
+            self_us, _, name = line[len('import time:'):].split('|')
+            try:
+                self_us = int(self_us)
+            except ValueError:
+                # the header line
+                continue
+            package = name.strip().split('.', 1)[0]
+            current['total'] += self_us
+            current['packages'][package] = current['packages'].get(package, 0) + self_us
+    return sections
+
+@main.command(short_help='profiles import time per cog', options_metavar='[options]')
+@click.argument('cogs', nargs=-1, metavar='[cogs]')
+@click.option('-n', '--limit', help='how many packages to show per cog', default=5)
+@click.option('--min-ms', help='hide cogs cheaper than this', default=0.0)
+def importtime(cogs, limit, min_ms):
+    """Reports how long each cog takes to import, like -X importtime but per cog.
+
+    The imports happen in a fresh interpreter, bot.py first and then every
+    cog in order.
+    """
+    if not cogs:
+        cogs = sorted(initial_extensions)
+    else:
+        cogs = [f'cogs.{e}' if not e.startswith('cogs') else e for e in cogs]
+
+    args = [sys.executable, '-X', 'importtime', '-c', _IMPORTTIME_SCRIPT, 'bot', *cogs]
+    proc = subprocess.run(args, cwd=__dirname__, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True)
+    sections = parse_importtime(proc.stderr)
+
+    total = sum(section['total'] for section in sections.values())
+    click.echo(f'Imported bot.py and {len(sections) - 1} cogs in {total / 1000:.0f}ms.')
+    for name, section in sorted(sections.items(), key=lambda t: t[1]['total'], reverse=True):
+        ms = section['total'] / 1000
+        if ms < min_ms:
+            continue
+        click.echo(f'{name:<24} {ms:>8.1f}ms')
+        if section['error']:
+            click.echo(f'    failed: {section["error"]}')
+        packages = sorted(section['packages'].items(), key=lambda t: t[1], reverse=True)[:limit]
+        for package, us in packages:
+            click.echo(f'    {package:<20} {us / 1000:>8.1f}ms')
+
 if __name__ == '__main__':
     main()
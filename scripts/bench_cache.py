@@ -0,0 +1,103 @@
+"""Microbenchmark for the key scheme used by ``cogs.utils.cache.cache``.
+
+Compares the old ``repr``-joined string keys (with a substring scan for
+per-guild invalidation) against the tuple keys and first-argument index.
+
+Usage: python scripts/bench_cache.py [sizes...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lru import LRU
+from cogs.utils import cache
+
+GUILDS = 1000
+LOOKUPS = 100_000
+
+
+class Cog:
+    def get_config(self, guild_id, member_id):
+        return guild_id ^ member_id
+
+
+def legacy_cache(maxsize):
+    # the previous implementation, minus the parts that aren't measured
+    def decorator(func):
+        internal = LRU(maxsize)
+
+        def _true_repr(o):
+            if o.__class__.__repr__ is object.__repr__:
+                return f'<{o.__class__.__module__}.{o.__class__.__name__}>'
+            return repr(o)
+
+        def _make_key(args):
+            key = [f'{func.__module__}.{func.__name__}']
+            key.extend(_true_repr(o) for o in args)
+            return ':'.join(key)
+
+        def wrapper(*args):
+            key = _make_key(args)
+            try:
+                return internal[key]
+            except KeyError:
+                value = internal[key] = func(*args)
+                return value
+
+        def invalidate_guild(cog, guild_id):
+            needle = f'{guild_id!r}:'
+            to_remove = [k for k in internal.keys() if needle in k]
+            for k in to_remove:
+                del internal[k]
+
+        wrapper.cache = internal
+        wrapper.invalidate_guild = invalidate_guild
+        return wrapper
+    return decorator
+
+
+def current_cache(maxsize):
+    def decorator(func):
+        wrapper = cache.cache(maxsize=maxsize)(func)
+        wrapper.invalidate_guild = wrapper.invalidate_prefix
+        return wrapper
+    return decorator
+
+
+def run(name, factory, size):
+    cached = factory(size)(Cog.get_config)
+    cog = Cog()
+    members = size // GUILDS
+    for guild_id in range(GUILDS):
+        for member_id in range(members):
+            cached(cog, guild_id, member_id)
+
+    calls = [(i % GUILDS, i % members) for i in range(LOOKUPS)]
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for guild_id, member_id in calls:
+            cached(cog, guild_id, member_id)
+        best = min(best, time.perf_counter() - start)
+    lookup = best / LOOKUPS * 1e9
+
+    start = time.perf_counter()
+    for guild_id in range(100):
+        cached.invalidate_guild(cog, guild_id)
+    invalidate = (time.perf_counter() - start) / 100 * 1e6
+
+    print(f'{name:<8} {size:>8} {lookup:>12.0f} ns {invalidate:>14.1f} us')
+
+
+def main(sizes):
+    print(f'{"scheme":<8} {"entries":>8} {"lookup (hit)":>15} {"invalidate guild":>17}')
+    for size in sizes:
+        run('legacy', legacy_cache, size)
+        run('current', current_cache, size)
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [10_000, 100_000])
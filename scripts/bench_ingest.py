@@ -0,0 +1,126 @@
+"""Benchmark for the bulk insert paths used by the write buffers.
+
+Inserts rows shaped like the ``commands`` table with:
+
+- ``executemany`` of a single row INSERT (how ``message_log`` was written)
+- ``jsonb_to_recordset`` of a JSON array (how ``commands`` was written)
+- binary COPY (``Table.copy_records``)
+- binary COPY into a staging table, then ``INSERT ... ON CONFLICT DO NOTHING``
+
+It creates and drops a ``bench_ingest`` table, so point it at a scratch
+database. Uses ``config.postgresql`` unless a URI is given.
+
+Usage: python scripts/bench_ingest.py [--uri URI] [sizes...]
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.utils import db
+
+REPEAT = 3
+
+
+class BenchIngest(db.Table, table_name='bench_ingest'):
+    id = db.PrimaryKeyColumn()
+
+    guild_id = db.Column(db.Integer(big=True), index=True)
+    channel_id = db.Column(db.Integer(big=True))
+    author_id = db.Column(db.Integer(big=True), index=True)
+    used = db.Column(db.Datetime, index=True)
+    prefix = db.Column(db.String)
+    command = db.Column(db.String, index=True)
+    failed = db.Column(db.Boolean, index=True)
+
+
+def make_rows(count):
+    now = datetime.datetime.utcnow()
+    commands = ['help', 'tag', 'tag create', 'remind', 'about', 'ping', 'jsk py']
+    return [
+        (random.getrandbits(62), random.getrandbits(62), random.getrandbits(62),
+         now - datetime.timedelta(seconds=i), '?', random.choice(commands), random.random() < 0.05)
+        for i in range(count)
+    ]
+
+
+async def bench_executemany(con, rows):
+    query = """INSERT INTO bench_ingest (guild_id, channel_id, author_id, used, prefix, command, failed)
+               VALUES ($1, $2, $3, $4, $5, $6, $7);"""
+    await con.executemany(query, rows)
+
+
+async def bench_jsonb(con, rows):
+    query = """INSERT INTO bench_ingest (guild_id, channel_id, author_id, used, prefix, command, failed)
+               SELECT x.guild, x.channel, x.author, x.used, x.prefix, x.command, x.failed
+               FROM jsonb_to_recordset($1::jsonb) AS
+               x(guild BIGINT, channel BIGINT, author BIGINT, used TIMESTAMP, prefix TEXT, command TEXT, failed BOOLEAN)
+            """
+    # the serialisation by the jsonb codec is part of the cost, the bot pays it too
+    data = [
+        {'guild': g, 'channel': c, 'author': a, 'used': u, 'prefix': p, 'command': cmd, 'failed': f}
+        for g, c, a, u, p, cmd, f in rows
+    ]
+    await con.execute(query, data)
+
+
+async def bench_copy(con, rows):
+    await BenchIngest.copy_records(rows, connection=con)
+
+
+async def bench_copy_staging(con, rows):
+    await BenchIngest.copy_records(rows, on_conflict='DO NOTHING', connection=con)
+
+
+METHODS = [
+    ('executemany', bench_executemany),
+    ('jsonb_to_recordset', bench_jsonb),
+    ('COPY', bench_copy),
+    ('COPY + ON CONFLICT', bench_copy_staging),
+]
+
+
+async def main(uri, sizes):
+    pool = await db.Table.create_pool(uri, min_size=1, max_size=1)
+    async with pool.acquire() as con:
+        await con.execute('DROP TABLE IF EXISTS bench_ingest;')
+        await con.execute(BenchIngest.create_table())
+        try:
+            print(f'{"rows":>8}  {"method":<20} {"best":>9}  {"rows/s":>10}')
+            for size in sizes:
+                rows = make_rows(size)
+                for name, func in METHODS:
+                    best = float('inf')
+                    for _ in range(REPEAT):
+                        await con.execute('TRUNCATE bench_ingest;')
+                        start = time.perf_counter()
+                        await func(con, rows)
+                        best = min(best, time.perf_counter() - start)
+
+                    inserted = await con.fetchval('SELECT COUNT(*) FROM bench_ingest;')
+                    assert inserted == size, (name, inserted)
+                    print(f'{size:>8}  {name:<20} {best * 1000:>7.1f}ms  {size / best:>10,.0f}')
+                print()
+        finally:
+            await con.execute('DROP TABLE IF EXISTS bench_ingest;')
+    await pool.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=None)
+    parser.add_argument('sizes', nargs='*', type=int, default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    uri = args.uri
+    if uri is None:
+        import config
+        uri = config.postgresql
+
+    asyncio.run(main(uri, args.sizes))
@@ -0,0 +1,114 @@
+"""Benchmark for the jsonb codecs set up by ``Table.create_pool``.
+
+Encodes and decodes a batch shaped like the one a ``jsonb_to_recordset``
+bulk insert sends, command rows with a datetime in each, with:
+
+- the json module and the text format (``fast_json=False``)
+- orjson and the binary format (the default if orjson is installed)
+
+Only the codecs are timed unless a URI is given (or ``--db`` to use
+``config.postgresql``), in which case the batch also makes a round trip
+through ``SELECT $1::jsonb`` on a pool of each kind.
+
+Usage: python scripts/bench_jsonb.py [--uri URI | --db] [rows]
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.utils import db
+
+REPEAT = 5
+
+
+def make_rows(count):
+    now = datetime.datetime.utcnow()
+    commands = ['help', 'tag', 'tag create', 'remind', 'about', 'ping', 'jsk py']
+    return [
+        {
+            'guild': random.getrandbits(62),
+            'channel': random.getrandbits(62),
+            'author': random.getrandbits(62),
+            'used': now - datetime.timedelta(seconds=i),
+            'prefix': '?',
+            'command': random.choice(commands),
+            'failed': random.random() < 0.05,
+        }
+        for i in range(count)
+    ]
+
+
+def best_of(func, arg):
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def codecs():
+    yield 'json (text)', db._encode_jsonb, db._decode_jsonb
+    if db.orjson is not None:
+        yield 'orjson (binary)', db._encode_jsonb_binary, db._decode_jsonb_binary
+
+
+def bench_codecs(rows):
+    print(f'{"codec":<16} {"encode":>9} {"decode":>9} {"rows/s encode":>14} {"rows/s decode":>14} {"size":>10}')
+    decoded = []
+    for name, encode, decode in codecs():
+        encode_time, data = best_of(encode, rows)
+        decode_time, result = best_of(decode, data)
+        decoded.append(result)
+        count = len(rows)
+        print(f'{name:<16} {encode_time * 1000:>7.1f}ms {decode_time * 1000:>7.1f}ms '
+              f'{count / encode_time:>14,.0f} {count / decode_time:>14,.0f} {len(data) / 1024:>8.0f}KiB')
+
+    if db.orjson is None:
+        print('orjson is not installed, only the fallback was measured.')
+    # both must produce the same thing, datetimes included
+    assert all(result == decoded[0] for result in decoded), 'the codecs disagree'
+
+
+async def bench_round_trip(uri, rows):
+    print()
+    print(f'{"pool":<16} {"round trip":>11}')
+    for fast_json in (False, True):
+        if fast_json and db.orjson is None:
+            continue
+        pool = await db.Table.create_pool(uri, fast_json=fast_json, min_size=1, max_size=1)
+        async with pool.acquire() as con:
+            best = float('inf')
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                await con.fetchval('SELECT $1::jsonb;', rows)
+                best = min(best, time.perf_counter() - start)
+        await pool.close()
+        name = 'orjson (binary)' if fast_json else 'json (text)'
+        print(f'{name:<16} {best * 1000:>9.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=None)
+    parser.add_argument('--db', action='store_true', help='use config.postgresql')
+    parser.add_argument('rows', nargs='?', type=int, default=10_000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    bench_codecs(rows)
+
+    uri = args.uri
+    if uri is None and args.db:
+        import config
+        uri = config.postgresql
+
+    if uri is not None:
+        asyncio.run(bench_round_trip(uri, rows))
@@ -0,0 +1,106 @@
+"""Benchmark for ``RoboVJ.on_message`` on a synthetic message stream.
+
+Runs the same stream through the current ``on_message`` and through the
+previous pipeline, which parsed the context once in ``on_message`` and
+again in ``process_commands``. Nothing touches the network, the bot is
+never logged in.
+
+Needs a ``config.py`` like the bot itself.
+
+Usage: python scripts/bench_on_message.py [messages] [command ratio]
+"""
+
+import asyncio
+import datetime
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+from discord.ext import commands
+
+from bot import PrefixStore, RoboVJ, _prefix_callable
+from cogs.utils import context
+
+BOT_ID = 1000
+GUILDS = 200
+
+
+class BenchBot(commands.Bot):
+    on_message = RoboVJ.on_message
+    process_commands = RoboVJ.process_commands
+    get_prefix_matcher = RoboVJ.get_prefix_matcher
+    get_guild_prefixes = RoboVJ.get_guild_prefixes
+
+    def __init__(self):
+        super().__init__(command_prefix=_prefix_callable, intents=discord.Intents.none(), help_command=None)
+        self.pool = None
+        self.owner_id = 1
+        self._dm_matcher = None
+        self.blocklist = set()
+        self.spam_control = commands.CooldownMapping.from_cooldown(10**9, 1.0, commands.BucketType.user)
+        self._auto_spam_count = {}
+        self._connection.user = SimpleNamespace(id=BOT_ID)
+        self.prefixes = PrefixStore(self)
+        for guild_id in range(GUILDS):
+            self.prefixes.set(guild_id, ['?', '!'])
+
+        @self.command()
+        async def ping(ctx):
+            pass
+
+
+class LegacyBot(BenchBot):
+    async def on_message(self, message):
+        # the previous pipeline, get_context in here and once more in process_commands
+        ctx = await self.get_context(message, cls=context.Context)
+        if not ctx.valid:
+            self.dispatch('regular_message', message)
+        if message.author.bot:
+            return
+        await self.process_commands(message)
+
+
+def make_stream(total, command_ratio):
+    rng = random.Random(0)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    stream = []
+    for i in range(total):
+        guild = SimpleNamespace(id=rng.randrange(GUILDS))
+        author = SimpleNamespace(id=rng.randrange(10, 10_000), bot=rng.random() < 0.05)
+        if rng.random() < command_ratio:
+            content = f'{rng.choice("?!")}ping'
+        else:
+            content = ' '.join(rng.choice(('hello', 'there', 'lorem', 'ipsum', 'discord')) for _ in range(8))
+
+        stream.append(SimpleNamespace(
+            id=i, content=content, guild=guild, author=author,
+            channel=SimpleNamespace(id=guild.id), created_at=now, attachments=[], _state=None,
+        ))
+    return stream
+
+
+async def measure(bot, stream):
+    start = time.perf_counter()
+    for message in stream:
+        await bot.on_message(message)
+    return len(stream) / (time.perf_counter() - start)
+
+
+async def main(total, command_ratio):
+    stream = make_stream(total, command_ratio)
+    for name, cls in (('before', LegacyBot), ('after', BenchBot)):
+        bot = cls()
+        await measure(bot, stream[:1000])  # warm up
+        rate = await measure(bot, stream)
+        print(f'{name:<7} {rate:>10.0f} messages/s')
+
+
+if __name__ == '__main__':
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    asyncio.run(main(total, ratio))
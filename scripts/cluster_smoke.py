@@ -0,0 +1,124 @@
+"""Local smoke test for the cluster IPC, with fake clusters and fake shards.
+
+Starts an ``IPCServer`` and a handful of ``IPC`` clients in one process.
+Each fake cluster owns a slice of the fake shards, and through them a set
+of guilds. It checks the cross-cluster requests and broadcasts the bot
+relies on: guild counts, stats, blocklist and prefix changes.
+It also checks that a dead or slow cluster doesn't hang a request,
+and that the clusters survive the server restarting.
+
+No Discord or PostgreSQL connection is needed.
+
+Usage: python scripts/cluster_smoke.py [clusters] [shards]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.utils.ipc import IPC, IPCServer, cluster_shards
+
+GUILDS = 1000
+
+
+class FakeCluster:
+    def __init__(self, cluster_id, shard_ids, shard_count, path):
+        self.shard_ids = set(shard_ids)
+        # guild IDs whose shard, (id >> 22) % shard_count, is one of ours
+        self.guilds = {guild_id << 22 for guild_id in range(GUILDS) if guild_id % shard_count in self.shard_ids}
+        self.blocklist = set()
+        self.prefixes = {}
+        self.ipc = IPC(cluster_id, path, timeout=1.0)
+        self.ipc.add_handler('guild_count', self.guild_count)
+        self.ipc.add_handler('stats', self.stats)
+        self.ipc.add_handler('config_update', self.config_update)
+        self.ipc.add_handler('prefixes', self.update_prefixes)
+
+    async def guild_count(self, data):
+        return len(self.guilds)
+
+    async def stats(self, data):
+        return {'guilds': len(self.guilds), 'members': len(self.guilds) * 10}
+
+    async def config_update(self, data):
+        self.blocklist.add(data['key'])
+
+    async def update_prefixes(self, data):
+        if data['guild_id'] in self.guilds:
+            self.prefixes[data['guild_id']] = data['prefixes']
+
+
+async def main(clusters, shard_count):
+    path = os.path.join(tempfile.mkdtemp(), 'ipc.sock')
+    server = IPCServer(path, timeout=1.0)
+    await server.start()
+
+    fakes = [FakeCluster(index, shards, shard_count, path) for index, shards in enumerate(cluster_shards(shard_count, clusters))]
+    for fake in fakes:
+        await fake.ipc.connect()
+    await asyncio.sleep(0.1)
+
+    counts = await fakes[-1].ipc.request('guild_count')
+    assert sum(counts) == GUILDS, counts
+    print(f'guild counts per cluster: {counts}')
+
+    stats = await fakes[0].ipc.request('stats')
+    assert sum(s['members'] for s in stats) == GUILDS * 10, stats
+
+    await fakes[0].ipc.broadcast('config_update', {'name': 'blocklist', 'key': 1234, 'value': True})
+    guild_id = next(iter(fakes[-1].guilds))
+    await fakes[0].ipc.broadcast('prefixes', {'guild_id': guild_id, 'prefixes': ['$']})
+    await asyncio.sleep(0.1)
+    assert not fakes[0].blocklist
+    assert all(fake.blocklist == {1234} for fake in fakes[1:])
+    assert fakes[-1].prefixes == {guild_id: ['$']}
+    print('broadcasts delivered')
+
+    # a stuck cluster only costs the timeout, the rest still answer
+    async def stuck(data):
+        await asyncio.sleep(10)
+    fakes[1].ipc.add_handler('guild_count', stuck)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    counts = await fakes[0].ipc.request('guild_count')
+    assert len(counts) == clusters - 1, counts
+    print(f'request with a stuck cluster took {loop.time() - start:.2f}s')
+
+    # and a dead one doesn't even cost that
+    await fakes[-1].ipc.close()
+    await asyncio.sleep(0.1)
+    fakes[1].ipc.add_handler('guild_count', FakeCluster.guild_count.__get__(fakes[1]))
+    start = loop.time()
+    counts = await fakes[0].ipc.request('guild_count')
+    assert len(counts) == clusters - 1, counts
+    print(f'request with a dead cluster took {loop.time() - start:.3f}s')
+
+    # the server going away mustn't raise into the callers, and the clusters come back
+    survivors = fakes[:-1]
+    await server.close()
+    await asyncio.sleep(0.1)
+    await survivors[0].ipc.broadcast('config_update', {'name': 'blocklist', 'key': 5678, 'value': True})
+    counts = await survivors[0].ipc.request('guild_count')
+    assert counts == [len(survivors[0].guilds)], counts
+    print('lost server: broadcast dropped, request answered locally')
+
+    server = IPCServer(path, timeout=1.0)
+    await server.start()
+    await asyncio.sleep(2.5)
+    counts = await survivors[0].ipc.request('guild_count')
+    assert len(counts) == len(survivors), counts
+    print(f'reconnected {len(server.clients)} clusters')
+
+    for fake in fakes:
+        await fake.ipc.close()
+    await server.close()
+    print('ok')
+
+
+if __name__ == '__main__':
+    clusters = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    shards = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    asyncio.run(main(clusters, shards))
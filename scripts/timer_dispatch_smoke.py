@@ -0,0 +1,90 @@
+"""Local smoke test for the bound on timer listeners running at once.
+
+Fires a mass expiry of timers through ``Reminder._dispatch_timer`` on a
+bot that never logs in, with a cog whose ``on_<event>_timer_complete``
+listener is slow. It checks that no more than
+``Reminder.MAX_CONCURRENT_DISPATCH`` of them run at the same time,
+that every one of them still runs, and that ``wait_for`` on the event
+still resolves.
+
+No Discord or PostgreSQL connection is needed.
+
+Usage: python scripts/timer_dispatch_smoke.py [timers]
+"""
+
+import asyncio
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+from discord.ext import commands
+
+from cogs.reminder import Reminder, Timer
+from cogs.utils import timers
+
+
+class SlowListener(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.running = 0
+        self.most_running = 0
+        self.handled = 0
+
+    @timers.listener
+    async def on_smoke_timer_complete(self, timer):
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.running -= 1
+        self.handled += 1
+
+
+def make_reminder(bot):
+    # only the dispatch side, without the heap task and the database
+    reminder = Reminder.__new__(Reminder)
+    reminder.bot = bot
+    reminder._dispatch_semaphore = asyncio.Semaphore(Reminder.MAX_CONCURRENT_DISPATCH)
+    reminder._dispatching = set()
+    reminder._dispatch_latency = []
+    return reminder
+
+
+async def main(count):
+    async with commands.Bot(command_prefix='?', intents=discord.Intents.none()) as bot:
+        await run(bot, count)
+
+
+async def run(bot, count):
+    reminder = make_reminder(bot)
+    listener = SlowListener(bot)
+    await bot.add_cog(reminder)
+    await bot.add_cog(listener)
+
+    now = datetime.datetime.utcnow()
+    waiter = asyncio.ensure_future(bot.wait_for('smoke_timer_complete', timeout=1.0))
+    await asyncio.sleep(0)
+    for _ in range(count):
+        reminder._dispatch_timer(Timer.temporary(event='smoke', args=(), kwargs={}, expires=now, created=now))
+
+    assert isinstance(await waiter, Timer)
+    for _ in range(count * 10):
+        if listener.handled == count:
+            break
+        await asyncio.sleep(0.01)
+
+    bound = Reminder.MAX_CONCURRENT_DISPATCH
+    print(f'{listener.handled}/{count} handled, at most {listener.most_running} at once (bound {bound})')
+    assert listener.handled == count, listener.handled
+    assert listener.most_running == min(bound, count), listener.most_running
+    assert not reminder._dispatching, reminder._dispatching
+    print('ok')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    asyncio.run(main(count))